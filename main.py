@@ -19,13 +19,34 @@ def main_cli():
     from ytp_generator import processor
 
     parser = argparse.ArgumentParser(description="YTP Deluxe Generator CLI")
-    parser.add_argument("-i", "--input", required=True, help="Input video file")
-    parser.add_argument("-o", "--output", required=True, help="Output video file")
+    parser.add_argument("-i", "--input", help="Input video file")
+    parser.add_argument("-o", "--output", help="Output video file ('-': fragmented MP4 on stdout)")
     parser.add_argument("-c", "--config", help="Path to JSON config")
     parser.add_argument("--dry-run", action="store_true", help="Print ffmpeg commands without running")
+    parser.add_argument("--mode", choices=processor.EXECUTION_MODES, help="Execution mode (default: config execution_mode or 'stages')")
+    parser.add_argument("--seed", type=int, help="Seed for all random choices (printed on every run)")
+    parser.add_argument("--preview", action="store_true", help="Render on a low-resolution proxy and save the plan as <output>.plan.json")
+    parser.add_argument("--plan", help="Render a plan saved by --preview (same choices, full quality)")
+    parser.add_argument("--progressive", choices=("fmp4", "ts"), help="Write the last stage straight to the output as fragmented MP4 or MPEG-TS, readable while it renders")
+    parser.add_argument("--profile", action="store_true", help="Record per-stage timings and resources; writes <output>.profile.json and <output>.trace.json")
+    parser.add_argument("--stage-cache", choices=("info", "prune", "clear"), help="Show, prune (to --max-mb or the configured limit) or clear the stage cache")
+    parser.add_argument("--max-mb", type=float, help="Stage cache: size to prune down to")
+    parser.add_argument("--overlay-cache", choices=("build", "info", "clear"), help="Convert the overlay assets for common output sizes ahead of time, show or clear the cache")
+    parser.add_argument("--sound-bank", choices=("build", "info", "clear"), help="Pre-decode the overlay sounds into the sound bank, show or clear it")
+    parser.add_argument("--variants", type=int, metavar="K", help="Render K random versions of the input as <output>_01.mp4 ... sharing common stages; writes <output>.variants.json")
+    parser.add_argument("--serve", action="store_true", help="Run as a render service: watch --watch / --queue-dir for jobs until SIGINT/SIGTERM")
+    parser.add_argument("--watch", help="Service: folder whose new media files are rendered")
+    parser.add_argument("--queue-dir", help="Service: folder of JSON job files ({input, output, config})")
+    parser.add_argument("--status", help="Service: status endpoint, 'host:port' / 'port' (HTTP) or 'unix:/path.sock'")
+    parser.add_argument("--batch", metavar="MANIFEST_OR_GLOB", help="Render many inputs: a JSON manifest or a glob such as 'in/*.mp4'")
+    parser.add_argument("--out-dir", help="Batch/service: output directory for inputs without an explicit output")
+    parser.add_argument("--jobs", type=int, help="Batch/service: number of concurrent jobs; variants: stages rendered at once (default: derived from CPU count)")
+    parser.add_argument("--threads", type=int, help="ffmpeg threads per job (batch default: CPU count / jobs)")
     args = parser.parse_args()
 
-    if not os.path.isfile(args.input):
+    if not args.batch and not args.serve and not args.stage_cache and not args.sound_bank and not args.overlay_cache and (not args.input or not args.output):
+        parser.error("-i/--input and -o/--output are required unless --batch or --serve is given")
+    if args.input and not os.path.isfile(args.input):
         print("Input file not found:", args.input, file=sys.stderr)
         sys.exit(2)
     cfg_data = cfg.default_config()
@@ -36,9 +57,111 @@ def main_cli():
         except Exception as e:
             print("Failed to load config:", e, file=sys.stderr)
             sys.exit(2)
+    if args.mode:
+        cfg_data["execution_mode"] = args.mode
+    if args.stage_cache:
+        from ytp_generator import stage_cache
+        cache = stage_cache.get_cache(cfg_data)
+        if args.stage_cache == "prune":
+            removed, freed = cache.prune(int(args.max_mb * 1024 * 1024) if args.max_mb is not None else None)
+            print(f"Removed {removed} entries ({freed / 1048576:.1f} MB)")
+        elif args.stage_cache == "clear":
+            removed, freed = cache.clear()
+            print(f"Removed {removed} entries ({freed / 1048576:.1f} MB)")
+        print(stage_cache.format_entries(cache))
+        sys.exit(0)
+    if args.sound_bank:
+        from ytp_generator import sound_bank
+        bank = sound_bank.get_bank(cfg_data)
+        if args.sound_bank == "build":
+            print(f"Decoded {bank.prepare(cfg_data)} sounds")
+        elif args.sound_bank == "clear":
+            removed, freed = bank.clear()
+            print(f"Removed {removed} entries ({freed / 1048576:.1f} MB)")
+        print(f"{len(bank.entries())} sounds, {bank.total_bytes() / 1048576:.1f} MB in {bank.dir}")
+        sys.exit(0)
+    if args.overlay_cache:
+        from ytp_generator import effects, overlay_cache
+        cache = overlay_cache.get_cache(cfg_data)
+        if args.overlay_cache == "build":
+            print(f"Prepared {effects.prepare_overlays(cfg_data)} overlay copies")
+        elif args.overlay_cache == "clear":
+            removed, freed = cache.clear()
+            print(f"Removed {removed} entries ({freed / 1048576:.1f} MB)")
+        print(f"{len(cache.entries())} overlays, {cache.total_bytes() / 1048576:.1f} MB in {cache.dir}")
+        sys.exit(0)
+    if args.serve:
+        import asyncio
+        from ytp_generator import service
+        if not args.watch and not args.queue_dir and not args.status:
+            parser.error("--serve needs --watch, --queue-dir and/or --status")
+        svc = service.RenderService(cfg_data, watch_dir=args.watch, queue_dir=args.queue_dir, out_dir=args.out_dir,
+                                    workers=args.jobs, threads=args.threads, status_address=args.status,
+                                    log=lambda msg: print(msg, flush=True))
+        try:
+            asyncio.run(svc.run())
+        except KeyboardInterrupt:
+            print("\nCancelled.", file=sys.stderr)
+            sys.exit(130)
+        sys.exit(0)
+    if args.batch:
+        from ytp_generator import batch
+        jobs = batch.load_jobs(args.batch, output_dir=args.out_dir)
+        if not jobs:
+            print("No inputs matched:", args.batch, file=sys.stderr)
+            sys.exit(2)
+        def on_done(done, total, result):
+            print(f"[{done}/{total}] {'OK' if result['ok'] else 'FAIL'} {result['input']}", flush=True)
+        report = batch.run_batch(jobs, cfg_data, workers=args.jobs, threads=args.threads, progress_callback=on_done,
+                                 dry_run=args.dry_run)
+        print(batch.format_report(report))
+        sys.exit(1 if report["failed"] else 0)
+    if args.threads:
+        cfg_data["threads"] = args.threads
+    if args.output == "-" and (args.variants or args.preview or args.profile):
+        print("--variants, --preview and --profile need an output file", file=sys.stderr)
+        sys.exit(2)
+    # with the video on stdout, messages go to stderr
+    log = sys.stderr if args.output == "-" else sys.stdout
+    live = log.isatty()
+    def progress(stage, total, msg):
+        print(("\r\033[K" if live else "") + f"[{stage}/{total}] {msg}", file=log, flush=True)
+    def ffmpeg_progress(stage, total, event):
+        # one self-updating status line per stage on terminals
+        if live and not event["done"] and event["out_time"] is not None:
+            speed = f" {event['speed']:.2f}x" if event["speed"] else ""
+            print(f"\r\033[K[{stage}/{total}] {event['out_time']:.1f}s frame {event['frame'] or 0}{speed}", end="", file=log, flush=True)
     try:
-        processor.process_video(args.input, args.output, cfg_data, dry_run=args.dry_run)
-        print("Done.")
+        profile = None
+        if args.profile:
+            from ytp_generator import profiling
+            profile = profiling.Profile(os.path.basename(args.input))
+        if args.variants:
+            from ytp_generator import variants
+            manifest = variants.render_variants(args.input, args.output, cfg_data, args.variants, seed=args.seed,
+                                                jobs=args.jobs, dry_run=args.dry_run, progress_callback=progress)
+            print(f"Rendered {manifest['rendered_stages']} of {manifest['stages']} stages (shared prefixes rendered once)")
+            if not args.dry_run:
+                print(f"Manifest: {variants.manifest_path_for(args.output)}")
+            print("Done.")
+            return
+        plan = None
+        if args.plan:
+            from ytp_generator import preview
+            plan = preview.load_plan(args.plan)
+        processor.process_video(args.input, args.output, cfg_data, dry_run=args.dry_run, progress_callback=progress,
+                                seed=args.seed, plan=plan, preview=args.preview, on_progress=ffmpeg_progress, profile=profile,
+                                progressive=args.progressive)
+        if profile:
+            stem = os.path.splitext(args.output)[0]
+            profile.write_json(stem + ".profile.json")
+            profile.write_trace(stem + ".trace.json")
+            print(profiling.format_report(profile.report()))
+            print(f"Profile: {stem}.profile.json, trace: {stem}.trace.json")
+        print("Done.", file=log)
+    except KeyboardInterrupt:
+        print("\nCancelled.", file=sys.stderr)
+        sys.exit(130)
     except Exception as e:
         print("Error during processing:", e, file=sys.stderr)
         sys.exit(1)
@@ -0,0 +1,42 @@
+import os
+import stat
+
+import pytest
+
+# A stand-in ffmpeg: logs its arguments, answers -version and writes its last argument
+FAKE_FFMPEG = """#!/bin/sh
+echo "$@" >> "$(dirname "$0")/calls.log"
+if [ "$1" = "-version" ]; then echo "ffmpeg version fake"; exit 0; fi
+for a; do last=$a; done
+if [ "$last" != "pipe:1" ]; then echo "$@" > "$last"; fi
+"""
+
+@pytest.fixture
+def fake_ffmpeg(tmp_path):
+    """Path of a fake ffmpeg; its calls are logged to calls.log next to it."""
+    if os.name == "nt":
+        pytest.skip("needs a POSIX shell")
+    bin_dir = tmp_path / "bin"
+    bin_dir.mkdir()
+    path = bin_dir / "ffmpeg"
+    path.write_text(FAKE_FFMPEG)
+    path.chmod(path.stat().st_mode | stat.S_IEXEC)
+    return str(path)
+
+@pytest.fixture
+def ffmpeg_calls(fake_ffmpeg):
+    """Function returning the argument lists fake_ffmpeg was called with (without -version)."""
+    log = os.path.join(os.path.dirname(fake_ffmpeg), "calls.log")
+
+    def read():
+        if not os.path.exists(log):
+            return []
+        with open(log) as f:
+            return [line.split() for line in f if not line.startswith("-version")]
+    return read
+
+@pytest.fixture
+def source(tmp_path):
+    path = tmp_path / "in.mp4"
+    path.write_bytes(b"source")
+    return str(path)
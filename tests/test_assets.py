@@ -0,0 +1,17 @@
+from ytp_generator import assets, probe
+
+def test_list_assets_returns_the_usable_indexed_files(tmp_path, monkeypatch):
+    base = tmp_path / "assets"
+    assets.ensure_asset_dirs(str(base))
+    (base / "sounds" / "boom.wav").write_bytes(b"wav")
+    (base / "sounds" / "notes.txt").write_text("not media")
+    (base / "sounds" / "silent.mp4").write_bytes(b"mp4")
+
+    def fake_probe(path, config):
+        silent = path.endswith("silent.mp4")
+        return {"has_video": silent, "has_audio": not silent, "video_codec": "h264" if silent else None,
+                "duration": 1.0, "width": 0, "height": 0}
+    monkeypatch.setattr(probe, "probe_media", fake_probe)
+    found = assets.list_assets(str(base), {"cache_dir": str(tmp_path / "cache")})
+    assert found["sounds"] == [str(base / "sounds" / "boom.wav")]
+    assert set(found) == set(assets.ASSET_DIRS)
@@ -0,0 +1,48 @@
+import io
+
+import numpy as np
+import pytest
+
+from ytp_generator import audio_engine
+
+def _render(ops, signal, sample_rate, block_frames):
+    chain = audio_engine.build_chain(ops, sample_rate, signal.shape[1])
+    out = io.BytesIO()
+    frames = audio_engine.process_stream(io.BytesIO(signal.tobytes()), out, chain, signal.shape[1], block_frames)
+    assert frames == len(signal)
+    return np.frombuffer(out.getvalue(), dtype=np.float32).reshape(-1, signal.shape[1])
+
+@pytest.mark.parametrize("sample_rate", [44100, 22050])
+def test_output_does_not_depend_on_the_block_size(tmp_path, sample_rate):
+    rng = np.random.default_rng(1)
+    signal = (rng.standard_normal((20000, 2)) * 0.1).astype(np.float32)
+    boom = tmp_path / "boom.f32"
+    (rng.standard_normal((5000, 2)) * 0.5).astype(np.float32).tofile(boom)
+    ops = [
+        {"op": "gain", "db": 6},
+        {"op": "echo", "in_gain": 0.8, "out_gain": 0.9, "delays": [20, 45], "decays": [0.5, 0.3]},
+        {"op": "mix", "sounds": [{"pcm": str(boom), "gain": 0.5, "offset": 0.1}]},
+        {"op": "resample", "ratio": 1.3},
+    ]
+    reference = _render(ops, signal, sample_rate, 1 << 16)
+    assert len(reference) == pytest.approx(len(signal) / 1.3, abs=2)
+    for block_frames in (333, 4096):
+        assert np.allclose(_render(ops, signal, sample_rate, block_frames), reference, atol=1e-6)
+
+def test_echo_matches_a_direct_computation():
+    signal = np.zeros((100, 1), dtype=np.float32)
+    signal[0] = 1.0
+    out = _render([{"op": "echo", "in_gain": 1.0, "out_gain": 0.5, "delays": [1], "decays": [0.25]}], signal, 1000, 7)
+    assert out[0, 0] == 0.5 and out[1, 0] == 0.125 and not out[2:].any()
+
+def test_unknown_ops_are_rejected():
+    with pytest.raises(ValueError):
+        audio_engine.build_chain([{"op": "flanger"}], 44100, 2)
+
+def test_runs_of_audio_only_effects_share_one_unit():
+    from ytp_generator import processor
+    rolled = [{"name": n, "resolved": True} for n in ("chorus", "earrape", "mirror", "vibrato")]
+    units = processor.build_units(rolled, {}, "stages")
+    assert [(u[0], u[1] if u[0] == "audio" else u[1]["name"]) for u in units] == [
+        ("audio", ["chorus", "earrape"]), ("single", "mirror"), ("audio", ["vibrato"])]
+    assert [u[0] for u in processor.build_units(rolled, {"audio_engine": False}, "stages")] == ["single"] * 4
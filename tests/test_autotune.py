@@ -0,0 +1,44 @@
+import io
+
+import numpy as np
+import pytest
+
+from ytp_generator import audio_engine, autotune
+
+def _sine(freq, seconds, sample_rate=16000):
+    t = np.arange(int(seconds * sample_rate)) / sample_rate
+    return (0.5 * np.sin(2 * np.pi * freq * t)).astype(np.float32)
+
+def test_detect_pitch_finds_the_fundamental_and_silence():
+    frames = np.stack([_sine(f, 0.05)[:800] for f in (110.0, 220.0, 440.0)] + [np.zeros(800, dtype=np.float32)])
+    freqs = autotune.detect_pitch(frames.astype(np.float64), 16000)
+    assert np.allclose(freqs[:3], [110.0, 220.0, 440.0], rtol=0.01) and freqs[3] == 0.0
+
+def test_snap_to_scale_picks_the_nearest_scale_note():
+    c_major = autotune.scale_notes("C", "major")
+    assert list(autotune.snap_to_scale(np.array([61.4, 63.0, 66.2, 70.9]), c_major)) == [62.0, 62.0, 67.0, 71.0]
+    assert list(autotune.scale_notes("A", "minor")) == [0, 2, 4, 5, 7, 9, 11]
+    assert list(autotune.snap_to_scale(np.array([65.2]), autotune.scale_notes("D", "pentatonic"))) == [66.0]
+
+def _run(ops, signal, block_frames):
+    chain = audio_engine.build_chain(ops, 16000, 1)
+    out = io.BytesIO()
+    audio_engine.process_stream(io.BytesIO(signal.tobytes()), out, chain, 1, block_frames)
+    return np.frombuffer(out.getvalue(), dtype=np.float32)
+
+@pytest.mark.parametrize("mode", ["scale", "random"])
+def test_output_is_aligned_and_independent_of_the_block_size(mode):
+    signal = np.concatenate([_sine(233.0, 0.5), _sine(311.0, 0.5)])[:, None]
+    ops = [{"op": "autotune", "mode": mode, "key": "C", "scale": "major", "seed": 3}]
+    reference = _run(ops, signal, 1 << 16)
+    assert len(reference) == len(signal)
+    for block_frames in (257, 4000):
+        assert np.allclose(_run(ops, signal, block_frames), reference, atol=1e-5)
+
+def test_scale_mode_moves_an_off_key_tone_onto_the_scale():
+    # 233 Hz (A#3) lies between A3 and B3 of C major
+    out = _run([{"op": "autotune", "mode": "scale", "key": "C", "scale": "major"}], _sine(233.0, 1.0)[:, None], 4096)
+    frames = np.lib.stride_tricks.sliding_window_view(out[8000:12000], 1024)[::512].astype(np.float64)
+    freqs = autotune.detect_pitch(frames, 16000)
+    midi = 69.0 + 12.0 * np.log2(np.median(freqs[freqs > 0]) / 440.0)
+    assert abs(midi - 57.0) < 0.3 or abs(midi - 59.0) < 0.3
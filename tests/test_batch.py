@@ -0,0 +1,34 @@
+import json
+
+from ytp_generator import batch
+
+def test_plan_workers_stays_within_cpu_count():
+    assert batch.plan_workers(cpu_count=16) == (4, 4)
+    assert batch.plan_workers(workers=3, cpu_count=16) == (3, 5)
+    assert batch.plan_workers(threads=8, cpu_count=16) == (2, 8)
+    assert batch.plan_workers(workers=2, threads=2, cpu_count=16) == (2, 2)
+    assert batch.plan_workers(cpu_count=1) == (1, 1)
+
+def test_load_jobs_resolves_manifest_paths(tmp_path):
+    (tmp_path / "fast.json").write_text(json.dumps({"execution_mode": "fused"}))
+    manifest = tmp_path / "jobs.json"
+    manifest.write_text(json.dumps([{"input": "a.mp4"}, {"input": "b.mp4", "output": "out/b.mp4", "config": "fast.json"}]))
+    a, b = batch.load_jobs(str(manifest), output_dir=str(tmp_path / "renders"))
+    assert a == {"input": str(tmp_path / "a.mp4"), "output": str(tmp_path / "renders" / "a_ytp.mp4"), "config": None}
+    assert b["output"] == str(tmp_path / "out" / "b.mp4")
+    assert b["config"] == {"execution_mode": "fused"}
+
+def test_merged_config_keeps_batch_settings():
+    base = {"ffmpeg_path": "/opt/ffmpeg", "execution_mode": "streamed", "seed": 1}
+    merged = batch.merged_config({"config": {"seed": 7}}, base, threads=2)
+    assert merged == {"ffmpeg_path": "/opt/ffmpeg", "execution_mode": "streamed", "seed": 7, "threads": 2}
+    assert batch.merged_config({"config": None}, base) == base
+
+def test_dry_run_renders_nothing(tmp_path, fake_ffmpeg, ffmpeg_calls, source):
+    config = {"ffmpeg_path": fake_ffmpeg, "cache_dir": str(tmp_path / "cache"), "assets_dir": str(tmp_path / "assets"),
+              "effect_chain": [{"name": "invert_colors", "probability": 1}]}
+    result = batch._run_job({"input": source, "output": str(tmp_path / "out" / "x.mp4")}, config, 1, dry_run=True)
+    assert result["ok"]
+    assert any(msg.startswith("DRY RUN") for msg in result["messages"])
+    assert ffmpeg_calls() == []
+    assert not (tmp_path / "out").exists()
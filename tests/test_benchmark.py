@@ -0,0 +1,29 @@
+from ytp_generator import benchmark
+
+def _doc(**results):
+    return {"results": [dict(case=case, **r) for case, r in results.items()]}
+
+def test_compare_flags_slowdowns_growth_and_new_failures():
+    baseline = _doc(a={"latency": 1.0, "max_rss": 100}, b={"latency": 1.0, "max_rss": 100},
+                    c={"latency": 1.0}, d={"error": "broken"})
+    current = _doc(a={"latency": 1.1, "max_rss": 130}, b={"latency": 2.0, "max_rss": None},
+                   c={"error": "RuntimeError: boom"}, d={"error": "broken"}, e={"latency": 9.0})
+    regressions = benchmark.compare(current, baseline, tolerance=0.15)
+    assert [(g["case"], g["metric"]) for g in regressions] == [("a", "max_rss"), ("b", "latency"), ("c", "error")]
+    text = benchmark.format_regressions(regressions)
+    assert "REGRESSION b: latency 1 -> 2 (+100%)" in text and "c: now fails" in text
+
+def test_run_times_each_case_on_synthetic_inputs(tmp_path, fake_ffmpeg, ffmpeg_calls):
+    doc = benchmark.run(str(tmp_path / "bench"), fake_ffmpeg, sizes=[(64, 48)], durations=[1.0],
+                        effects=["mirror"], repeats=2)
+    mirror = doc["results"][0]
+    assert mirror["case"] == "mirror@64x48x1s" and mirror["runs"] == 2 and mirror["stages"] == ["mirror"]
+    assert mirror["latency"] > 0 and doc["results"][-1]["name"] == "default_chain"
+    assert (tmp_path / "bench" / "inputs" / "testsrc2_64x48_1s.mp4").is_file()
+    # inputs and assets are generated once and reused by the next run
+    generated = len(ffmpeg_calls())
+    benchmark.prepare(str(tmp_path / "bench"), fake_ffmpeg, sizes=[(64, 48)], durations=[1.0])
+    assert len(ffmpeg_calls()) == generated
+    path = str(tmp_path / "bench.json")
+    benchmark.save(doc, path)
+    assert benchmark.load(path)["results"] == doc["results"]
@@ -0,0 +1,39 @@
+from ytp_generator import chunked_render, effects, processor
+
+def _units(rolled, kind):
+    return [(u[0], u[1] if u[0] != "single" else u[1]["name"]) for u in processor.fuse_chain(rolled, {}, kind=kind)]
+
+def _rolled(*names):
+    extra = {"speed_change": {"factor": 2.0}, "frame_shuffle": {"seed": 1}}
+    return [dict({"name": n, "resolved": True}, **extra.get(n, {})) for n in names]
+
+def test_plan_chunks_starts_on_keyframes_near_an_even_split():
+    keyframes = [0.0, 2.0, 4.0, 6.0, 8.0, 10.0, 12.0]
+    assert chunked_render.plan_chunks(keyframes, 13.0, 4) == [0.0, 4.0, 6.0, 10.0]
+    # pieces stay at least min_length long
+    assert chunked_render.plan_chunks(keyframes, 13.0, 4, min_length=5.0) == [0.0, 6.0]
+    assert chunked_render.plan_chunks([0.0], 13.0, 4) == [0.0]
+
+def test_parallel_units_hold_runs_of_per_frame_effects():
+    rolled = _rolled("mirror", "invert_colors", "speed_change", "earrape", "mirror", "frame_shuffle")
+    assert _units(rolled, "fused") == [("fused", ["mirror", "invert_colors", "speed_change", "earrape", "mirror"]),
+                                       ("single", "frame_shuffle")]
+    assert _units(rolled, "streamed")[0][0] == "streamed"
+    assert _units(rolled, "parallel") == [("parallel", ["mirror", "invert_colors"]), ("fused", ["speed_change"]),
+                                          ("parallel", ["earrape", "mirror"]), ("single", "frame_shuffle")]
+    # an audio-only per-frame run stays in the fused graph next to it
+    assert _units(_rolled("speed_change", "earrape"), "parallel") == [("fused", ["speed_change", "earrape"])]
+
+def test_parallel_command_falls_back_to_one_graph_for_short_clips(monkeypatch):
+    info = {"duration": 3.0, "has_video": True}
+    monkeypatch.setattr(effects.probe, "probe_media", lambda path, config: info)
+    monkeypatch.setattr(effects.probe, "keyframe_times", lambda path, config: [0.0, 1.0, 2.0])
+    fragments = [{"vf": "hflip"}]
+    config = {"parallel_workers": 2}
+    assert effects.build_parallel_command("ffmpeg", "in.mp4", "out.mp4", fragments, config)[-1] == "out.mp4"
+    info["duration"] = 60.0
+    monkeypatch.setattr(effects.probe, "keyframe_times", lambda path, config: [float(t) for t in range(0, 60, 2)])
+    cmd = effects.build_parallel_command("ffmpeg", "in.mp4", "out.mp4", fragments, config)
+    assert cmd[1:3] == ["-m", "ytp_generator.chunked_render"]
+    assert cmd[cmd.index("--starts") + 1] == "0.000000,14.000000,30.000000,44.000000"
+    assert str(cmd[cmd.index("--workers") + 1]) == "2"
@@ -0,0 +1,27 @@
+from concurrent.futures import ThreadPoolExecutor
+
+import pytest
+
+from ytp_generator import chunked_reverse
+
+def test_plan_chunks_covers_the_clip_on_frame_boundaries():
+    assert chunked_reverse.plan_chunks(25.0, 10.0) == [(0.0, 10.0), (10.0, 10.0), (20.0, None)]
+    assert chunked_reverse.plan_chunks(20.0005, 10.0) == [(0.0, 10.0), (10.0, None)]
+    # 10 s at 29.97 fps is 299.7 frames: chunks are 300 frames long
+    (_, length), (start, rest) = chunked_reverse.plan_chunks(15.0, 10.0, 29.97)
+    assert length == 300 / 29.97 and start == round(length, 6) and rest is None
+
+@pytest.mark.parametrize("workers, threads, expected", [
+    (None, None, chunked_reverse.DEFAULT_WORKERS), (None, 2, 2), (None, 16, chunked_reverse.DEFAULT_WORKERS), (8, None, 6),
+])
+def test_default_workers_stay_small(tmp_path, monkeypatch, workers, threads, expected):
+    pools = []
+
+    class Pool(ThreadPoolExecutor):
+        def __init__(self, max_workers):
+            pools.append(max_workers)
+            super().__init__(max_workers)
+    monkeypatch.setattr(chunked_reverse, "ThreadPoolExecutor", Pool)
+    monkeypatch.setattr(chunked_reverse.subprocess, "run", lambda cmd, check: None)
+    chunked_reverse.run("ffmpeg", "in.mp4", str(tmp_path / "out.mp4"), 55.0, workers=workers, threads=threads)
+    assert pools == [expected]
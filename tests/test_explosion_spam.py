@@ -0,0 +1,29 @@
+import random
+import re
+
+from ytp_generator import effects, ffmpeg_cmds
+
+def test_each_overlay_is_decoded_once_and_split_per_instance():
+    instances = [{"video": 0, "start": 1.0, "x": 0.5, "y": 0.2}, {"video": 1, "start": 2.0, "x": 0.0, "y": 1.0},
+                 {"video": 0, "start": 3.0, "x": 1.0, "y": 0.0}]
+    frag = ffmpeg_cmds.explosion_spam_filters(["a.mov", "b.mov"], instances)
+    assert frag["inputs"] == [["-i", "a.mov"], ["-i", "b.mov"]]
+    assert "[{0}:v]split=2" in frag["vf"] and "[{1}:v]null" in frag["vf"]
+    assert re.findall(r"\+([\d.]+)/TB", frag["vf"]) == ["1.000000", "2.000000", "3.000000"]
+    assert frag["vf"].count("overlay=") == 3 and "x='(W-w)*0.5000':y='(H-h)*0.2000'" in frag["vf"]
+
+class FakeIndex:
+    def sample(self, categories, k=1, rng=None):
+        return ["a.mov", "b.mov", "c.mov"][:k]
+
+def test_picked_instances_only_reference_used_videos(monkeypatch):
+    monkeypatch.setattr(effects.assets, "get_index", lambda config: FakeIndex())
+    for seed in range(20):
+        videos, instances = effects._pick_explosions({"max_videos": 3, "max_repeats": 4}, 10.0, {}, random.Random(seed))
+        assert 2 <= len(instances) <= 4
+        assert sorted({i["video"] for i in instances}) == list(range(len(videos)))
+        assert all(0.0 <= i["start"] <= 9.5 and 0.0 <= i["x"] <= 1.0 for i in instances)
+
+def test_plans_from_before_instances_still_render():
+    assert effects._explosions({"video": "a.mov"}) == (["a.mov"], [{"video": 0, "start": 0.0, "x": 0.0, "y": 0.0}])
+    assert effects._explosions({}) == ([], [])
@@ -0,0 +1,18 @@
+from ytp_generator import ffmpeg_cmds
+
+def test_with_threads_limits_every_input_and_output():
+    cmd = ["ffmpeg", "-y", "-loglevel", "warning", "-ss", "1.0", "-i", "a.mp4", "-i", "b.mp4",
+           "-map", "0:v:0?", "-c:v", "libx264", "-an", "one.ts", "-map", "1:a:0?", "-c:a", "aac", "two.ts"]
+    assert ffmpeg_cmds.with_threads(cmd, 2) == [
+        "ffmpeg", "-filter_threads", "2", "-filter_complex_threads", "2", "-y", "-loglevel", "warning",
+        "-ss", "1.0", "-threads", "2", "-i", "a.mp4", "-threads", "2", "-i", "b.mp4",
+        "-map", "0:v:0?", "-c:v", "libx264", "-an", "-threads", "2", "one.ts",
+        "-map", "1:a:0?", "-c:a", "aac", "-threads", "2", "two.ts"]
+
+def test_with_threads_keeps_option_values_and_tool_commands():
+    cmd = ["ffmpeg", "-progress", "pipe:1", "-nostats", "-i", "in.mp4", "-f", "mpegts", "-"]
+    assert ffmpeg_cmds.with_threads(cmd, 3)[5:] == ["-progress", "pipe:1", "-nostats", "-threads", "3", "-i", "in.mp4",
+                                                    "-f", "mpegts", "-threads", "3", "-"]
+    assert ffmpeg_cmds.with_threads(cmd, None) is cmd
+    tool = ["python", "-m", "ytp_generator.chunked_reverse", "--output", "out.mp4"]
+    assert ffmpeg_cmds.with_threads(tool, 4) == tool + ["--threads", "4"]
@@ -0,0 +1,11 @@
+from ytp_generator import ffmpeg_cmds
+
+def test_raw_encode_pads_odd_sizes_for_yuv420p():
+    cmd = ffmpeg_cmds.build_raw_encode_cmd("ffmpeg", "in.mp4", "out.mp4", 641, 359, 25.0, pix_fmt="rgb24")
+    assert cmd[cmd.index("-s") + 1] == "641x359"
+    assert cmd[cmd.index("-vf") + 1] == "pad=ceil(iw/2)*2:ceil(ih/2)*2"
+    assert cmd[cmd.index("-pix_fmt", cmd.index("-vf")) + 1] == "yuv420p"
+
+def test_raw_encode_keeps_even_sizes():
+    cmd = ffmpeg_cmds.build_raw_encode_cmd("ffmpeg", "in.mp4", "out.mp4", 640, 360, 25.0)
+    assert "-vf" not in cmd
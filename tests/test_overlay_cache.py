@@ -0,0 +1,22 @@
+import os
+
+from ytp_generator import overlay_cache
+
+def test_prepared_copies_are_made_once_per_size_and_source_version(tmp_path, fake_ffmpeg, ffmpeg_calls):
+    source = tmp_path / "boom.mov"
+    source.write_bytes(b"mov")
+    cache = overlay_cache.OverlayCache(str(tmp_path / "cache"), fake_ffmpeg)
+    small = cache.prepared(str(source), 96, "yuva420p")
+    assert cache.prepared(str(source), 96, "yuva420p") == small
+    large = cache.prepared(str(source), 288, "yuva444p")
+    assert len(ffmpeg_calls()) == 2 and cache.entries() == sorted([small, large])
+    st = os.stat(source)
+    os.utime(source, ns=(st.st_atime_ns, st.st_mtime_ns + 1_000_000_000))
+    fresh = cache.prepared(str(source), 96, "yuva420p")
+    # copies of the older version are dropped
+    assert fresh != small and cache.entries() == [fresh]
+
+def test_sizes_and_formats_follow_the_clip():
+    assert overlay_cache.even(0.4 * 721) == 288 and overlay_cache.even(0.3) == 2
+    assert overlay_cache.overlay_pix_fmt("yuvj422p") == "yuva422p"
+    assert overlay_cache.overlay_pix_fmt("nv12") == "yuva420p"
@@ -0,0 +1,50 @@
+import os
+
+import pytest
+
+from ytp_generator import config as cfg, preview, processor
+
+def test_proxy_renders_to_a_part_file_per_call(tmp_path, source):
+    config = {"cache_dir": str(tmp_path / "cache"), "ffmpeg_path": "ffmpeg"}
+    path, part, cmd = preview.proxy_cmd(source, config)
+    _, other_part, _ = preview.proxy_cmd(source, config)
+    assert part != other_part and cmd[-1] == part and part.startswith(path)
+    assert preview.proxy_path(source, dict(config, preview_height=360)) != path
+
+def test_install_proxy_replaces_older_proxies_of_the_source(tmp_path, source):
+    config = {"cache_dir": str(tmp_path / "cache")}
+    old, part, _ = preview.proxy_cmd(source, dict(config, preview_fps=6))
+    path, part, _ = preview.proxy_cmd(source, config)
+    open(old, "w").close()
+    # a concurrent preview installed the same proxy already
+    open(path, "w").close()
+    with open(part, "w") as f:
+        f.write("proxy")
+    preview.install_proxy(source, path, part)
+    assert os.listdir(os.path.dirname(path)) == [os.path.basename(path)]
+    with open(path) as f:
+        assert f.read() == "proxy"
+    assert preview.proxy_cmd(source, config) == (path, None, None)
+
+def test_plans_round_trip_and_reject_other_files(tmp_path):
+    path = str(tmp_path / "out.plan.json")
+    preview.save_plan({"seed": 7, "effects": [{"name": "mirror"}]}, path)
+    assert preview.load_plan(path)["effects"] == [{"name": "mirror"}]
+    with open(path, "w") as f:
+        f.write('{"effects": []}')
+    with pytest.raises(ValueError):
+        preview.load_plan(path)
+
+def test_preview_plan_replays_as_the_full_render(tmp_path, fake_ffmpeg, ffmpeg_calls, source):
+    config = cfg.default_config()
+    config.update(ffmpeg_path=fake_ffmpeg, cache_dir=str(tmp_path / "cache"), assets_dir=str(tmp_path / "assets"),
+                  effect_chain=[{"name": n, "probability": 1} for n in ("mirror", "invert_colors")])
+    out = str(tmp_path / "preview.mp4")
+    plan = processor.process_video(source, out, config, seed=5, preview=True)
+    # the proxy is rendered first, then the chain runs on it
+    assert ffmpeg_calls()[0][-1].endswith(".part") and source not in ffmpeg_calls()[1]
+    saved = preview.load_plan(preview.plan_path_for(out))
+    assert saved["seed"] == 5 and saved["effects"] == plan["effects"]
+    before = len(ffmpeg_calls())
+    full = processor.process_video(source, str(tmp_path / "full.mp4"), config, plan=saved)
+    assert full["effects"] == plan["effects"] and source in ffmpeg_calls()[before]
@@ -0,0 +1,51 @@
+import os
+
+from ytp_generator import probe
+
+INFO = {"duration": 2.0, "has_video": True, "has_audio": False, "start_time": 0.0}
+
+def test_cache_misses_once_the_file_changes(tmp_path):
+    cache = probe.ProbeCache(str(tmp_path / "probe.sqlite"))
+    cache.put("/a.mp4", 10, 100, INFO)
+    assert cache.get("/a.mp4", 10, 100) == INFO
+    assert cache.get("/a.mp4", 10, 101) is None and cache.get("/a.mp4", 11, 100) is None
+
+def test_probe_media_reprobes_after_mtime_change_only(tmp_path, monkeypatch):
+    media = tmp_path / "clip.mp4"
+    media.write_bytes(b"clip")
+    calls = []
+    monkeypatch.setattr(probe, "run_ffprobe", lambda ffprobe, path: calls.append(path) or dict(INFO))
+    monkeypatch.setattr(probe, "_memory", probe.LRU(8))
+    config = {"cache_dir": str(tmp_path / "cache")}
+    probe.probe_media(str(media), config)
+    probe.probe_media(str(media), config)
+    # a new process starts with an empty memory and reads the persisted entry
+    monkeypatch.setattr(probe, "_memory", probe.LRU(8))
+    probe.probe_media(str(media), config)
+    assert len(calls) == 1
+    st = os.stat(media)
+    os.utime(media, ns=(st.st_atime_ns, st.st_mtime_ns + 1_000_000_000))
+    probe.probe_media(str(media), config)
+    assert len(calls) == 2
+
+def test_scratch_files_are_not_persisted(tmp_path, monkeypatch):
+    scratch = tmp_path / "scratch"
+    scratch.mkdir()
+    media = scratch / "stage_01.mp4"
+    media.write_bytes(b"stage")
+    monkeypatch.setattr(probe, "run_ffprobe", lambda ffprobe, path: dict(INFO))
+    config = {"cache_dir": str(tmp_path / "cache")}
+    probe.add_scratch_dir(str(scratch))
+    try:
+        probe.probe_media(str(media), config)
+        assert probe.get_cache(config).get(*probe.file_key(str(media))) is None
+    finally:
+        probe.remove_scratch_dir(str(scratch))
+
+def test_lru_forgets_the_least_recently_used():
+    lru = probe.LRU(2)
+    lru.put("a", 1)
+    lru.put("b", 2)
+    lru.get("a")
+    lru.put("c", 3)
+    assert (lru.get("a"), lru.get("b"), lru.get("c")) == (1, None, 3)
@@ -0,0 +1,45 @@
+import json
+
+from ytp_generator import config as cfg, processor
+from ytp_generator.profiling import Profile, format_report
+
+def test_stage_records_sum_their_commands(tmp_path):
+    profile = Profile("job")
+    record = profile.start_stage(1, "mirror")
+    record["commands"] += [
+        {"cmd": "ffmpeg", "start": 0.0, "wall": 1.0, "cpu_user": 1.0, "cpu_system": 0.5, "max_rss": 100, "speed": 1.5},
+        {"cmd": "ffmpeg", "start": 0.0, "wall": 2.0, "cpu_user": 2.0, "cpu_system": 0.5, "max_rss": 300, "speed": 2.0},
+    ]
+    out = tmp_path / "stage.mp4"
+    out.write_bytes(b"12345")
+    profile.end_stage(record, str(out))
+    profile.end_stage(profile.start_stage(2, "invert_colors", cached=True))
+    profile.finish()
+    report = profile.report()
+    first, second = report["stages"]
+    assert (first["cpu_user"], first["cpu_system"], first["max_rss"], first["speed"], first["output_bytes"]) == (3.0, 1.0, 300, 2.0, 5)
+    assert second["cpu_user"] is None and second["cached"]
+    assert report["totals"]["cpu_user"] == 3.0 and report["totals"]["max_rss"] == 300
+    lines = format_report(report).splitlines()
+    assert len(lines) == 4 and lines[2].endswith("invert_colors (cached)")
+
+def test_trace_has_a_track_per_pipeline_command(tmp_path):
+    profile = Profile()
+    record = profile.start_stage(1, "a | b")
+    record["commands"] += [{"cmd": "ffmpeg", "start": 1.0, "wall": 1.0}, {"cmd": "ffmpeg", "start": 1.0, "wall": 1.0}]
+    profile.end_stage(record)
+    path = tmp_path / "trace.json"
+    profile.write_trace(str(path))
+    events = json.loads(path.read_text())["traceEvents"]
+    assert sorted(e["tid"] for e in events if e.get("cat") == "command") == [2, 3]
+
+def test_process_video_fills_a_profile(tmp_path, fake_ffmpeg, source):
+    config = cfg.default_config()
+    config.update(ffmpeg_path=fake_ffmpeg, assets_dir=str(tmp_path / "assets"), seed=1,
+                  effect_chain=[{"name": n, "probability": 1} for n in ("mirror", "invert_colors")])
+    profile = Profile("in.mp4")
+    processor.process_video(source, str(tmp_path / "out.mp4"), config, mode="stages", profile=profile)
+    report = profile.report()
+    assert [s["label"] for s in report["stages"]] == ["mirror", "invert_colors"]
+    assert all(len(s["commands"]) == 1 and s["commands"][0]["returncode"] == 0 for s in report["stages"])
+    assert report["stages"][1]["output_bytes"] > 0
@@ -0,0 +1,33 @@
+from ytp_generator import config as cfg, ffmpeg_cmds, processor
+
+def test_progressive_output_replaces_the_output_path():
+    cmd = ["ffmpeg", "-i", "in.mp4", "-c:v", "libx264", "stage.mp4"]
+    assert ffmpeg_cmds.with_progressive_output(cmd, "ts", "-") == cmd[:-1] + ["-f", "mpegts", "pipe:1"]
+    assert ffmpeg_cmds.with_progressive_output(cmd, "fmp4", "out.mp4")[-1] == "out.mp4"
+
+def test_progressive_steps_remux_what_cannot_stream():
+    fmt = ("ts", "out.ts")
+    ffmpeg = ["ffmpeg", "-i", "in.mp4", "stage.mp4"]
+    assert processor._progressive_steps(ffmpeg, "ffmpeg", "stage.mp4", fmt) == [
+        ffmpeg_cmds.with_progressive_output(ffmpeg, "ts", "out.ts")]
+    # python tools write a finished file, which is remuxed afterwards
+    tool = ["python", "-m", "ytp_generator.frame_shuffle", "--output", "stage.mp4"]
+    remux = ffmpeg_cmds.build_remux_cmd("ffmpeg", "stage.mp4", "out.ts", "ts")
+    assert processor._progressive_steps(tool, "ffmpeg", "stage.mp4", fmt) == [tool, remux]
+    # a copy is remuxed from its source
+    assert processor._progressive_steps(["copy", "in.mp4", "stage.mp4"], "ffmpeg", "stage.mp4", fmt) == [
+        ffmpeg_cmds.build_remux_cmd("ffmpeg", "in.mp4", "out.ts", "ts")]
+    steps = [["ffmpeg", "-i", "in.mp4", "seg_%04d.ts"], ffmpeg]
+    assert processor._progressive_steps(steps, "ffmpeg", "stage.mp4", fmt)[0] == steps[0]
+
+def test_last_stage_writes_the_output_directly(tmp_path, fake_ffmpeg, ffmpeg_calls, source):
+    config = cfg.default_config()
+    config.update(ffmpeg_path=fake_ffmpeg, assets_dir=str(tmp_path / "assets"), seed=1,
+                  effect_chain=[{"name": n, "probability": 1} for n in ("mirror", "invert_colors")])
+    out = str(tmp_path / "out.ts")
+    messages = []
+    processor.process_video(source, out, config, mode="stages", progressive="ts",
+                            progress_callback=lambda s, t, m: messages.append(m))
+    last = ffmpeg_calls()[-1]
+    assert len(ffmpeg_calls()) == 2 and last[-3:] == ["-f", "mpegts", out]
+    assert "Streamed output: " + out in messages
@@ -0,0 +1,49 @@
+from ytp_generator import effects
+
+def _cuts(order):
+    return {"name": "random_cuts", "resolved": True, "cut_times": [2.0, 5.0], "piece_order": order}
+
+def test_reordered_cuts_are_not_fused():
+    # a split/trim/concat graph would buffer the pieces that play later
+    assert effects.build_effect_filters(_cuts([2, 0, 1]), {}, duration=10.0) is None
+
+def test_cuts_in_order_stay_fusable():
+    frag = effects.build_effect_filters(_cuts([0, 1, 2]), {}, duration=10.0)
+    assert "concat=n=3" in frag["vf"]
+
+def test_cut_points_snap_to_nearby_keyframes():
+    keyframes = [0.0, 2.0, 4.0, 6.0]
+    assert effects._snap_cut_points([1.9, 3.0, 6.2, 9.5], keyframes, 0.5, 8.0) == [2.0, 3.0, 6.0]
+    assert effects._snap_cut_points([1.9], None, 0.5, 8.0) == [1.9]
+
+def test_only_partial_gops_are_encoded():
+    keyframes = [0.0, 2.0, 4.0, 6.0]
+    assert effects._plan_cut_pieces([0.0, 2.0, 5.0, 5.5, 8.0], keyframes) == [
+        [("copy", 0.0, 2.0)],
+        [("copy", 2.0, 4.0), ("encode", 4.0, 5.0)],
+        [("encode", 5.0, 5.5)],
+        # the end of the file is a sync point: the tail after the last keyframe is copied
+        [("encode", 5.5, 6.0), ("copy", 6.0, 8.0)],
+    ]
+    assert effects._plan_cut_pieces([0.0, 1.0, 1.02, 3.0], None) == [[("copy", 0.0, 1.0)], [("copy", 1.02, 3.0)]]
+
+def _cut_cmds(tmp_path, monkeypatch, video_codec):
+    info = {"duration": 8.0, "has_video": True, "has_audio": True, "video_codec": video_codec,
+            "audio_codec": "aac", "pix_fmt": "yuv420p"}
+    monkeypatch.setattr(effects.probe, "probe_media", lambda path, config: info)
+    monkeypatch.setattr(effects.probe, "keyframe_times", lambda path, config: [0.0, 2.0, 4.0, 6.0])
+    conf = {"name": "random_cuts", "cut_times": [1.9, 5.0], "piece_order": [0, 1, 2]}
+    return effects._build_random_cuts_cmd("ffmpeg", "in.mp4", str(tmp_path / "out.mp4"), conf, {})
+
+def test_h264_cuts_copy_whole_gops(tmp_path, monkeypatch):
+    seg_cmd, enc_cmd, concat_cmd = _cut_cmds(tmp_path, monkeypatch, "h264")
+    # 1.9 is snapped onto 2.0; 5.0 is 1s from a keyframe, so only 4.0-5.0 and 5.0-6.0 are encoded
+    assert seg_cmd[seg_cmd.index("-segment_times") + 1] == "1.999000,3.999000,5.999000"
+    assert [enc_cmd[i + 1] for i, a in enumerate(enc_cmd) if a == "-ss"] == ["4.000000", "5.000000"]
+    assert concat_cmd[-1] == str(tmp_path / "out.mp4")
+
+def test_other_codecs_are_encoded_whole(tmp_path, monkeypatch):
+    cmds = _cut_cmds(tmp_path, monkeypatch, "hevc")
+    # re-encoded h264/aac fragments could not be joined to hevc copies: every cut moves onto a keyframe
+    assert len(cmds) == 2
+    assert cmds[0][cmds[0].index("-segment_times") + 1] == "1.999000,3.999000"
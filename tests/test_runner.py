@@ -0,0 +1,61 @@
+import asyncio
+import os
+import subprocess
+import time
+
+import pytest
+
+from ytp_generator import runner
+
+pytestmark = pytest.mark.skipif(os.name == "nt", reason="needs a POSIX shell")
+
+def _script(tmp_path, name, body):
+    path = tmp_path / name
+    path.write_text("#!/bin/sh\n" + body)
+    path.chmod(0o755)
+    return str(path)
+
+def test_progress_parser_emits_one_event_per_block():
+    parser = runner.ProgressParser()
+    lines = ["frame=25", "fps=24.5", "out_time=00:01:02.500000", "speed=1.5x", "progress=continue",
+             "frame=N/A", "speed=N/A", "progress=end"]
+    events = [e for e in map(parser.feed, lines) if e]
+    assert events == [
+        {"done": False, "frame": 25, "fps": 24.5, "speed": 1.5, "out_time": 62.5},
+        {"done": True, "frame": None, "fps": None, "speed": None, "out_time": None},
+    ]
+
+def test_with_progress_leaves_tools_and_piped_output_alone():
+    assert runner.with_progress(["ffmpeg", "-i", "a", "b"]) == ["ffmpeg", "-progress", "pipe:1", "-nostats", "-i", "a", "b"]
+    assert runner.with_progress(["python", "-m", "tool"]) == ["python", "-m", "tool"]
+    assert runner.with_progress(["ffmpeg", "-i", "a", "pipe:1"]) == ["ffmpeg", "-i", "a", "pipe:1"]
+
+def test_run_cmd_reports_progress_stats_and_failures(tmp_path):
+    ffmpeg = _script(tmp_path, "ffmpeg", 'printf "frame=1\\nout_time=00:00:01.000000\\nspeed=2x\\nprogress=end\\n"\n'
+                                         'case "$*" in *fail*) exit 3;; esac\n')
+    events, stats = [], []
+    asyncio.run(runner.run_cmd([ffmpeg, "out.mp4"], events.append, stats=stats))
+    assert [e["out_time"] for e in events] == [1.0]
+    assert stats[0]["cmd"] == "ffmpeg" and stats[0]["returncode"] == 0 and stats[0]["speed"] == 2.0
+    with pytest.raises(subprocess.CalledProcessError):
+        asyncio.run(runner.run_cmd([ffmpeg, "fail.mp4"]))
+
+def test_run_pipeline_pipes_each_command_into_the_next(tmp_path):
+    out = tmp_path / "out.txt"
+    first = _script(tmp_path, "first", "echo piped\n")
+    last = _script(tmp_path, "last", f'cat > "{out}"\n')
+    asyncio.run(runner.run_pipeline([[first], [last, "pipe:1"]]))
+    assert out.read_text() == "piped\n"
+
+def test_cancelling_stops_the_command(tmp_path):
+    ffmpeg = _script(tmp_path, "ffmpeg", "sleep 30\n")
+
+    async def cancel_soon():
+        task = asyncio.ensure_future(runner.run_cmd([ffmpeg, "out.mp4"]))
+        await asyncio.sleep(0.2)
+        task.cancel()
+        with pytest.raises(asyncio.CancelledError):
+            await task
+    start = time.monotonic()
+    asyncio.run(cancel_soon())
+    assert time.monotonic() - start < runner.TERMINATE_TIMEOUT
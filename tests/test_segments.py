@@ -0,0 +1,39 @@
+import io
+import random
+
+import numpy as np
+
+from ytp_generator import effects, segments
+
+def _energy(pattern):
+    """Frame energies from (seconds, dB) runs."""
+    return np.concatenate([np.full(int(round(s / segments.FRAME_SECONDS)), db, dtype=np.float64) for s, db in pattern])
+
+def test_analyze_finds_words_and_phrases():
+    energy = _energy([(0.5, -70), (0.3, -20), (0.1, -70), (0.4, -20), (0.6, -70), (0.25, -20), (0.5, -70)])
+    assert segments.analyze(energy)["words"] == [[0.5, 0.8, 0], [0.9, 1.3, 0], [1.9, 2.15, 1]]
+
+def test_analyze_drops_blips_and_handles_silence():
+    assert segments.analyze(_energy([(0.5, -70), (0.03, -20), (0.5, -70)]))["words"] == []
+    assert segments.analyze(np.zeros(0)) == {"words": []}
+
+def test_frame_energy_reads_blocks_and_drops_the_partial_frame():
+    hop = int(segments.SAMPLE_RATE * segments.FRAME_SECONDS)
+    pcm = np.full(hop * (segments.BLOCK_FRAMES + 2) + 7, 0.5, dtype=np.float32)
+    energy = segments.frame_energy(io.BytesIO(pcm.tobytes()), hop)
+    assert len(energy) == segments.BLOCK_FRAMES + 2
+    assert np.allclose(energy, 10 * np.log10(0.25), atol=1e-6)
+
+def test_words_are_opt_in_except_for_sentence_mix(monkeypatch):
+    assert not effects.uses_words({"name": "random_cuts"})
+    assert effects.uses_words({"name": "random_cuts", "word_aligned": True})
+    assert effects.uses_words({"name": "sentence_mix"})
+    assert not effects.uses_words({"name": "mirror", "word_aligned": True})
+
+    def analysed(*args):
+        raise AssertionError("the source was analysed")
+    monkeypatch.setattr(effects, "source_words", analysed)
+    monkeypatch.setattr(effects.probe, "probe_media", lambda path, config: {"duration": 10.0})
+    conf = effects.resolve_effect({"name": "random_cuts", "min_cuts": 2, "max_cuts": 3}, {}, "in.mp4",
+                                  rng=random.Random(1))
+    assert "snap_tolerance" not in conf and conf["cut_times"]
@@ -0,0 +1,49 @@
+import asyncio
+import json
+import os
+
+from ytp_generator.service import RenderService
+
+def make_service(tmp_path, **kwargs):
+    service = RenderService({"ffmpeg_path": "ffmpeg", "effects": {}}, log=lambda m: None, **kwargs)
+    service._queue = asyncio.Queue()
+    return service
+
+def post(service, body, content_type="application/json"):
+    return service._respond("POST", "/jobs", json.dumps(body).encode(), content_type)
+
+def test_post_checks_body(tmp_path):
+    service = make_service(tmp_path, out_dir=str(tmp_path / "out"))
+    assert post(service, {"input": "a.mp4"}, "text/plain")[0] == 415
+    for body in ([], "a.mp4", 1):
+        status, reply = post(service, body)
+        assert status == 400 and "JSON object" in reply["error"]
+    assert post(service, {"input": "a.mp4", "config": {"ffmpeg_path": "/tmp/x"}})[0] == 400
+    assert post(service, {"input": "a.mp4", "output": str(tmp_path / "elsewhere.mp4")})[0] == 400
+    status, job = post(service, {"input": "a.mp4", "config": {"seed": 3}})
+    assert status == 202 and job["output"] == str(tmp_path / "out" / "a_ytp.mp4")
+    assert service.jobs[job["id"]].config == {"ffmpeg_path": "ffmpeg", "effects": {}, "seed": 3}
+
+def test_post_needs_out_dir(tmp_path):
+    status, reply = post(make_service(tmp_path), {"input": "a.mp4"})
+    assert status == 400 and "out_dir" in reply["error"]
+
+def test_queue_file_config_is_merged_and_checked(tmp_path):
+    queue = tmp_path / "queue"
+    queue.mkdir()
+    (queue / "good.json").write_text(json.dumps({"input": "a.mp4", "config": {"seed": 3}}))
+    (queue / "bad.json").write_text(json.dumps({"input": "b.mp4", "config": {"temp_dir": "/"}}))
+    (queue / "list.json").write_text("[]")
+    service = make_service(tmp_path, queue_dir=str(queue))
+    # files are taken once their size and mtime are stable over two polls
+    service._scan()
+    found = service._scan()
+    assert [(os.path.basename(i), c) for i, _, c, _ in found] == [
+        ("a.mp4", {"ffmpeg_path": "ffmpeg", "effects": {}, "seed": 3})]
+    assert sorted(os.listdir(queue)) == ["bad.json.failed", "good.json", "list.json.failed"]
+
+def test_mark_logs_missing_job_file(tmp_path):
+    messages = []
+    service = RenderService({}, log=messages.append)
+    service._mark(str(tmp_path / "gone.json"), ".done")
+    assert messages and "gone.json" in messages[0]
@@ -0,0 +1,23 @@
+import os
+
+import numpy as np
+
+from ytp_generator import sound_bank
+
+def test_ensure_replaces_older_entries_but_keeps_its_own(tmp_path, monkeypatch):
+    source = tmp_path / "boom.wav"
+    source.write_bytes(b"wav")
+    bank = sound_bank.SoundBank(str(tmp_path / "cache"))
+    path = bank.path_for(str(source))
+    stale = os.path.join(bank.dir, os.path.basename(path).split("_")[0] + "_0000000000000000.f32")
+    open(stale, "wb").close()
+
+    def decode(cmd, **kwargs):
+        np.array([[0.1, -0.3], [0.2, 0.0]], dtype=np.float32).tofile(cmd[-1])
+        # a concurrent job installs the same entry meanwhile
+        open(path, "wb").close()
+    monkeypatch.setattr(sound_bank.subprocess, "run", decode)
+    assert bank.ensure(str(source)) == path
+    assert bank.entries() == [path]
+    pcm = sound_bank.open_pcm(path)
+    assert pcm.shape == (2, 2) and abs(float(np.abs(pcm).max()) - sound_bank.PEAK) < 1e-6
@@ -0,0 +1,43 @@
+from ytp_generator import config as cfg, processor, stage_cache
+
+def _config(tmp_path, ffmpeg, chain):
+    config = cfg.default_config()
+    config.update(ffmpeg_path=ffmpeg, cache_dir=str(tmp_path / "cache"), assets_dir=str(tmp_path / "assets"),
+                  stage_cache=True, seed=1, effect_chain=[{"name": n, "probability": 1} for n in chain])
+    return config
+
+def test_rerun_with_last_effect_changed_reuses_earlier_stages(tmp_path, fake_ffmpeg, ffmpeg_calls, source):
+    out = str(tmp_path / "out.mp4")
+    processor.process_video(source, out, _config(tmp_path, fake_ffmpeg, ["invert_colors", "mirror", "invert_colors"]))
+    assert len(ffmpeg_calls()) == 3
+    messages = []
+    processor.process_video(source, out, _config(tmp_path, fake_ffmpeg, ["invert_colors", "mirror", "mirror"]),
+                            progress_callback=lambda stage, total, msg: messages.append(msg))
+    assert "Reusing cached stages 1-2" in messages
+    # only the changed last stage ran again
+    assert len(ffmpeg_calls()) == 4
+
+def test_keys_chain_and_follow_referenced_files(tmp_path, fake_ffmpeg):
+    cache = stage_cache.StageCache(str(tmp_path / "cache"))
+    sound = tmp_path / "boom.wav"
+    sound.write_bytes(b"one")
+    unit = ("single", {"name": "random_sound_overlay", "sounds": [str(sound)]})
+    first = cache.key("source", unit, fake_ffmpeg)
+    assert first == cache.key("source", unit, fake_ffmpeg)
+    assert first != cache.key("other source", unit, fake_ffmpeg)
+    assert first != cache.key("source", ("single", {"name": "mirror"}), fake_ffmpeg)
+    sound.write_bytes(b"two!")
+    assert first != cache.key("source", unit, fake_ffmpeg)
+
+def test_least_recently_used_entries_are_evicted(tmp_path, monkeypatch):
+    clock = iter(range(100))
+    monkeypatch.setattr(stage_cache.time, "time", lambda: float(next(clock)))
+    cache = stage_cache.StageCache(str(tmp_path / "cache"), max_bytes=25)
+    for key in ("a", "b", "c"):
+        path = tmp_path / f"{key}.mp4"
+        path.write_bytes(b"x" * 10)
+        cache.put(key, str(path))
+        if key == "b":
+            cache.get("a")
+    assert [e["key"] for e in cache.entries()] == ["c", "a"]
+    assert cache.get("b") is None and cache.total_bytes() == 20
@@ -0,0 +1,27 @@
+import re
+
+from ytp_generator import effects, ffmpeg_cmds
+
+def _graph_length(af, duration):
+    """Length of the clip a stutter audio graph plays: every trimmed piece times its loop count + 1."""
+    total = 0.0
+    for chain in af.split(";")[1:]:
+        trim = re.search(r"atrim=start=([\d.]+)(?::end=([\d.]+))?", chain)
+        if not trim:
+            # the final concat
+            continue
+        loop = re.search(r"aloop=loop=(\d+)", chain)
+        end = float(trim.group(2)) if trim.group(2) else duration
+        total += (end - float(trim.group(1))) * (int(loop.group(1)) + 1 if loop else 1)
+    return total
+
+def test_stutter_duration_matches_graph_and_words():
+    duration, length = 10.0, 0.2
+    conf = {"name": "stutter", "sample_length": length, "points": [1.0, 3.0, 6.5], "repeat_counts": [2, 3, 1]}
+    frag = ffmpeg_cmds.stutter_filters(conf["points"], length, conf["repeat_counts"])
+    played = _graph_length(frag["af"], duration)
+    assert abs(duration + frag["time_add"] - played) < 1e-6
+    assert abs(effects.resolved_duration(conf, duration) - played) < 1e-6
+    # a word after the last stutter point moves by exactly the added time
+    words = effects.resolved_words(conf, [[8.0, 8.5, 0]], duration)
+    assert abs(words[0][0] - 8.0 - (played - duration)) < 1e-6
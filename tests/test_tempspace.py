@@ -0,0 +1,53 @@
+import os
+
+from ytp_generator import config as cfg, processor
+from ytp_generator.tempspace import TempSpace
+
+def test_spills_to_disk_past_the_ram_budget(tmp_path):
+    (tmp_path / "ram").mkdir()
+    space = TempSpace({"ram_temp_dir": str(tmp_path / "ram"), "ram_temp_mb": 1, "temp_dir": str(tmp_path)})
+    small = space.path("a.mp4", 1000)
+    assert os.path.dirname(small) == space.ram
+    with open(small, "wb") as f:
+        f.write(b"x" * 1000)
+    big = space.path("b.mp4", 1024 * 1024)
+    assert os.path.dirname(big) == space.disk
+    space.cleanup()
+    assert not os.path.exists(space.ram) and not os.path.exists(space.disk)
+
+def test_final_paths_are_unique_within_a_process(tmp_path):
+    out = str(tmp_path / "out.mp4")
+    first, second = TempSpace.final_path(out), TempSpace.final_path(out)
+    assert first != second
+    assert os.path.dirname(first) == str(tmp_path) and os.path.basename(first).startswith(".out.")
+
+def test_dry_run_leaves_no_temp_dirs(tmp_path, fake_ffmpeg, source):
+    temp = tmp_path / "temp"
+    temp.mkdir()
+    config = cfg.default_config()
+    config.update(ffmpeg_path=fake_ffmpeg, assets_dir=str(tmp_path / "assets"), ram_temp_dir=str(temp),
+                  temp_dir=str(temp), seed=1, effect_chain=[{"name": "mirror", "probability": 1}])
+    processor.process_video(source, str(tmp_path / "out.mp4"), config, dry_run=True)
+    assert os.listdir(temp) == []
+
+def test_stage_failing_in_memory_is_rendered_again_on_disk(tmp_path, fake_ffmpeg, ffmpeg_calls, source):
+    # the fake ffmpeg fails like a full RAM filesystem for outputs in the shm folder
+    with open(fake_ffmpeg) as f:
+        script = f.read()
+    with open(fake_ffmpeg, "w") as f:
+        f.write(script.replace('for a; do last=$a; done\n', 'for a; do last=$a; done\ncase "$last" in */shm/*) exit 1;; esac\n'))
+    (tmp_path / "shm").mkdir()
+    (tmp_path / "disk").mkdir()
+    config = cfg.default_config()
+    config.update(ffmpeg_path=fake_ffmpeg, assets_dir=str(tmp_path / "assets"), ram_temp_dir=str(tmp_path / "shm"),
+                  temp_dir=str(tmp_path / "disk"), seed=1,
+                  effect_chain=[{"name": n, "probability": 1} for n in ("mirror", "invert_colors", "mirror")])
+    messages = []
+    out = str(tmp_path / "out.mp4")
+    processor.process_video(source, out, config, mode="stages", progress_callback=lambda s, t, m: messages.append(m))
+    assert os.path.isfile(out)
+    outputs = [call[-1] for call in ffmpeg_calls()]
+    # stage 1 is retried on disk, stage 2 goes straight to disk
+    assert ["/shm/" in p for p in outputs] == [True, False, False, False]
+    assert sum("again on disk" in m for m in messages) == 1
+    assert os.listdir(tmp_path / "shm") == [] and os.listdir(tmp_path / "disk") == []
@@ -0,0 +1,31 @@
+import json
+import os
+
+from ytp_generator import config as cfg, variants
+
+def test_build_tree_shares_common_prefixes():
+    a, b, c = ("single", {"name": "a"}), ("single", {"name": "b"}), ("single", {"name": "c"})
+    root = variants.build_tree([[a, b], [a, c], [a, b], []])
+    assert root.variants == [3] and len(root.children) == 1
+    (shared,) = root.children.values()
+    assert [n.unit for n in shared.children.values()] == [b, c]
+    assert [n.variants for n in shared.children.values()] == [[0, 2], [1]]
+    assert len(list(root.walk())) == 4
+
+def test_output_paths_are_numbered():
+    assert variants.output_paths("out.mp4", 3) == ["out_01.mp4", "out_02.mp4", "out_03.mp4"]
+    assert variants.output_paths("out", 100)[-1] == "out_100.mp4"
+
+def test_shared_stages_render_once(tmp_path, fake_ffmpeg, ffmpeg_calls, source):
+    config = cfg.default_config()
+    config.update(ffmpeg_path=fake_ffmpeg, assets_dir=str(tmp_path / "assets"), cache_dir=str(tmp_path / "cache"),
+                  effect_chain=[{"name": "mirror", "probability": 1}, {"name": "invert_colors", "probability": 1},
+                                {"name": "speed_change", "probability": 1}])
+    out = str(tmp_path / "out.mp4")
+    manifest = variants.render_variants(source, out, config, 3, seed=10, mode="stages", jobs=2)
+    assert (manifest["stages"], manifest["rendered_stages"]) == (9, 5)
+    assert len(ffmpeg_calls()) == 5
+    assert [v["seed"] for v in manifest["variants"]] == [10, 11, 12]
+    assert all(os.path.isfile(p) for p in variants.output_paths(out, 3))
+    with open(variants.manifest_path_for(out)) as f:
+        assert json.load(f)["variants"][0]["output"] == os.path.abspath(variants.output_paths(out, 3)[0])
@@ -1,3 +1,3 @@
 """ytp_generator package"""
-from . import assets, effects, config, utils, ffmpeg_cmds
+from . import assets, effects, config, utils, ffmpeg_cmds, probe
 from . import gui, processor  # gui and processor added for the GUI/processing entrypoints
\ No newline at end of file
@@ -1,7 +1,13 @@
 """
-Asset management: create and validate required asset directories.
+Asset management: create and validate required asset directories, and keep a
+persistent index of the assets for the effect builders.
 """
 import os
+import random
+import sqlite3
+import threading
+
+from . import probe
 
 ASSET_DIRS = [
     "adverts",
@@ -23,13 +29,179 @@ def ensure_asset_dirs(base_dir="assets"):
             os.makedirs(path)
     return base_dir
 
-def list_assets(base_dir="assets"):
-    base_dir = os.path.abspath(base_dir)
-    d = {}
-    for name in ASSET_DIRS:
-        p = os.path.join(base_dir, name)
-        if os.path.isdir(p):
-            d[name] = [os.path.join(p, f) for f in os.listdir(p)]
-        else:
-            d[name] = []
-    return d
\ No newline at end of file
+# Which stream a file needs to be usable in each category (None: any media).
+CATEGORY_NEEDS = {
+    "adverts": "video",
+    "errors": None,
+    "images": "video",
+    "memes": "video",
+    "memes_sounds": "audio",
+    "overlays_videos": "video",
+    "sounds": "audio",
+}
+
+MEDIA_EXTENSIONS = {
+    ".png", ".jpg", ".jpeg", ".bmp", ".gif", ".webp", ".tif", ".tiff",
+    ".mp4", ".mov", ".mkv", ".avi", ".webm", ".flv", ".wmv", ".m4v", ".mpg", ".mpeg", ".ts",
+    ".mp3", ".wav", ".ogg", ".oga", ".flac", ".m4a", ".aac", ".opus", ".wma",
+}
+
+IMAGE_CODECS = {"png", "mjpeg", "bmp", "webp", "tiff", "gif"}
+
+ASSET_DB = "assets.sqlite"
+
+def _asset_kind(info):
+    if info["has_video"]:
+        return "image" if info["video_codec"] in IMAGE_CODECS and not info["has_audio"] else "video"
+    return "audio" if info["has_audio"] else None
+
+class AssetIndex:
+    """
+    Persistent index of the asset folders.
+
+    Entries (type, duration, dimensions, usable flag) are stored in
+    cache_dir/assets.sqlite. refresh() only rescans folders whose mtime changed and
+    only probes new or modified files; files ffprobe cannot read, or that lack the
+    stream their category needs, are kept as unusable so they are not probed again.
+    Usable paths are held in memory per category for O(1) random sampling.
+    """
+
+    def __init__(self, base_dir, config):
+        self.base_dir = os.path.abspath(base_dir)
+        self.config = config
+        db_path = os.path.join(config.get("cache_dir", ".ytp_cache"), ASSET_DB)
+        os.makedirs(os.path.dirname(os.path.abspath(db_path)), exist_ok=True)
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(db_path, timeout=30, check_same_thread=False)
+        with self._conn:
+            self._conn.execute(
+                "CREATE TABLE IF NOT EXISTS assets ("
+                "path TEXT PRIMARY KEY, category TEXT, size INTEGER, mtime_ns INTEGER, "
+                "kind TEXT, duration REAL, width INTEGER, height INTEGER, usable INTEGER)"
+            )
+            self._conn.execute("CREATE TABLE IF NOT EXISTS dirs (path TEXT PRIMARY KEY, mtime_ns INTEGER)")
+        self._usable = {}
+        self.refresh()
+
+    def _dir(self, category):
+        return os.path.join(self.base_dir, category)
+
+    def refresh(self, full=False):
+        """
+        Bring the index up to date. Folders whose mtime is unchanged are skipped
+        unless full=True (needed to notice files modified in place).
+        """
+        with self._lock:
+            changed = [self._refresh_category(category, full) for category in ASSET_DIRS]
+            if any(changed) or not self._usable:
+                self._load()
+
+    def _refresh_category(self, category, full):
+        path = self._dir(category)
+        if not os.path.isdir(path):
+            return False
+        dir_mtime = os.stat(path).st_mtime_ns
+        row = self._conn.execute("SELECT mtime_ns FROM dirs WHERE path = ?", (path,)).fetchone()
+        if row and row[0] == dir_mtime and not full:
+            return False
+        known = {
+            r[0]: (r[1], r[2])
+            for r in self._conn.execute("SELECT path, size, mtime_ns FROM assets WHERE category = ?", (category,))
+        }
+        seen = set()
+        with self._conn:
+            for entry in os.scandir(path):
+                if not entry.is_file():
+                    continue
+                st = entry.stat()
+                seen.add(entry.path)
+                if known.get(entry.path) == (st.st_size, st.st_mtime_ns):
+                    continue
+                self._conn.execute(
+                    "INSERT OR REPLACE INTO assets VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?)",
+                    (entry.path, category, st.st_size, st.st_mtime_ns) + self._inspect(entry.path, category),
+                )
+            gone = [(p,) for p in known if p not in seen]
+            self._conn.executemany("DELETE FROM assets WHERE path = ?", gone)
+            self._conn.execute("INSERT OR REPLACE INTO dirs VALUES (?, ?)", (path, dir_mtime))
+        return True
+
+    def _inspect(self, path, category):
+        """Return (kind, duration, width, height, usable) for a file."""
+        if os.path.splitext(path)[1].lower() not in MEDIA_EXTENSIONS:
+            return (None, 0.0, 0, 0, 0)
+        try:
+            info = probe.probe_media(path, self.config)
+        except Exception:
+            return (None, 0.0, 0, 0, 0)
+        kind = _asset_kind(info)
+        need = CATEGORY_NEEDS.get(category)
+        usable = kind is not None and (need is None or info["has_" + need])
+        return (kind, info["duration"], info["width"], info["height"], int(usable))
+
+    def _load(self):
+        usable = {name: [] for name in ASSET_DIRS}
+        for path, category in self._conn.execute(
+            "SELECT path, category FROM assets WHERE usable = 1 ORDER BY path"
+        ):
+            if os.path.dirname(path) == self._dir(category):
+                usable[category].append(path)
+        self._usable = usable
+
+    def files(self, category):
+        return list(self._usable.get(category, []))
+
+    def info(self, path):
+        """Return the indexed record for path as a dict, or None."""
+        with self._lock:
+            row = self._conn.execute(
+                "SELECT category, kind, duration, width, height, usable FROM assets WHERE path = ?", (path,)
+            ).fetchone()
+        if not row:
+            return None
+        return dict(zip(("category", "kind", "duration", "width", "height", "usable"), row))
+
+    def sample(self, categories, k=1, rng=None):
+        """
+        Pick up to k distinct usable files from the union of categories without
+        materialising the union (cost depends on k, not on the library size).
+        rng: optional random.Random to draw from (default: the random module).
+        """
+        pools = [self._usable.get(c, []) for c in categories]
+        total = sum(len(p) for p in pools)
+        picks = []
+        for i in (rng or random).sample(range(total), min(k, total)):
+            for pool in pools:
+                if i < len(pool):
+                    picks.append(pool[i])
+                    break
+                i -= len(pool)
+        return picks
+
+    def choice(self, categories, rng=None):
+        picks = self.sample(categories, 1, rng)
+        return picks[0] if picks else None
+
+_indexes = {}
+_indexes_lock = threading.Lock()
+
+def get_index(config, refresh=True):
+    """
+    Return the AssetIndex for config["assets_dir"], creating it on first use.
+    Later calls reuse the in-memory index and only refresh changed folders.
+    """
+    base_dir = os.path.abspath(config.get("assets_dir", "assets"))
+    key = (base_dir, os.path.abspath(config.get("cache_dir", ".ytp_cache")))
+    with _indexes_lock:
+        index = _indexes.get(key)
+        if index is None:
+            index = _indexes[key] = AssetIndex(base_dir, config)
+            return index
+    if refresh:
+        index.refresh()
+    return index
+
+def list_assets(base_dir="assets", config=None):
+    """Usable files of each asset folder under base_dir, from the asset index."""
+    index = get_index(dict(config or {}, assets_dir=base_dir))
+    return {name: index.files(name) for name in ASSET_DIRS}
@@ -0,0 +1,227 @@
+"""
+Audio engine.
+
+Decodes the soundtrack to float PCM over a pipe once, runs every audio effect of a
+stage on blocks of samples with NumPy and pipes the result to an encoder that muxes
+it with the untouched video. A run of audio-only effects (chorus, vibrato, earrape,
+sus_effect, sound overlays) costs one decode and one encode instead of one ffmpeg
+pass each, and memory stays at one block. Overlay sounds are read from the
+memory-mapped sound bank, so they are never decoded again.
+
+Effects are passed as a list of operations (see effects.audio_ops):
+  {"op": "gain", "db": 20}
+  {"op": "echo", "in_gain": .., "out_gain": .., "delays": [ms, ..], "decays": [..]}
+  {"op": "resample", "ratio": 1.1}     play ratio times faster (pitch and tempo)
+  {"op": "autotune", "mode": "random"|"scale", "key": "C", "scale": "major", ...}
+                                       pitch correction (see autotune.Autotune)
+  {"op": "mix", "sounds": [{"pcm": bank entry, "gain": 1.0, "offset": s}, ..]}
+                                       add sound bank entries at offsets (seconds)
+
+Run as a tool: python -m ytp_generator.audio_engine --input in.mp4 --output out.mp4 --ops '[...]'
+(effects.build_audio_engine_command builds this command line).
+"""
+import argparse
+import json
+import subprocess
+import sys
+
+import numpy as np
+
+from . import autotune, ffmpeg_cmds, sound_bank
+
+# Sample frames per block
+BLOCK_FRAMES = 1 << 16
+
+class Gain:
+    def __init__(self, db):
+        self.factor = np.float32(10.0 ** (db / 20.0))
+
+    def process(self, block):
+        block *= self.factor
+        return block
+
+class Echo:
+    """Feed-forward echo with the semantics of ffmpeg's aecho (without its tail at EOF)."""
+
+    def __init__(self, in_gain, out_gain, delays, decays, sample_rate, channels):
+        self.in_gain, self.out_gain = np.float32(in_gain), np.float32(out_gain)
+        self.delays = [max(1, int(round(d * sample_rate / 1000.0))) for d in delays]
+        self.decays = [np.float32(d) for d in decays]
+        self.history = np.zeros((max(self.delays), channels), dtype=np.float32)
+
+    def process(self, block):
+        size, n = len(self.history), len(block)
+        x = np.concatenate([self.history, block])
+        out = block * self.in_gain
+        for delay, decay in zip(self.delays, self.decays):
+            out += x[size - delay:size - delay + n] * decay
+        out *= self.out_gain
+        self.history = x[-size:]
+        return out
+
+class Resample:
+    """Play the stream ratio times faster by linear interpolation (like asetrate + aresample)."""
+
+    def __init__(self, ratio, channels):
+        self.ratio = float(ratio)
+        self.pending = np.zeros((0, channels), dtype=np.float32)
+        self.pos = 0.0
+
+    def process(self, block):
+        x = np.concatenate([self.pending, block])
+        count = max(0, int(np.ceil((len(x) - 1 - self.pos) / self.ratio)))
+        at = self.pos + self.ratio * np.arange(count)
+        i = at.astype(np.int64)
+        frac = (at - i).astype(np.float32)[:, None]
+        out = x[i] * (1.0 - frac) + x[np.minimum(i + 1, len(x) - 1)] * frac
+        nxt = self.pos + self.ratio * count
+        drop = min(int(nxt), len(x))
+        self.pending, self.pos = x[drop:], nxt - drop
+        return out.astype(np.float32)
+
+class Mix:
+    """
+    Add sound bank entries (memory-mapped, see sound_bank) to the stream, each from
+    its offset with its gain. Only the frames under the current block are touched.
+    """
+
+    def __init__(self, sounds, sample_rate, channels):
+        self.sounds = [(sound_bank.open_pcm(s["pcm"]), np.float32(s.get("gain", 1.0)),
+                        int(round(s.get("offset", 0.0) * sample_rate))) for s in sounds]
+        self.step = sound_bank.SAMPLE_RATE / float(sample_rate)
+        self.channels = channels
+        self.cursor = 0
+
+    def _frames(self, pcm, start, n):
+        # bank frames under n stream frames starting at stream frame `start` of the sound
+        if self.step == 1.0:
+            return pcm[start:start + n]
+        at = (start + np.arange(n)) * self.step
+        at = at[at < len(pcm) - 1]
+        i = at.astype(np.int64)
+        frac = (at - i).astype(np.float32)[:, None]
+        return pcm[i] * (1.0 - frac) + pcm[i + 1] * frac
+
+    def _layout(self, part):
+        if self.channels == sound_bank.CHANNELS:
+            return part
+        if self.channels == 1:
+            return part.mean(axis=1, keepdims=True)
+        out = np.zeros((len(part), self.channels), dtype=np.float32)
+        k = min(self.channels, sound_bank.CHANNELS)
+        out[:, :k] = part[:, :k]
+        return out
+
+    def process(self, block):
+        n = len(block)
+        end = self.cursor + n
+        for pcm, gain, offset in self.sounds:
+            start = max(self.cursor, offset)
+            if start >= end:
+                continue
+            part = self._frames(pcm, start - offset, end - start)
+            if len(part):
+                at = start - self.cursor
+                block[at:at + len(part)] += self._layout(part) * gain
+        self.cursor = end
+        return block
+
+def build_chain(ops, sample_rate, channels):
+    chain = []
+    for op in ops:
+        kind = op["op"]
+        if kind == "gain":
+            chain.append(Gain(op["db"]))
+        elif kind == "echo":
+            chain.append(Echo(op["in_gain"], op["out_gain"], op["delays"], op["decays"], sample_rate, channels))
+        elif kind == "resample":
+            chain.append(Resample(op["ratio"], channels))
+        elif kind == "mix":
+            chain.append(Mix(op["sounds"], sample_rate, channels))
+        elif kind == "autotune":
+            chain.append(autotune.Autotune(sample_rate, channels, mode=op.get("mode", "random"), key=op.get("key", "C"),
+                                           scale=op.get("scale", "major"), strength=op.get("strength", 1.0),
+                                           note_hold=op.get("note_hold", 0.25), note_range=op.get("note_range", 7),
+                                           seed=op.get("seed")))
+        else:
+            raise ValueError(f"Unknown audio op {kind!r}")
+    return chain
+
+def _read_block(stream, buf, frame_size):
+    """Fill buf from the pipe; return the number of whole frames read (0 at end of stream)."""
+    view = memoryview(buf)
+    got = 0
+    while got < len(view):
+        n = stream.readinto(view[got:])
+        if not n:
+            break
+        got += n
+    return got // frame_size
+
+def process_stream(src, dst, chain, channels, block_frames=BLOCK_FRAMES):
+    """Run chain over the PCM stream src -> dst. Returns the number of input frames."""
+    frame_size = 4 * channels
+    buf = bytearray(block_frames * frame_size)
+    total = 0
+    while True:
+        frames = _read_block(src, buf, frame_size)
+        if not frames:
+            break
+        block = np.frombuffer(buf, dtype=np.float32, count=frames * channels).reshape(frames, channels).copy()
+        for stage in chain:
+            block = stage.process(block)
+        dst.write(block.tobytes())
+        total += frames
+        if frames < block_frames:
+            break
+    # stages that hold samples back (e.g. autotune) release them at the end
+    block = np.zeros((0, channels), dtype=np.float32)
+    for stage in chain:
+        block = stage.process(block)
+        if hasattr(stage, "flush"):
+            block = np.concatenate([block, stage.flush()])
+    if len(block):
+        dst.write(block.tobytes())
+    return total
+
+def run(ffmpeg_path, input_path, output_path, ops, sample_rate, channels, threads=None):
+    chain = build_chain(ops, sample_rate, channels)
+    dec_cmd = ffmpeg_cmds.with_threads(ffmpeg_cmds.build_pcm_decode_cmd(ffmpeg_path, input_path, sample_rate, channels), threads)
+    enc_cmd = ffmpeg_cmds.with_threads(
+        ffmpeg_cmds.build_pcm_mux_cmd(ffmpeg_path, input_path, output_path, sample_rate, channels), threads)
+    dec = subprocess.Popen(dec_cmd, stdin=subprocess.DEVNULL, stdout=subprocess.PIPE)
+    enc = subprocess.Popen(enc_cmd, stdin=subprocess.PIPE)
+    try:
+        process_stream(dec.stdout, enc.stdin, chain, channels)
+        enc.stdin.close()
+    except BrokenPipeError:
+        # the encoder died; its exit code is reported below
+        pass
+    finally:
+        dec.stdout.close()
+        dec.wait()
+        enc.wait()
+    if dec.returncode != 0:
+        raise subprocess.CalledProcessError(dec.returncode, dec_cmd)
+    if enc.returncode != 0:
+        raise subprocess.CalledProcessError(enc.returncode, enc_cmd)
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Apply audio effects with NumPy in one decode/encode pass")
+    parser.add_argument("--ffmpeg", default="ffmpeg")
+    parser.add_argument("--input", required=True)
+    parser.add_argument("--output", required=True)
+    parser.add_argument("--ops", required=True, help="JSON list of audio operations")
+    parser.add_argument("--sample-rate", type=int, required=True)
+    parser.add_argument("--channels", type=int, required=True)
+    parser.add_argument("--threads", type=int)
+    args = parser.parse_args(argv)
+    try:
+        run(args.ffmpeg, args.input, args.output, json.loads(args.ops), args.sample_rate, args.channels, threads=args.threads)
+    except subprocess.CalledProcessError as e:
+        print(f"audio_engine: {e}", file=sys.stderr)
+        return 1
+    return 0
+
+if __name__ == "__main__":
+    sys.exit(main())
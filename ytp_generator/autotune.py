@@ -0,0 +1,195 @@
+"""
+Streaming pitch correction for autotune_chaos (an audio_engine operation).
+
+Pitch is detected with YIN on overlapping analysis frames of the mono mix, all
+frames of a block at once (FFT cross-correlation, cumulative mean normalised
+difference). Each voiced frame gets a target note: the nearest note of the scale
+("scale" mode) or a random scale note near it, held for note_hold seconds
+("random" mode). The shift ratio is interpolated per sample and applied with a
+two-tap delay-line pitch shifter (crossfaded read heads moving at the shift rate),
+which is vectorised over the block and needs only a short history, so memory
+does not depend on the track length.
+"""
+import numpy as np
+
+NOTE_NAMES = ("C", "C#", "D", "D#", "E", "F", "F#", "G", "G#", "A", "A#", "B")
+SCALES = {
+    "major": (0, 2, 4, 5, 7, 9, 11),
+    "minor": (0, 2, 3, 5, 7, 8, 10),
+    "pentatonic": (0, 2, 4, 7, 9),
+    "blues": (0, 3, 5, 6, 7, 10),
+    "chromatic": tuple(range(12)),
+}
+
+# YIN settings
+THRESHOLD = 0.15
+# Frames quieter than this mean square (-80 dB) are unvoiced
+SILENCE = 1e-8
+MIN_FREQ = 70.0
+MAX_FREQ = 1000.0
+# Shifter window (seconds): longer is smoother, shorter has less echo
+WINDOW_SECONDS = 0.04
+
+def _next_pow2(n):
+    return 1 << max(1, int(np.ceil(np.log2(n))))
+
+def detect_pitch(frames, sample_rate, threshold=THRESHOLD, min_freq=MIN_FREQ, max_freq=MAX_FREQ):
+    """
+    YIN pitch of each row of frames (shape (m, N)). Returns frequencies in Hz,
+    0.0 for unvoiced frames.
+    """
+    m, size = frames.shape
+    half = size // 2
+    fft_size = _next_pow2(2 * size)
+    spec = np.fft.rfft(frames, fft_size)
+    head = np.fft.rfft(frames[:, :half], fft_size)
+    corr = np.fft.irfft(np.conj(head) * spec, fft_size)[:, :half]
+    energy = np.concatenate([np.zeros((m, 1)), np.cumsum(frames ** 2, axis=1)], axis=1)
+    lags = np.arange(half)
+    e0 = energy[:, half][:, None]
+    e_tau = energy[:, lags + half] - energy[:, lags]
+    diff = np.maximum(e0 + e_tau - 2.0 * corr, 0.0)
+    diff[:, 0] = 0.0
+    cum = np.cumsum(diff[:, 1:], axis=1)
+    cmnd = np.ones_like(diff)
+    cmnd[:, 1:] = diff[:, 1:] * lags[1:] / np.where(cum > 0, cum, 1.0)
+    lo = max(2, int(sample_rate / max_freq))
+    hi = min(half - 2, int(sample_rate / min_freq))
+    if hi <= lo:
+        return np.zeros(m)
+    window = cmnd[:, lo:hi]
+    below = window < threshold
+    # silence has no dip in its difference function: every lag matches
+    voiced = below.any(axis=1) & (energy[:, size] > SILENCE * size)
+    tau = np.argmax(below, axis=1) + lo
+    rows = np.arange(m)
+    # walk down to the local minimum after the first dip under the threshold
+    for _ in range(hi - lo):
+        step = (tau + 1 < hi) & (cmnd[rows, np.minimum(tau + 1, half - 1)] < cmnd[rows, tau])
+        if not step.any():
+            break
+        tau = tau + step
+    # parabolic interpolation around the minimum
+    a, b, c = cmnd[rows, tau - 1], cmnd[rows, tau], cmnd[rows, tau + 1]
+    denom = a - 2.0 * b + c
+    shift = np.where(np.abs(denom) > 1e-12, 0.5 * (a - c) / np.where(denom == 0, 1.0, denom), 0.0)
+    period = tau + np.clip(shift, -1.0, 1.0)
+    return np.where(voiced, sample_rate / period, 0.0)
+
+def scale_notes(key="C", scale="major"):
+    """Pitch classes (0-11) of a scale; key is a note name from NOTE_NAMES."""
+    root = NOTE_NAMES.index(key)
+    return np.array(sorted((root + i) % 12 for i in SCALES[scale]))
+
+def snap_to_scale(midi, classes):
+    """Nearest MIDI note (float input) whose pitch class is in classes."""
+    octave = np.floor(midi / 12.0)[..., None] * 12.0
+    candidates = np.concatenate([octave + classes - 12, octave + classes, octave + classes + 12], axis=-1)
+    return np.take_along_axis(candidates, np.abs(candidates - midi[..., None]).argmin(axis=-1)[..., None], axis=-1)[..., 0]
+
+class Autotune:
+    """
+    Block-streaming pitch corrector for (frames, channels) float32 blocks.
+    The shifter runs `lookahead` samples behind the input so every sample has
+    analysis frames on both sides, which makes the output independent of the block
+    size. The first `latency` output samples are dropped and flush() returns the
+    held-back tail, so the output stays aligned with the input (and the video).
+    """
+
+    def __init__(self, sample_rate, channels, mode="random", key="C", scale="major", strength=1.0,
+                 note_hold=0.25, note_range=7, seed=None):
+        self.sample_rate = sample_rate
+        self.classes = scale_notes(key, scale)
+        self.mode = mode
+        self.strength = float(strength)
+        self.note_range = int(note_range)
+        self.hold = max(1, int(note_hold * sample_rate))
+        self.rng = np.random.default_rng(seed)
+        self.frame = _next_pow2(sample_rate * 0.04)
+        self.hop = self.frame // 4
+        self.lookahead = self.frame // 2 + self.hop
+        self.mono = np.zeros(self.frame, dtype=np.float32)
+        self.count = 0
+        self.next_pos = 0
+        # analysis centres and their ratios that later samples still interpolate between
+        self.centers, self.ratios = np.array([-float(self.frame + self.lookahead)]), np.array([1.0])
+        self.segment, self.offset = -1, 0
+        self.window = max(64, int(WINDOW_SECONDS * sample_rate))
+        self.history = np.zeros((self.window + 2, channels), dtype=np.float32)
+        self.phase = 0.0
+        self.delay = np.zeros((self.lookahead, channels), dtype=np.float32)
+        self.latency = self.skip = self.lookahead + self.window // 2 + 1
+
+    def _targets(self, midi, centers):
+        snapped = snap_to_scale(midi, self.classes)
+        if self.mode != "random":
+            return snapped
+        # one random scale step offset per hold segment, drawn in segment order
+        out = np.empty_like(snapped)
+        for i, (note, center) in enumerate(zip(snapped, centers)):
+            segment = int(center // self.hold)
+            if segment != self.segment:
+                self.segment = segment
+                self.offset = int(self.rng.integers(-self.note_range, self.note_range + 1))
+            out[i] = snap_to_scale(np.array(note + self.offset), self.classes)
+        return out
+
+    def _ratios(self, mono, n):
+        """Per-sample shift ratio for the n samples `lookahead` behind the end of mono."""
+        base = self.count
+        positions = np.arange(self.next_pos, base + n + 1, self.hop)
+        if len(positions):
+            frames = np.lib.stride_tricks.sliding_window_view(mono, self.frame)[positions - base]
+            freqs = detect_pitch(frames.astype(np.float64), self.sample_rate)
+            centers = (positions - self.frame // 2).astype(np.float64)
+            voiced = freqs > 0
+            ratios = np.ones(len(freqs))
+            if voiced.any():
+                midi = 69.0 + 12.0 * np.log2(freqs[voiced] / 440.0)
+                target = self._targets(midi, centers[voiced])
+                ratios[voiced] = np.clip(2.0 ** ((target - midi) * self.strength / 12.0), 0.5, 2.0)
+            self.next_pos = int(positions[-1]) + self.hop
+            self.centers = np.concatenate([self.centers, centers])
+            self.ratios = np.concatenate([self.ratios, ratios])
+        start = base - self.lookahead
+        out = np.interp(np.arange(start, start + n, dtype=np.float64), self.centers, self.ratios)
+        keep = max(0, int(np.searchsorted(self.centers, start + n, side="right")) - 1)
+        self.centers, self.ratios = self.centers[keep:], self.ratios[keep:]
+        return out
+
+    def _shift(self, block, ratio):
+        n = len(block)
+        size = len(self.history)
+        x = np.concatenate([self.history, block])
+        # read heads drift by (1 - ratio) samples per sample and wrap every window
+        phase = (self.phase - np.cumsum((ratio - 1.0) / self.window)) % 1.0
+        self.phase = float(phase[-1]) if n else self.phase
+        out = np.zeros_like(block)
+        for p in (phase, (phase + 0.5) % 1.0):
+            at = size + np.arange(n) - 1.0 - p * self.window
+            i = np.floor(at).astype(np.int64)
+            frac = (at - i).astype(np.float32)[:, None]
+            weight = (np.sin(np.pi * p) ** 2).astype(np.float32)[:, None]
+            out += (x[i] * (1.0 - frac) + x[i + 1] * frac) * weight
+        self.history = x[-size:]
+        return out
+
+    def process(self, block):
+        n = len(block)
+        if not n:
+            return block
+        mono = np.concatenate([self.mono, block.mean(axis=1)])
+        ratio = self._ratios(mono, n)
+        self.mono = mono[-self.frame:]
+        self.count += n
+        delayed = np.concatenate([self.delay, block])
+        self.delay = delayed[n:]
+        out = self._shift(delayed[:n], ratio)
+        if self.skip:
+            k = min(self.skip, n)
+            out, self.skip = out[k:], self.skip - k
+        return out
+
+    def flush(self):
+        """The last `latency` samples, pushed out with silence."""
+        return self.process(np.zeros((self.latency, self.history.shape[1]), dtype=np.float32))
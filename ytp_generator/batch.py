@@ -0,0 +1,141 @@
+"""
+Batch rendering: run many process_video jobs across a process pool.
+
+Jobs come from a JSON manifest or a glob of input files. Each job's ffmpeg calls
+get a -threads budget so that workers * threads stays within the CPU count.
+A failing job is reported and does not stop the rest of the batch. A job's own
+config is applied over the batch config.
+"""
+import glob
+import json
+import os
+import time
+from concurrent.futures import ProcessPoolExecutor, as_completed
+
+from . import processor
+
+def load_jobs(spec, output_dir=None, suffix="_ytp"):
+    """
+    Build a job list from spec.
+
+    spec: path to a JSON manifest, or a glob pattern of input files.
+    A manifest is a list (or {"jobs": [...]}) of objects with "input", optional
+    "output" and optional "config" (path to a JSON config or an inline dict).
+    Missing outputs are written to output_dir (default: next to the input) as
+    <name><suffix>.mp4.
+    """
+    if spec.lower().endswith(".json") and os.path.isfile(spec):
+        with open(spec, "r", encoding="utf-8") as f:
+            data = json.load(f)
+        entries = data.get("jobs", []) if isinstance(data, dict) else data
+        base = os.path.dirname(os.path.abspath(spec))
+    else:
+        entries = [{"input": p} for p in sorted(glob.glob(spec)) if os.path.isfile(p)]
+        base = os.getcwd()
+    jobs = []
+    for entry in entries:
+        inp = os.path.join(base, entry["input"])
+        out = entry.get("output")
+        if out:
+            out = os.path.join(base, out)
+        else:
+            stem = os.path.splitext(os.path.basename(inp))[0]
+            out = os.path.join(output_dir or os.path.dirname(inp), stem + suffix + ".mp4")
+        job_config = entry.get("config")
+        if isinstance(job_config, str):
+            with open(os.path.join(base, job_config), "r", encoding="utf-8") as f:
+                job_config = json.load(f)
+        jobs.append({"input": inp, "output": out, "config": job_config})
+    return jobs
+
+def plan_workers(workers=None, threads=None, cpu_count=None):
+    """
+    Split the CPU budget between concurrent jobs.
+    Returns (workers, threads_per_job) with workers * threads_per_job <= cpu_count
+    whenever either value is derived here.
+    """
+    cpu_count = cpu_count or os.cpu_count() or 1
+    if workers and threads:
+        return workers, threads
+    if workers:
+        return workers, max(1, cpu_count // workers)
+    if threads:
+        return max(1, cpu_count // threads), threads
+    # ffmpeg scales poorly past a few threads per encode; prefer more jobs
+    threads = min(4, cpu_count)
+    return max(1, cpu_count // threads), threads
+
+def merged_config(job, config, threads=None):
+    """Config of one job: the batch config with the job's own settings on top."""
+    merged = dict(config, **(job.get("config") or {}))
+    if threads:
+        merged["threads"] = threads
+    return merged
+
+def _run_job(job, config, threads, dry_run=False):
+    start = time.time()
+    result = {"input": job["input"], "output": job["output"], "ok": True, "error": None}
+    # dry runs report the commands they would run
+    messages = result["messages"] = [] if dry_run else None
+    try:
+        if os.path.dirname(job["output"]) and not dry_run:
+            os.makedirs(os.path.dirname(job["output"]), exist_ok=True)
+        processor.process_video(job["input"], job["output"], merged_config(job, config, threads), dry_run=dry_run,
+                                progress_callback=(lambda stage, total, msg: messages.append(msg)) if dry_run else None)
+    except Exception as e:
+        result["ok"] = False
+        result["error"] = f"{type(e).__name__}: {e}"
+    result["seconds"] = time.time() - start
+    return result
+
+def run_batch(jobs, config, workers=None, threads=None, progress_callback=None, dry_run=False):
+    """
+    Render all jobs (dry_run: only plan them, see processor.process_video) and return a report dict:
+    {"results": [...], "ok": n, "failed": n, "seconds": wall, "jobs_per_minute": x,
+     "input_mb_per_second": y, "workers": w, "threads": t}
+
+    progress_callback: optional callable(done, total, result) called as jobs finish.
+    """
+    workers, threads = plan_workers(workers, threads)
+    start = time.time()
+    results = []
+    with ProcessPoolExecutor(max_workers=workers) as pool:
+        futures = {pool.submit(_run_job, job, config, threads, dry_run): job for job in jobs}
+        for fut in as_completed(futures):
+            job = futures[fut]
+            try:
+                result = fut.result()
+            except Exception as e:
+                # worker process died (e.g. killed); keep going with the rest
+                result = {"input": job["input"], "output": job["output"], "ok": False, "error": f"{type(e).__name__}: {e}", "seconds": 0.0}
+            results.append(result)
+            if progress_callback:
+                progress_callback(len(results), len(jobs), result)
+    wall = time.time() - start
+    input_bytes = sum(os.path.getsize(r["input"]) for r in results if r["ok"] and os.path.isfile(r["input"]))
+    return {
+        "results": results,
+        "ok": sum(1 for r in results if r["ok"]),
+        "failed": sum(1 for r in results if not r["ok"]),
+        "seconds": wall,
+        "jobs_per_minute": (len(results) / wall * 60.0) if wall > 0 else 0.0,
+        "input_mb_per_second": (input_bytes / 1e6 / wall) if wall > 0 else 0.0,
+        "workers": workers,
+        "threads": threads,
+    }
+
+def format_report(report):
+    lines = []
+    for r in sorted(report["results"], key=lambda r: r["input"]):
+        status = "OK  " if r["ok"] else "FAIL"
+        line = f"{status} {r['seconds']:7.1f}s  {r['input']} -> {r['output']}"
+        if r["error"]:
+            line += f"  ({r['error']})"
+        lines.append(line)
+        lines.extend("    " + msg for msg in r.get("messages") or [])
+    lines.append(
+        f"{report['ok']} ok, {report['failed']} failed in {report['seconds']:.1f}s "
+        f"({report['jobs_per_minute']:.2f} jobs/min, {report['input_mb_per_second']:.2f} MB/s input, "
+        f"{report['workers']} workers x {report['threads']} threads)"
+    )
+    return "\n".join(lines)
@@ -0,0 +1,263 @@
+"""
+Benchmark suite: time every effect and the default chain on synthetic media.
+
+Inputs are generated locally with lavfi (testsrc2 video, sine audio) for each
+resolution and duration, together with a small set of synthetic assets (sounds,
+images, an overlay video) so the overlay effects have something to pick. Every
+case renders through processor.process_video with a fixed seed and the stage cache
+off, so runs differ only by the machine, ffmpeg and the code. Each case records
+its latency (median wall time of the runs), realtime factor (input seconds per
+wall second), CPU time and the peak RSS of its child processes (see profiling).
+
+Results are saved as JSON; compare() flags cases that got slower or bigger than a
+saved baseline by more than a tolerance. Run it with
+    python -m ytp_generator.benchmark --output bench.json [--baseline old.json]
+"""
+import argparse
+import json
+import os
+import platform
+import statistics
+import subprocess
+import sys
+import time
+
+from . import config as cfg, ffmpeg_cmds, processor, profiling, stage_cache
+
+# Effects with a real implementation in effects.build_effect_command
+EFFECTS = ("reverse", "speed_change", "invert_colors", "mirror", "earrape", "chorus", "vibrato", "sus_effect",
+           "random_sound_overlay", "rainbow_overlay", "explosion_spam", "frame_shuffle",
+           "meme_injection", "stutter", "random_cuts", "sentence_mix", "autotune_chaos")
+
+DEFAULT_SIZES = ((320, 240), (1280, 720))
+DEFAULT_DURATIONS = (5.0, 20.0)
+DEFAULT_SEED = 1234
+RESULTS_VERSION = 1
+
+# Relative slowdown (latency) or growth (peak RSS) reported as a regression
+DEFAULT_TOLERANCE = 0.15
+
+def synth_cmd(ffmpeg_path, width, height, duration, fps=25, frequency=440):
+    """
+    Deterministic test clip: testsrc2 video (H.264, 2s GOP) with a sine tone (AAC).
+    The output path is left off; _render appends it.
+    """
+    return ffmpeg_cmds.base_ffmpeg_cmd(ffmpeg_path) + [
+        "-f", "lavfi", "-i", f"testsrc2=size={width}x{height}:rate={fps}:duration={duration}",
+        "-f", "lavfi", "-i", f"sine=frequency={frequency}:sample_rate=44100:duration={duration}",
+        "-c:v", "libx264", "-preset", "veryfast", "-pix_fmt", "yuv420p", "-g", str(fps * 2),
+        "-c:a", "aac", "-b:a", "128k", "-shortest",
+    ]
+
+def _asset_cmds(ffmpeg_path, assets_dir):
+    base = ffmpeg_cmds.base_ffmpeg_cmd(ffmpeg_path)
+    sound = base + ["-f", "lavfi", "-i", "sine=frequency=880:sample_rate=44100:duration=1.5", "-c:a", "pcm_s16le"]
+    image = base + ["-f", "lavfi", "-i", "testsrc2=size=160x120:rate=1", "-frames:v", "1"]
+    return {
+        os.path.join(assets_dir, "sounds", "bench_tone.wav"): sound,
+        os.path.join(assets_dir, "memes_sounds", "bench_tone.wav"): sound,
+        os.path.join(assets_dir, "images", "bench_card.png"): image,
+        os.path.join(assets_dir, "memes", "bench_card.png"): image,
+        os.path.join(assets_dir, "overlays_videos", "bench_clip.mp4"): synth_cmd(ffmpeg_path, 160, 120, 2.0, frequency=660),
+    }
+
+def _render(cmd, path):
+    # write next to the target first so an interrupted run never leaves a half file behind
+    part = path + ".part" + os.path.splitext(path)[1]
+    subprocess.run(cmd + [part], check=True, stdin=subprocess.DEVNULL)
+    os.replace(part, path)
+
+def prepare(work_dir, ffmpeg_path, sizes=DEFAULT_SIZES, durations=DEFAULT_DURATIONS):
+    """
+    Generate the synthetic inputs and assets under work_dir (reused when present).
+    Returns a list of inputs: {"path", "width", "height", "duration"}.
+    """
+    assets_dir = os.path.join(work_dir, "assets")
+    for path, cmd in _asset_cmds(ffmpeg_path, assets_dir).items():
+        if not os.path.isfile(path):
+            os.makedirs(os.path.dirname(path), exist_ok=True)
+            _render(cmd, path)
+    inputs = []
+    for width, height in sizes:
+        for duration in durations:
+            path = os.path.join(work_dir, "inputs", f"testsrc2_{width}x{height}_{duration:g}s.mp4")
+            if not os.path.isfile(path):
+                os.makedirs(os.path.dirname(path), exist_ok=True)
+                _render(synth_cmd(ffmpeg_path, width, height, duration), path)
+            inputs.append({"path": path, "width": width, "height": height, "duration": duration})
+    return inputs
+
+def default_chain():
+    """The default effect chain with every enabled effect forced to run."""
+    return [dict(e, probability=1.0) for e in cfg.default_config()["effect_chain"] if e.get("enabled", True)]
+
+def bench_config(work_dir, ffmpeg_path, mode="stages"):
+    config = cfg.default_config()
+    config.update(ffmpeg_path=ffmpeg_path, assets_dir=os.path.join(work_dir, "assets"),
+                  cache_dir=os.path.join(work_dir, "cache"), execution_mode=mode, stage_cache=False)
+    return config
+
+def run_case(name, chain, source, config, repeats=3, seed=DEFAULT_SEED):
+    """Render chain on source repeats times; returns the case's result dict."""
+    out_dir = os.path.join(os.path.dirname(os.path.dirname(source["path"])), "outputs")
+    os.makedirs(out_dir, exist_ok=True)
+    output = os.path.join(out_dir, f"{name}_{os.path.basename(source['path'])}")
+    walls, cpus, rss, stages = [], [], [], None
+    for _ in range(repeats):
+        profile = profiling.Profile(name)
+        processor.process_video(source["path"], output, dict(config, effect_chain=chain), seed=seed, profile=profile)
+        report = profile.report()
+        totals = report["totals"]
+        walls.append(report["wall"])
+        if totals["cpu_user"] is not None:
+            cpus.append(totals["cpu_user"] + (totals["cpu_system"] or 0.0))
+        if totals["max_rss"]:
+            rss.append(totals["max_rss"])
+        stages = [s["label"] for s in report["stages"]]
+    latency = statistics.median(walls)
+    return {
+        "case": f"{name}@{source['width']}x{source['height']}x{source['duration']:g}s",
+        "name": name, "width": source["width"], "height": source["height"], "duration": source["duration"],
+        "runs": repeats, "latency": latency, "min_latency": min(walls),
+        "realtime": source["duration"] / latency if latency > 0 else None,
+        "cpu": statistics.median(cpus) if cpus else None,
+        "max_rss": max(rss) if rss else None,
+        "stages": stages,
+    }
+
+def run(work_dir, ffmpeg_path="ffmpeg", sizes=DEFAULT_SIZES, durations=DEFAULT_DURATIONS, effects=None,
+        mode="stages", repeats=3, seed=DEFAULT_SEED, progress_callback=None):
+    """
+    Benchmark each effect in effects (default: EFFECTS) and the default chain on
+    every synthetic input. progress_callback: optional callable(done, total, result).
+    Returns the results document saved by save().
+    """
+    processor.ensure_ffmpeg(ffmpeg_path)
+    inputs = prepare(work_dir, ffmpeg_path, sizes, durations)
+    config = bench_config(work_dir, ffmpeg_path, mode)
+    cases = [(name, [{"name": name, "enabled": True, "probability": 1.0}]) for name in (effects or EFFECTS)]
+    cases.append(("default_chain", default_chain()))
+    total = len(cases) * len(inputs)
+    results = []
+    for source in inputs:
+        for name, chain in cases:
+            try:
+                result = run_case(name, chain, source, config, repeats, seed)
+            except Exception as e:
+                # one broken effect should not hide the numbers of the others
+                result = {"case": f"{name}@{source['width']}x{source['height']}x{source['duration']:g}s",
+                          "name": name, "error": f"{type(e).__name__}: {e}"}
+            results.append(result)
+            if progress_callback:
+                progress_callback(len(results), total, result)
+    return {
+        "version": RESULTS_VERSION, "created": time.time(), "ffmpeg": stage_cache.ffmpeg_version(ffmpeg_path),
+        "platform": platform.platform(), "python": platform.python_version(), "cpu_count": os.cpu_count(),
+        "mode": mode, "seed": seed, "repeats": repeats, "results": results,
+    }
+
+def save(doc, path):
+    with open(path, "w", encoding="utf-8") as f:
+        json.dump(doc, f, indent=2)
+
+def load(path):
+    with open(path, "r", encoding="utf-8") as f:
+        doc = json.load(f)
+    if doc.get("version") != RESULTS_VERSION:
+        raise ValueError(f"Unsupported benchmark results version {doc.get('version')!r} in {path}")
+    return doc
+
+def compare(doc, baseline, tolerance=DEFAULT_TOLERANCE):
+    """
+    Compare results with a baseline document. Returns a list of regressions:
+    {"case", "metric", "baseline", "current", "change"} where change is relative
+    (0.2 = 20% worse). Cases missing from either side or failed in the baseline
+    are skipped; a case that fails now but passed in the baseline is a regression.
+    """
+    old = {r["case"]: r for r in baseline["results"] if "error" not in r}
+    regressions = []
+    for r in doc["results"]:
+        base = old.get(r["case"])
+        if base is None:
+            continue
+        if "error" in r:
+            regressions.append({"case": r["case"], "metric": "error", "baseline": None, "current": r["error"], "change": None})
+            continue
+        for metric in ("latency", "max_rss"):
+            if not base.get(metric) or r.get(metric) is None:
+                continue
+            change = r[metric] / base[metric] - 1.0
+            if change > tolerance:
+                regressions.append({"case": r["case"], "metric": metric, "baseline": base[metric],
+                                    "current": r[metric], "change": change})
+    return regressions
+
+def format_results(doc):
+    lines = [f"{doc['ffmpeg'] or 'ffmpeg (unknown version)'}, mode {doc['mode']}, {doc['repeats']} runs per case",
+             "latency s  realtime  cpu s  rss MB  case"]
+    for r in doc["results"]:
+        if "error" in r:
+            lines.append(f"{'FAILED':>9}  {r['case']}  ({r['error']})")
+            continue
+        realtime = f"{r['realtime']:7.2f}x" if r["realtime"] else "       -"
+        cpu = f"{r['cpu']:6.2f}" if r["cpu"] is not None else "     -"
+        rss = f"{r['max_rss'] / 1048576:6.1f}" if r["max_rss"] else "     -"
+        lines.append(f"{r['latency']:9.2f} {realtime} {cpu} {rss}  {r['case']}")
+    return "\n".join(lines)
+
+def format_regressions(regressions):
+    lines = []
+    for g in regressions:
+        if g["metric"] == "error":
+            lines.append(f"REGRESSION {g['case']}: now fails ({g['current']})")
+        else:
+            lines.append(f"REGRESSION {g['case']}: {g['metric']} {g['baseline']:.4g} -> {g['current']:.4g} (+{g['change'] * 100:.0f}%)")
+    return "\n".join(lines)
+
+def _parse_sizes(text):
+    sizes = []
+    for item in text.split(","):
+        w, _, h = item.strip().lower().partition("x")
+        sizes.append((int(w), int(h)))
+    return sizes
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Benchmark the effects and the default chain on synthetic media")
+    parser.add_argument("--ffmpeg", default="ffmpeg")
+    parser.add_argument("--work-dir", default=os.path.join(".ytp_cache", "benchmark"), help="Inputs, assets and outputs (inputs are reused)")
+    parser.add_argument("--sizes", default=",".join(f"{w}x{h}" for w, h in DEFAULT_SIZES), help="Comma separated WxH list")
+    parser.add_argument("--durations", default=",".join(f"{d:g}" for d in DEFAULT_DURATIONS), help="Comma separated seconds")
+    parser.add_argument("--effects", help="Comma separated effect names (default: all)")
+    parser.add_argument("--mode", choices=processor.EXECUTION_MODES, default="stages")
+    parser.add_argument("--repeats", type=int, default=3, help="Runs per case; latency is the median")
+    parser.add_argument("--seed", type=int, default=DEFAULT_SEED)
+    parser.add_argument("--output", help="Write results JSON here")
+    parser.add_argument("--baseline", help="Results JSON to compare against; exits 1 on regressions")
+    parser.add_argument("--tolerance", type=float, default=DEFAULT_TOLERANCE, help="Allowed relative slowdown / memory growth")
+    args = parser.parse_args(argv)
+    effects = [e.strip() for e in args.effects.split(",")] if args.effects else None
+    durations = [float(d) for d in args.durations.split(",")]
+
+    def on_case(done, total, result):
+        status = "FAIL" if "error" in result else f"{result['latency']:.2f}s"
+        print(f"[{done}/{total}] {result['case']} {status}", flush=True)
+    try:
+        doc = run(os.path.abspath(args.work_dir), args.ffmpeg, _parse_sizes(args.sizes), durations, effects,
+                  args.mode, args.repeats, args.seed, progress_callback=on_case)
+    except (OSError, subprocess.CalledProcessError) as e:
+        print(f"benchmark: {e}", file=sys.stderr)
+        return 2
+    print(format_results(doc))
+    if args.output:
+        save(doc, args.output)
+        print(f"Results: {args.output}")
+    if args.baseline:
+        regressions = compare(doc, load(args.baseline), args.tolerance)
+        if regressions:
+            print(format_regressions(regressions))
+            return 1
+        print(f"No regressions against {args.baseline} (tolerance {args.tolerance * 100:.0f}%)")
+    return 0
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,90 @@
+"""
+Parallel chunked rendering of per-frame effects.
+
+Effects that treat every frame and audio sample on its own (invert_colors, mirror,
+earrape; see effects.PER_FRAME_EFFECTS) give the same result
+whether a clip is rendered whole or in pieces. This tool splits the input at
+keyframes, renders every chunk through the fused filter fragments in its own ffmpeg
+process (several at a time) and joins the chunks with the concat demuxer, so a long
+clip uses every core instead of one encoder's worth of threads.
+
+Chunks start on keyframes, so seeking decodes nothing before the chunk. Their audio
+is cut sample-accurately at the same instants as the video and kept as PCM, and the
+join stream-copies the video and encodes the audio once, so the seams have no gaps
+or encoder priming delays.
+
+Run as a tool: python -m ytp_generator.chunked_render --input in.mp4 --output out.mp4 --fragments '[...]' --starts 0,9.6,..
+(effects.build_parallel_command builds this command line).
+"""
+import argparse
+import bisect
+import json
+import os
+import shutil
+import subprocess
+import sys
+from concurrent.futures import ThreadPoolExecutor
+
+from . import ffmpeg_cmds
+
+def plan_chunks(keyframes, duration, chunks, min_length=2.0):
+    """
+    Start times of up to `chunks` pieces of [0, duration): the keyframes nearest to
+    an even split, keeping every piece at least min_length long. Starts with 0.0.
+    """
+    starts = [0.0]
+    for i in range(1, chunks):
+        target = duration * i / chunks
+        j = bisect.bisect_left(keyframes, target)
+        near = keyframes[max(0, j - 1):j + 1]
+        if not near:
+            continue
+        k = min(near, key=lambda t: abs(t - target))
+        if k - starts[-1] >= min_length and duration - k >= min_length:
+            starts.append(k)
+    return starts
+
+def run(ffmpeg_path, input_path, output_path, fragments, starts, workers=None, threads=None):
+    lengths = [b - a for a, b in zip(starts, starts[1:])] + [None]
+    workers = max(1, min(workers or os.cpu_count() or 1, len(starts)))
+    # one encoder per chunk: give each an even share of the threads instead of all of them
+    per_chunk = max(1, (threads or os.cpu_count() or 1) // workers)
+    parts_dir = os.path.splitext(output_path)[0] + "_par"
+    os.makedirs(parts_dir, exist_ok=True)
+    try:
+        files = [os.path.join(parts_dir, f"chunk_{i:04d}.mkv") for i in range(len(starts))]
+        cmds = [
+            ffmpeg_cmds.with_threads(ffmpeg_cmds.build_chunk_cmd(ffmpeg_path, input_path, path, fragments, start, length), per_chunk)
+            for start, length, path in zip(starts, lengths, files)
+        ]
+        with ThreadPoolExecutor(max_workers=workers) as pool:
+            # list() re-raises the first failure after all submitted chunks finish
+            list(pool.map(lambda cmd: subprocess.run(cmd, stdin=subprocess.DEVNULL, check=True), cmds))
+        list_file = os.path.join(parts_dir, "concat_list.txt")
+        with open(list_file, "w", encoding="utf-8") as f:
+            for p in files:
+                f.write(f"file '{p}'\n")
+        subprocess.run(ffmpeg_cmds.with_threads(ffmpeg_cmds.build_concat_cmd(ffmpeg_path, list_file, output_path), threads), check=True)
+    finally:
+        shutil.rmtree(parts_dir, ignore_errors=True)
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Render per-frame effects on keyframe-aligned chunks in parallel")
+    parser.add_argument("--ffmpeg", default="ffmpeg")
+    parser.add_argument("--input", required=True)
+    parser.add_argument("--output", required=True)
+    parser.add_argument("--fragments", required=True, help="JSON list of filter fragments (see ffmpeg_cmds)")
+    parser.add_argument("--starts", required=True, help="Comma-separated chunk start times (seconds, on keyframes)")
+    parser.add_argument("--workers", type=int, help="Chunks rendered at the same time (default: CPU count)")
+    parser.add_argument("--threads", type=int)
+    args = parser.parse_args(argv)
+    try:
+        run(args.ffmpeg, args.input, args.output, json.loads(args.fragments),
+            [float(s) for s in args.starts.split(",")], workers=args.workers, threads=args.threads)
+    except subprocess.CalledProcessError as e:
+        print(f"chunked_render: {e}", file=sys.stderr)
+        return 1
+    return 0
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,89 @@
+"""
+Chunked reverse for long inputs.
+
+ffmpeg's reverse/areverse filters buffer the whole decoded clip. This tool splits
+the input into chunks of `chunk` seconds, reverses every chunk in its own ffmpeg
+process (several at a time) and concatenates the reversed chunks last-to-first,
+so peak memory is bounded by the chunk length times the number of workers.
+
+Chunks are written as H.264 + PCM in Matroska next to the output; the final concat
+stream-copies the video and encodes the audio once, so chunk joins are gapless.
+
+Run as a tool: python -m ytp_generator.chunked_reverse --input in.mp4 --output out.mp4 ...
+(effects.build_effect_command builds this command line).
+"""
+import argparse
+import os
+import shutil
+import subprocess
+import sys
+from concurrent.futures import ThreadPoolExecutor
+
+from . import ffmpeg_cmds
+
+# Chunks reversed at the same time by default; each holds a decoded chunk in memory
+DEFAULT_WORKERS = 3
+
+def plan_chunks(duration, chunk, fps=0.0):
+    """
+    Return (start, length) pairs covering [0, duration). Chunk boundaries are
+    rounded to whole frames when fps is known; length None runs to the end.
+    """
+    if fps > 0:
+        chunk = max(1, round(chunk * fps)) / fps
+    chunks = []
+    start = 0.0
+    while duration - start > 1e-3:
+        length = chunk if start + chunk < duration - 1e-3 else None
+        chunks.append((round(start, 6), length))
+        if length is None:
+            break
+        start += chunk
+    return chunks
+
+def run(ffmpeg_path, input_path, output_path, duration, chunk=10.0, fps=0.0, workers=None, threads=None):
+    chunks = plan_chunks(duration, chunk, fps)
+    # an explicit thread budget also bounds the default number of workers
+    workers = max(1, min(workers or min(DEFAULT_WORKERS, threads or DEFAULT_WORKERS), len(chunks)))
+    # split an explicit thread budget between the concurrent chunk encodes
+    per_chunk = max(1, threads // workers) if threads else None
+    parts_dir = os.path.splitext(output_path)[0] + "_rev"
+    os.makedirs(parts_dir, exist_ok=True)
+    try:
+        files = [os.path.join(parts_dir, f"chunk_{i:04d}.mkv") for i in range(len(chunks))]
+        cmds = [
+            ffmpeg_cmds.with_threads(ffmpeg_cmds.build_reverse_chunk_cmd(ffmpeg_path, input_path, path, start, length), per_chunk)
+            for (start, length), path in zip(chunks, files)
+        ]
+        with ThreadPoolExecutor(max_workers=workers) as pool:
+            # list() re-raises the first failure after all submitted chunks finish
+            list(pool.map(lambda cmd: subprocess.run(cmd, check=True), cmds))
+        list_file = os.path.join(parts_dir, "concat_list.txt")
+        with open(list_file, "w", encoding="utf-8") as f:
+            for p in reversed(files):
+                f.write(f"file '{p}'\n")
+        subprocess.run(ffmpeg_cmds.with_threads(ffmpeg_cmds.build_concat_cmd(ffmpeg_path, list_file, output_path), threads), check=True)
+    finally:
+        shutil.rmtree(parts_dir, ignore_errors=True)
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Reverse a clip in parallel chunks with bounded memory")
+    parser.add_argument("--ffmpeg", default="ffmpeg")
+    parser.add_argument("--input", required=True)
+    parser.add_argument("--output", required=True)
+    parser.add_argument("--duration", type=float, required=True)
+    parser.add_argument("--chunk", type=float, default=10.0, help="Chunk length in seconds")
+    parser.add_argument("--fps", type=float, default=0.0, help="Frame rate, to cut chunks on frame boundaries")
+    parser.add_argument("--workers", type=int, help=f"Chunks reversed at the same time (default: {DEFAULT_WORKERS}, at most --threads)")
+    parser.add_argument("--threads", type=int)
+    args = parser.parse_args(argv)
+    try:
+        run(args.ffmpeg, args.input, args.output, args.duration, chunk=args.chunk, fps=args.fps,
+            workers=args.workers, threads=args.threads)
+    except subprocess.CalledProcessError as e:
+        print(f"chunked_reverse: {e}", file=sys.stderr)
+        return 1
+    return 0
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -10,15 +10,28 @@ def default_config():
     return {
         "ffmpeg_path": "ffmpeg",  # set to full path to ffmpeg.exe if needed
         "assets_dir": os.path.join(here, "assets"),
+        "cache_dir": os.path.join(here, ".ytp_cache"),  # probe cache and other persistent caches
+        "execution_mode": "stages",  # "stages", "fused" (single filtergraph), "streamed" (piped stages) or "parallel"
+        "parallel_workers": 0,  # parallel mode: chunks rendered at the same time (0: CPU count)
+        "parallel_min_chunk": 2.0,  # parallel mode: shortest chunk in seconds
+        "stage_cache": False,  # reuse stage outputs of reruns with the same seed/plan
+        "stage_cache_mb": 2048,  # least recently used stages are evicted above this size
+        "ram_temp_dir": "auto",  # RAM-backed dir for stage files ("auto": /dev/shm if present, "": none)
+        "ram_temp_mb": 1024,  # per-job RAM budget; further stage files spill to temp_dir
+        "temp_dir": "",  # on-disk temp dir ("": system default)
+        "audio_engine": True,  # stages mode: run consecutive audio-only effects in one NumPy pass
+        "preview_height": 240,  # proxy size and frame rate for --preview renders
+        "preview_fps": 12,
         "effect_chain": [
+            {"name": "sentence_mix", "enabled": False, "probability": 0.3, "max_snippets": 12, "max_words": 3},
             {"name": "random_sound_overlay", "enabled": True, "probability": 0.9, "max_sounds": 2},
-            {"name": "reverse", "enabled": True, "probability": 0.15},
+            {"name": "reverse", "enabled": True, "probability": 0.15, "chunk_seconds": 10.0},
             {"name": "speed_change", "enabled": True, "probability": 0.5, "min_factor": 0.25, "max_factor": 3.0},
             {"name": "chorus", "enabled": True, "probability": 0.25, "level": 0.8},
             {"name": "vibrato", "enabled": True, "probability": 0.2, "depth": 0.8},
-            {"name": "stutter", "enabled": True, "probability": 0.3, "max_repeats": 6},
+            {"name": "stutter", "enabled": True, "probability": 0.3, "max_repeats": 6, "word_aligned": False},
             {"name": "earrape", "enabled": True, "probability": 0.05, "gain_db": 20},
-            {"name": "autotune_chaos", "enabled": False, "probability": 0.1},
+            {"name": "autotune_chaos", "enabled": False, "probability": 0.1, "mode": "random", "scale": "major"},
             {"name": "dance_squidward", "enabled": True, "probability": 0.25},
             {"name": "invert_colors", "enabled": True, "probability": 0.15},
             {"name": "rainbow_overlay", "enabled": True, "probability": 0.25},
@@ -27,6 +40,7 @@ def default_config():
             {"name": "explosion_spam", "enabled": True, "probability": 0.12},
             {"name": "frame_shuffle", "enabled": True, "probability": 0.2},
             {"name": "meme_injection", "enabled": True, "probability": 0.4},
-            {"name": "random_cuts", "enabled": True, "probability": 0.8, "min_cuts": 2, "max_cuts": 8}
+            {"name": "random_cuts", "enabled": True, "probability": 0.8, "min_cuts": 2, "max_cuts": 8,
+             "word_aligned": False}
         ]
     }
\ No newline at end of file
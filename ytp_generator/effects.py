@@ -1,21 +1,276 @@
 """
 High level effect orchestration: choose ffmpeg command builders and implement operations
-that require multi-step file ops (random cuts, stutter, etc.).
+that require multi-step file ops (random cuts) or media info (stutter, vibrato).
 """
+import bisect
+import json
 import os
 import random
-import shutil
-import tempfile
-import subprocess
 
-from . import ffmpeg_cmds, assets, utils
+from . import ffmpeg_cmds, assets, overlay_cache, probe, segments, sound_bank, utils
+
+def _pick_speed_factor(effect_conf, rng=random):
+    return rng.uniform(effect_conf.get("min_factor", 0.5), effect_conf.get("max_factor", 2.0))
+
+def _pick_sus_ratio(effect_conf, rng=random):
+    return rng.uniform(effect_conf.get("min_ratio", 0.7), effect_conf.get("max_ratio", 1.4))
+
+def _pick_sounds(effect_conf, global_config, rng=random):
+    index = assets.get_index(global_config)
+    return index.sample(["sounds", "memes_sounds"], k=effect_conf.get("max_sounds", 1), rng=rng)
+
+def _pick_overlay_offsets(effect_conf, sounds, duration, global_config, rng=random):
+    """Random start time of each sound, keeping it inside the clip where it fits (random_offset=False: 0)."""
+    if not effect_conf.get("random_offset", True) or not duration:
+        return [0.0] * len(sounds)
+    index = assets.get_index(global_config, refresh=False)
+    offsets = []
+    for path in sounds:
+        info = index.info(path)
+        length = (info or {}).get("duration") or 0.0
+        offsets.append(round(rng.uniform(0.0, max(0.0, duration - length)), 6))
+    return offsets
+
+def _pick_overlay_image(global_config, rng=random):
+    return assets.get_index(global_config).choice(["images", "memes"], rng)
+
+def _pick_explosions(effect_conf, duration, global_config, rng=random):
+    """
+    Return (videos, instances): up to max_videos overlay videos and 2..max_repeats
+    instances, each {"video": index, "start": seconds, "x": 0..1, "y": 0..1}.
+    Videos no instance uses are dropped. ([], []) when there are no overlay videos.
+    """
+    picks = assets.get_index(global_config).sample(["overlays_videos"], k=effect_conf.get("max_videos", 3), rng=rng)
+    if not picks:
+        return [], []
+    latest = max(0.0, (duration or 0.0) - 0.5)
+    instances = [{"video": rng.randrange(len(picks)), "start": round(rng.uniform(0.0, latest), 6),
+                  "x": round(rng.random(), 4), "y": round(rng.random(), 4)}
+                 for _ in range(rng.randint(2, effect_conf.get("max_repeats", 6)))]
+    used = sorted({inst["video"] for inst in instances})
+    for inst in instances:
+        inst["video"] = used.index(inst["video"])
+    return [picks[i] for i in used], instances
+
+def _pick_meme(global_config, rng=random):
+    """Return (image, sound); either may be None."""
+    index = assets.get_index(global_config)
+    return index.choice(["memes", "images"], rng), index.choice(["memes_sounds", "sounds"], rng)
+
+def _pick_stutter_points(effect_conf, duration, rng=random, words=None):
+    """
+    Pick up to stutter_points random positions at least sample_length apart and a
+    repeat count for each. With words (see segments) the positions are word starts.
+    Returns (points, repeat_counts).
+    """
+    length = effect_conf.get("sample_length", 0.2)
+    if duration < 3 * length:
+        return [], []
+    wanted = rng.randint(1, effect_conf.get("stutter_points", 3))
+    starts = [w[0] for w in words or [] if length <= w[0] <= duration - 2 * length]
+    if starts:
+        picks = rng.sample(starts, min(wanted, len(starts)))
+    else:
+        picks = [rng.uniform(length, duration - 2 * length) for _ in range(wanted)]
+    points = []
+    for t in sorted(picks):
+        if not points or t - points[-1] >= length:
+            points.append(round(t, 6))
+    return points, [rng.randint(2, effect_conf.get("max_repeats", 5)) for _ in points]
+
+def _pick_cut_times(effect_conf, duration, rng=random, words=None):
+    """
+    Return (cut_times, piece_order): random cut points and the order to play the
+    pieces in. With words (see segments) the cuts fall in the pauses between words.
+    """
+    cuts = rng.randint(effect_conf.get("min_cuts", 2), effect_conf.get("max_cuts", 6))
+    bounds = [t for t in segments.boundaries(words or []) if 0.0 < t < duration]
+    if bounds:
+        times = sorted(rng.sample(bounds, min(cuts - 1, len(bounds))))
+    else:
+        times = sorted(round(rng.uniform(0.0, duration), 6) for _ in range(cuts - 1))
+    order = list(range(len(times) + 1))
+    rng.shuffle(order)
+    return times, order
+
+def _pick_snippets(effect_conf, words, duration, rng=random):
+    """
+    Sentence mixing: min_snippets..max_snippets snippets of 1..max_words consecutive
+    words of one phrase, padded by `pad` seconds; with repeat_chance a snippet is the
+    previous one again. Returns [[start, end], ..] ([] when there are no words).
+    """
+    if not words:
+        return []
+    pad = effect_conf.get("pad", 0.02)
+    snippets = []
+    for _ in range(rng.randint(effect_conf.get("min_snippets", 4), effect_conf.get("max_snippets", 12))):
+        if snippets and rng.random() < effect_conf.get("repeat_chance", 0.3):
+            snippets.append(list(snippets[-1]))
+            continue
+        i = rng.randrange(len(words))
+        j = i
+        for _ in range(rng.randint(1, effect_conf.get("max_words", 3)) - 1):
+            if j + 1 >= len(words) or words[j + 1][2] != words[i][2]:
+                break
+            j += 1
+        snippets.append([round(max(0.0, words[i][0] - pad), 6), round(min(duration, words[j][1] + pad), 6)])
+    return snippets
+
+def _apply_order(pieces, order):
+    """Sort pieces by their position in order (a permutation of piece indices)."""
+    rank = {i: r for r, i in enumerate(order)}
+    return [p for _, p in sorted(enumerate(pieces), key=lambda e: rank.get(e[0], len(rank) + e[0]))]
+
+# Effects whose random choices depend on the clip length at their point of the chain
+NEEDS_DURATION = ("stutter", "random_cuts", "random_sound_overlay", "explosion_spam", "sentence_mix")
+# Effects that can place their cuts on word boundaries from the segment index (see segments)
+WORD_ALIGNED = ("stutter", "random_cuts", "sentence_mix")
+
+def uses_words(effect_conf):
+    """Whether an effect needs the segment index: sentence_mix always, stutter and random_cuts with word_aligned."""
+    name = effect_conf["name"]
+    return name in WORD_ALIGNED and effect_conf.get("word_aligned", name == "sentence_mix")
+
+def resolve_effect(effect_conf, global_config, input_path=None, duration=None, rng=random, exact=False, words=None):
+    """
+    Return a copy of effect_conf with every random choice made and stored as a plain
+    parameter (speed factor, picked assets, stutter points, cut times, seeds), so the
+    effect can be built again with the same result, e.g. from a saved plan. Configs
+    that are already resolved are returned unchanged.
+    duration: clip length at this point of the chain (default: probed from input_path);
+    only the NEEDS_DURATION effects use it.
+    exact: keep random cut times as planned instead of snapping them to keyframes.
+    words: word segments of the clip at this point (see resolved_words; default:
+    the segment index of input_path); only the WORD_ALIGNED effects use them.
+    """
+    if effect_conf.get("resolved"):
+        return effect_conf
+    conf = dict(effect_conf, resolved=True)
+    name = conf["name"]
+    if name in NEEDS_DURATION and duration is None:
+        duration = probe.probe_media(input_path, global_config)["duration"] if input_path else 0.0
+    if name in WORD_ALIGNED:
+        if not uses_words(conf):
+            words = []
+        elif words is None:
+            words = source_words(input_path, global_config)
+    if name == "speed_change":
+        conf["factor"] = _pick_speed_factor(conf, rng)
+    elif name == "sus_effect":
+        conf["ratio"] = _pick_sus_ratio(conf, rng)
+    elif name == "random_sound_overlay":
+        conf["sounds"] = _pick_sounds(conf, global_config, rng)
+        conf["gains"] = [conf.get("volume", 1.0)] * len(conf["sounds"])
+        conf["offsets"] = _pick_overlay_offsets(conf, conf["sounds"], duration, global_config, rng)
+    elif name == "rainbow_overlay":
+        conf["image"] = _pick_overlay_image(global_config, rng)
+    elif name == "explosion_spam":
+        conf["videos"], conf["instances"] = _pick_explosions(conf, duration, global_config, rng)
+    elif name == "frame_shuffle":
+        conf.setdefault("seed", rng.getrandbits(32))
+    elif name == "autotune_chaos":
+        from .autotune import NOTE_NAMES
+        conf.setdefault("seed", rng.getrandbits(32))
+        if conf.get("key", "random") == "random":
+            conf["key"] = rng.choice(NOTE_NAMES)
+    elif name == "meme_injection":
+        conf["image"], conf["sound"] = _pick_meme(global_config, rng)
+        conf["sound_gain"] = conf.get("volume", 1.0)
+    elif name == "stutter":
+        conf["points"], conf["repeat_counts"] = _pick_stutter_points(conf, duration, rng, words)
+    elif name == "sentence_mix":
+        conf["snippets"] = _pick_snippets(conf, words, duration, rng)
+    elif name == "random_cuts":
+        conf["cut_times"], conf["piece_order"] = _pick_cut_times(conf, duration, rng, words)
+        if exact:
+            conf["snap_tolerance"] = 0.0
+    return conf
+
+def resolved_duration(effect_conf, duration):
+    """Clip length after a resolved effect; effects not handled here keep the length."""
+    name = effect_conf["name"]
+    if name == "speed_change":
+        return duration / effect_conf["factor"]
+    if name == "stutter":
+        length = effect_conf.get("sample_length", 0.2)
+        return duration + sum(length * r for r in effect_conf["repeat_counts"])
+    if name == "sentence_mix" and effect_conf["snippets"]:
+        return sum(b - a for a, b in effect_conf["snippets"])
+    return duration
+
+def source_words(input_path, global_config):
+    """Word segments of input_path from its cached segment index; [] without audio, numpy or analysis."""
+    if not input_path:
+        return []
+    try:
+        index = segments.segment_index(input_path, global_config)
+    except (ImportError, RuntimeError):
+        return []
+    return [list(w) for w in index["words"]] if index else []
+
+def _moved_words(words, pieces):
+    """Words that lie inside the (start, end) pieces, moved to where the pieces are played."""
+    starts = [w[0] for w in words]
+    phrases = 1 + max(w[2] for w in words)
+    out = []
+    at = 0.0
+    for n, (a, b) in enumerate(pieces):
+        for w in words[bisect.bisect_left(starts, a - 1e-3):bisect.bisect_right(starts, b)]:
+            if w[1] <= b + 1e-3:
+                out.append([round(w[0] - a + at, 6), round(w[1] - a + at, 6), n * phrases + w[2]])
+        at += b - a
+    return out
+
+def resolved_words(effect_conf, words, duration):
+    """
+    Word segments after a resolved effect, for word-aligned effects later in the
+    chain; duration is the clip length before it. Words the effect cuts apart are
+    dropped; effects not handled here keep the timing.
+    """
+    name = effect_conf["name"]
+    if not words:
+        return words
+    if name == "speed_change":
+        k = 1.0 / effect_conf["factor"]
+        return [[a * k, b * k, p] for a, b, p in words]
+    if name == "reverse":
+        return [[duration - b, duration - a, p] for a, b, p in reversed(words)]
+    if name == "stutter":
+        # each stutter point delays the rest of the clip by the repeated samples
+        length = effect_conf.get("sample_length", 0.2)
+        shifts = list(zip(effect_conf["points"], effect_conf["repeat_counts"]))
+        return [[a + s, b + s, p] for a, b, p in words if not any(a < t < b for t, _ in shifts)
+                for s in [sum(length * r for t, r in shifts if t <= a)]]
+    if name == "random_cuts":
+        return _moved_words(words, _cut_pieces(effect_conf, duration))
+    if name == "sentence_mix" and effect_conf["snippets"]:
+        return _moved_words(words, effect_conf["snippets"])
+    return words
+
+def _sample_rate(input_path, global_config, default=44100):
+    if not input_path:
+        return default
+    try:
+        return probe.probe_media(input_path, global_config)["sample_rate"] or default
+    except Exception:
+        return default
 
 def build_effect_command(ffmpeg_path, input_path, output_path, effect_conf, global_config):
+    effect_conf = resolve_effect(effect_conf, global_config, input_path)
     name = effect_conf["name"]
     if name == "reverse":
-        return ffmpeg_cmds.build_reverse_cmd(ffmpeg_path, input_path, output_path)
+        info = probe.probe_media(input_path, global_config)
+        if not _chunked_reverse(effect_conf, info["duration"]):
+            return ffmpeg_cmds.build_reverse_cmd(ffmpeg_path, input_path, output_path)
+        # long input: reverse chunks in parallel workers instead of buffering the whole clip
+        args = ["--ffmpeg", ffmpeg_path, "--input", input_path, "--output", output_path,
+                "--duration", info["duration"], "--chunk", effect_conf.get("chunk_seconds", 10.0),
+                "--fps", info["fps"]]
+        if effect_conf.get("workers"):
+            args += ["--workers", effect_conf["workers"]]
+        return utils.tool_cmd("chunked_reverse", args)
     if name == "speed_change":
-        factor = random.uniform(effect_conf.get("min_factor", 0.5), effect_conf.get("max_factor", 2.0))
+        factor = effect_conf["factor"]
         return ffmpeg_cmds.build_speed_cmd(ffmpeg_path, input_path, output_path, factor)
     if name == "invert_colors":
         return ffmpeg_cmds.build_invert_cmd(ffmpeg_path, input_path, output_path)
@@ -29,162 +284,446 @@ def build_effect_command(ffmpeg_path, input_path, output_path, effect_conf, glob
         return ffmpeg_cmds.build_chorus_cmd(ffmpeg_path, input_path, output_path, level)
     if name == "vibrato":
         depth = effect_conf.get("depth", 0.5)
-        return ffmpeg_cmds.build_vibrato_cmd(ffmpeg_path, input_path, output_path, depth)
+        sample_rate = _sample_rate(input_path, global_config)
+        return ffmpeg_cmds.build_vibrato_cmd(ffmpeg_path, input_path, output_path, depth, sample_rate)
+    if name == "sus_effect":
+        sample_rate = _sample_rate(input_path, global_config)
+        return ffmpeg_cmds.build_pitch_cmd(ffmpeg_path, input_path, output_path, effect_conf["ratio"], sample_rate)
     if name == "random_sound_overlay":
-        # find some sounds
-        base_assets = assets.list_assets(global_config.get("assets_dir", "assets"))
-        candidates = base_assets.get("sounds", []) + base_assets.get("memes_sounds", [])
-        picks = utils.pick_random_files(candidates, max_count=effect_conf.get("max_sounds", 1))
+        picks = effect_conf["sounds"]
         if not picks:
             # fallback: copy input to output (no change)
             return ["copy", input_path, output_path]
-        return ffmpeg_cmds.build_overlay_audio_cmd(ffmpeg_path, input_path, output_path, picks)
+        bank = sound_bank.get_bank(global_config)
+        return ffmpeg_cmds.build_overlay_audio_cmd(ffmpeg_path, input_path, output_path, [bank.ensure(p) for p in picks],
+                                                   _overlay_gains(effect_conf), effect_conf.get("offsets"), sound_bank.input_args())
     if name == "rainbow_overlay":
-        base_assets = assets.list_assets(global_config.get("assets_dir", "assets"))
-        overlays = base_assets.get("images", []) + base_assets.get("memes", [])
-        if not overlays:
+        pick = effect_conf["image"]
+        if not pick:
             return ["copy", input_path, output_path]
-        pick = random.choice(overlays)
-        return ffmpeg_cmds.build_overlay_image_cmd(ffmpeg_path, input_path, output_path, pick)
+        return ffmpeg_cmds.build_overlay_image_cmd(ffmpeg_path, input_path, output_path, _prepared_image(pick, input_path, global_config))
     if name == "explosion_spam":
-        base_assets = assets.list_assets(global_config.get("assets_dir", "assets"))
-        vids = base_assets.get("overlays_videos", [])
-        if not vids:
+        videos, instances = _explosions(effect_conf)
+        if not videos:
             return ["copy", input_path, output_path]
-        pick = random.choice(vids)
-        repeats = random.randint(2, effect_conf.get("max_repeats", 6))
-        return ffmpeg_cmds.build_explosion_spam_cmd(ffmpeg_path, input_path, output_path, pick, repeats=repeats)
+        overlays = _scaled_overlays(videos, effect_conf, input_path, global_config)
+        return ffmpeg_cmds.build_explosion_spam_cmd(ffmpeg_path, input_path, output_path, overlays, instances)
     if name == "frame_shuffle":
-        # simple scaffold that reduces fps; real shuffle would extract frames + reorder + re-encode
-        sample_rate = effect_conf.get("sample_rate", 15)
-        return ffmpeg_cmds.build_frame_shuffle_cmd(ffmpeg_path, input_path, output_path, sample_rate=sample_rate)
+        # NumPy engine in a child process: rawvideo pipe in, shuffled frames out
+        info = probe.probe_media(input_path, global_config)
+        if not info["has_video"]:
+            return ["copy", input_path, output_path]
+        seed = effect_conf["seed"]
+        return utils.tool_cmd("frame_shuffle", [
+            "--ffmpeg", ffmpeg_path, "--input", input_path, "--output", output_path,
+            "--width", info["width"], "--height", info["height"], "--fps", info["fps"] or 25.0,
+            "--window", effect_conf.get("window", 50), "--block", effect_conf.get("block", 1),
+            "--seed", seed, "--store", effect_conf.get("store", "ram"),
+        ])
     if name == "meme_injection":
-        base_assets = assets.list_assets(global_config.get("assets_dir", "assets"))
-        imgs = base_assets.get("memes", []) + base_assets.get("images", [])
-        sounds = base_assets.get("memes_sounds", []) + base_assets.get("sounds", [])
-        if not imgs and not sounds:
+        img, sound = effect_conf["image"], effect_conf["sound"]
+        if not img and not sound:
             return ["copy", input_path, output_path]
         # If both present: overlay image then overlay audio (two-step)
-        tmp = tempfile.mktemp(suffix=".mp4")
-        if imgs:
-            img = random.choice(imgs)
+        # next to the stage output, so it lives (and is cleaned up) with the job's temp files
+        tmp = os.path.splitext(output_path)[0] + "_meme.mp4"
+        if sound:
+            sound = sound_bank.get_bank(global_config).ensure(sound)
+            gains, args = [effect_conf.get("sound_gain", 1.0)], sound_bank.input_args()
+        if img:
+            img = _prepared_image(img, input_path, global_config)
             cmd1 = ffmpeg_cmds.build_overlay_image_cmd(ffmpeg_path, input_path, tmp, img, position="10:10")
-            return cmd1 if not sounds else ffmpeg_cmds.build_overlay_audio_cmd(ffmpeg_path, tmp, output_path, [random.choice(sounds)])
+            return cmd1 if not sound else [cmd1, ffmpeg_cmds.build_overlay_audio_cmd(ffmpeg_path, tmp, output_path, [sound], gains, input_args=args)]
         else:
             # only sound overlay
-            return ffmpeg_cmds.build_overlay_audio_cmd(ffmpeg_path, input_path, output_path, [random.choice(sounds)])
+            return ffmpeg_cmds.build_overlay_audio_cmd(ffmpeg_path, input_path, output_path, [sound], gains, input_args=args)
     if name == "stutter":
-        # Stutter loop: pick a short segment and repeat it several times
-        repeats = random.randint(2, effect_conf.get("max_repeats", 5))
-        return _build_stutter_cmd(ffmpeg_path, input_path, output_path, repeats=repeats)
+        # Stutter loops: repeat short samples at random points, all in one ffmpeg call
+        info = probe.probe_media(input_path, global_config)
+        frag = _stutter_filters(effect_conf, info["sample_rate"] or 44100)
+        if not frag:
+            return ["copy", input_path, output_path]
+        return ffmpeg_cmds.build_fused_cmd(ffmpeg_path, input_path, output_path, [frag])
     if name == "random_cuts":
-        return _build_random_cuts_cmd(ffmpeg_path, input_path, output_path, effect_conf)
+        return _build_random_cuts_cmd(ffmpeg_path, input_path, output_path, effect_conf, global_config)
+    if name == "sentence_mix":
+        if not effect_conf["snippets"]:
+            return ["copy", input_path, output_path]
+        frag = ffmpeg_cmds.sentence_mix_filters(effect_conf["snippets"])
+        return ffmpeg_cmds.build_fused_cmd(ffmpeg_path, input_path, output_path, [frag])
+    if name == "autotune_chaos":
+        # pitch correction only exists in the NumPy audio engine
+        return build_audio_engine_command(ffmpeg_path, input_path, output_path, [effect_conf], global_config)
     # placeholder/disabled features: return copy
     return ["copy", input_path, output_path]
 
-def _build_stutter_cmd(ffmpeg_path, input_path, output_path, repeats=4):
-    # This implementation uses ffmpeg to trim a 0.2s sample and concat it repeated times,
-    # then concatenate with original.
-    tmpdir = tempfile.mkdtemp(prefix="stutter_")
-    try:
-        # produce a small clip
-        sample = os.path.join(tmpdir, "sample.mp4")
-        # take first 0.2s (could be random)
-        cmd_trim = [ffmpeg_path, "-y", "-loglevel", "warning", "-i", input_path, "-ss", "0", "-t", "0.2", "-c:v", "libx264", "-preset", "veryfast", "-c:a", "aac", "-b:a", "192k", sample]
-        subprocess.run(cmd_trim, check=True)
-        list_file = os.path.join(tmpdir, "list.txt")
-        with open(list_file, "w", encoding="utf-8") as f:
-            for i in range(repeats):
-                f.write(f"file '{sample}'\n")
-        repeated = os.path.join(tmpdir, "repeated.mp4")
-        cmd_concat = [ffmpeg_path, "-y", "-loglevel", "warning", "-f", "concat", "-safe", "0", "-i", list_file, "-c", "copy", repeated]
-        subprocess.run(cmd_concat, check=True)
-        # now concat repeated with original
-        concat_list = os.path.join(tmpdir, "concat.txt")
-        with open(concat_list, "w", encoding="utf-8") as f:
-            f.write(f"file '{repeated}'\n")
-            f.write(f"file '{input_path}'\n")
-        cmd_final = [ffmpeg_path, "-y", "-loglevel", "warning", "-f", "concat", "-safe", "0", "-i", concat_list, "-c", "copy", output_path]
-        return cmd_final
-    finally:
-        # don't delete immediately; ffmpeg may still read files when returning command list
-        shutil.rmtree(tmpdir, ignore_errors=True)
-
-def _get_duration_with_ffprobe(ffprobe_path, input_path):
-    """Return duration in seconds using ffprobe. Raises subprocess.CalledProcessError on failure."""
-    cmd = [ffprobe_path, "-v", "error", "-select_streams", "v:0", "-show_entries", "format=duration", "-of", "default=noprint_wrappers=1:nokey=1", input_path]
-    proc = subprocess.run(cmd, stdout=subprocess.PIPE, stderr=subprocess.PIPE, text=True, check=True)
-    out = proc.stdout.strip()
-    try:
-        return float(out)
-    except Exception:
-        # As a fallback try parsing stderr for duration-like strings
-        raise ValueError(f"Could not parse duration from ffprobe output: {out!r}")
+# Effects that build_effect_filters cannot express as filter fragments; they
+# always run as their own stage through build_effect_command.
+UNFUSABLE_EFFECTS = {"frame_shuffle", "autotune_chaos"}
+# Effects without time dependencies: every frame/sample is filtered on its own, so
+# they can be rendered on chunks of the clip in parallel (see chunked_render).
+# Not rainbow_overlay: its overlay may be animated and would restart at every chunk.
+PER_FRAME_EFFECTS = {"invert_colors", "mirror", "earrape"}
 
-def _find_ffprobe(ffmpeg_path):
-    """Try to locate ffprobe. Prefer same directory as ffmpeg_path, then system PATH 'ffprobe'."""
-    # If ffmpeg_path is full path, check same dir for ffprobe
-    try:
-        ffmpeg_dir = os.path.dirname(os.path.abspath(ffmpeg_path))
-        candidate = os.path.join(ffmpeg_dir, "ffprobe")
-        candidate_exe = candidate + (".exe" if os.name == "nt" else "")
-        if os.path.isfile(candidate_exe):
-            return candidate_exe
-        # try 'ffprobe' on PATH
-        from shutil import which
-        wp = which("ffprobe")
-        if wp:
-            return wp
-    except Exception:
-        pass
-    # fallback to 'ffprobe' (may fail later if not installed)
-    return "ffprobe"
+def build_effect_filters(effect_conf, global_config, input_path=None, duration=None):
+    """
+    Fused-mode counterpart of build_effect_command: return the effect as a filter
+    fragment (see ffmpeg_cmds), {} when the effect is a no-op, or None when the
+    effect cannot be fused and has to run through build_effect_command instead.
+    input_path is only used for media info (e.g. sample rate) and may be the
+    source of the whole fused group; duration is the clip length at this point of
+    the chain (defaults to the probed duration of input_path).
+    """
+    name = effect_conf["name"]
+    if name in UNFUSABLE_EFFECTS:
+        return None
+    if name in NEEDS_DURATION:
+        if duration is None:
+            if not input_path:
+                return None
+            duration = probe.probe_media(input_path, global_config)["duration"]
+    effect_conf = resolve_effect(effect_conf, global_config, input_path, duration)
+    if name == "stutter":
+        return _stutter_filters(effect_conf, _sample_rate(input_path, global_config))
+    if name == "random_cuts":
+        return _reorder_filters(effect_conf, duration)
+    if name == "sentence_mix":
+        return ffmpeg_cmds.sentence_mix_filters(effect_conf["snippets"]) if effect_conf["snippets"] else {}
+    if name == "reverse":
+        if duration is None and input_path:
+            duration = probe.probe_media(input_path, global_config)["duration"]
+        if duration is not None and _chunked_reverse(effect_conf, duration):
+            return None
+        return ffmpeg_cmds.reverse_filters()
+    if name == "speed_change":
+        return ffmpeg_cmds.speed_filters(effect_conf["factor"])
+    if name == "invert_colors":
+        return ffmpeg_cmds.invert_filters()
+    if name == "mirror":
+        return ffmpeg_cmds.mirror_filters()
+    if name == "earrape":
+        return ffmpeg_cmds.earrape_filters(effect_conf.get("gain_db", 20))
+    if name == "chorus":
+        return ffmpeg_cmds.chorus_filters(effect_conf.get("level", 0.7))
+    if name == "vibrato":
+        return ffmpeg_cmds.vibrato_filters(effect_conf.get("depth", 0.5), _sample_rate(input_path, global_config))
+    if name == "sus_effect":
+        return ffmpeg_cmds.pitch_filters(effect_conf["ratio"], _sample_rate(input_path, global_config))
+    if name == "random_sound_overlay":
+        picks = effect_conf["sounds"]
+        if not picks:
+            return {}
+        bank = sound_bank.get_bank(global_config)
+        return ffmpeg_cmds.overlay_audio_filters([bank.ensure(p) for p in picks], _overlay_gains(effect_conf),
+                                                 effect_conf.get("offsets"), sound_bank.input_args())
+    if name == "rainbow_overlay":
+        pick = effect_conf["image"]
+        return ffmpeg_cmds.overlay_image_filters(_prepared_image(pick, input_path, global_config)) if pick else {}
+    if name == "explosion_spam":
+        videos, instances = _explosions(effect_conf)
+        if not videos:
+            return {}
+        return ffmpeg_cmds.explosion_spam_filters(_scaled_overlays(videos, effect_conf, input_path, global_config), instances)
+    if name == "meme_injection":
+        sound = effect_conf["sound"]
+        if sound:
+            sound = sound_bank.get_bank(global_config).ensure(sound)
+        image = effect_conf["image"]
+        if image:
+            image = _prepared_image(image, input_path, global_config)
+        return ffmpeg_cmds.meme_injection_filters(image, sound, effect_conf.get("sound_gain", 1.0),
+                                                  sound_bank.input_args())
+    # placeholder/disabled features: nothing to add to the graph
+    return {}
+
+def build_parallel_command(ffmpeg_path, input_path, output_path, fragments, global_config):
+    """
+    Render PER_FRAME_EFFECTS fragments on keyframe-aligned chunks of input_path in
+    parallel (see chunked_render): about two chunks per worker (parallel_workers,
+    default the CPU count), each at least parallel_min_chunk seconds (default 2).
+    Clips too short to split get a plain fused command.
+    """
+    info = probe.probe_media(input_path, global_config)
+    workers = global_config.get("parallel_workers") or os.cpu_count() or 1
+    starts = [0.0]
+    if info["has_video"]:
+        from .chunked_render import plan_chunks
+        keyframes = probe.keyframe_times(input_path, global_config)
+        starts = plan_chunks(keyframes, info["duration"], 2 * workers, global_config.get("parallel_min_chunk", 2.0))
+    if len(starts) < 2:
+        return ffmpeg_cmds.build_fused_cmd(ffmpeg_path, input_path, output_path, fragments)
+    return utils.tool_cmd("chunked_render", [
+        "--ffmpeg", ffmpeg_path, "--input", input_path, "--output", output_path,
+        "--fragments", json.dumps(fragments), "--starts", ",".join(f"{t:.6f}" for t in starts),
+        "--workers", min(workers, len(starts)),
+    ])
 
-def _build_random_cuts_cmd(ffmpeg_path, input_path, output_path, effect_conf):
+def is_audio_only(effect_conf):
+    """True when a resolved effect only changes the soundtrack (see audio_engine)."""
+    name = effect_conf["name"]
+    if name == "meme_injection":
+        return not effect_conf["image"] and bool(effect_conf["sound"])
+    return name in ("chorus", "vibrato", "earrape", "sus_effect", "random_sound_overlay", "autotune_chaos")
+
+def _overlay_gains(effect_conf):
+    # plans saved before per-sound gains had none
+    return effect_conf.get("gains") or [effect_conf.get("volume", 1.0)] * len(effect_conf["sounds"])
+
+def audio_ops(effect_conf, bank):
+    """
+    audio_engine operations of a resolved audio-only effect ([] for a no-op).
+    bank: the sound_bank.SoundBank that overlay sounds are mixed from.
+    """
+    name = effect_conf["name"]
+    if name == "earrape":
+        return [{"op": "gain", "db": effect_conf.get("gain_db", 20)}]
+    if name == "chorus":
+        in_gain, out_gain, delays, decays = ffmpeg_cmds.chorus_params(effect_conf.get("level", 0.7))
+        return [{"op": "echo", "in_gain": in_gain, "out_gain": out_gain, "delays": delays, "decays": decays}]
+    if name == "vibrato":
+        return [{"op": "resample", "ratio": ffmpeg_cmds.vibrato_ratio(effect_conf.get("depth", 0.5))}]
+    if name == "sus_effect":
+        return [{"op": "resample", "ratio": effect_conf["ratio"]}]
+    if name == "random_sound_overlay":
+        offsets = effect_conf.get("offsets") or [0.0] * len(effect_conf["sounds"])
+        sounds = [{"pcm": bank.ensure(p), "gain": g, "offset": o}
+                  for p, g, o in zip(effect_conf["sounds"], _overlay_gains(effect_conf), offsets)]
+        return [{"op": "mix", "sounds": sounds}] if sounds else []
+    if name == "autotune_chaos":
+        op = {"op": "autotune", "key": effect_conf["key"], "seed": effect_conf["seed"]}
+        op.update({k: effect_conf[k] for k in ("mode", "scale", "strength", "note_hold", "note_range") if k in effect_conf})
+        return [op]
+    if name == "meme_injection":
+        return [{"op": "mix", "sounds": [{"pcm": bank.ensure(effect_conf["sound"]), "gain": effect_conf.get("sound_gain", 1.0)}]}]
+    raise ValueError(f"{name} is not an audio-only effect")
+
+def build_audio_engine_command(ffmpeg_path, input_path, output_path, effect_confs, global_config):
+    """
+    One audio_engine pass for a run of audio-only effects: decode the soundtrack
+    once at its real sample rate, apply all of them with NumPy, remux with the
+    video stream-copied.
+    """
+    effect_confs = [resolve_effect(e, global_config, input_path) for e in effect_confs]
+    bank = sound_bank.get_bank(global_config)
+    ops = [op for e in effect_confs for op in audio_ops(e, bank)]
+    info = probe.probe_media(input_path, global_config)
+    if not ops or not info["has_audio"]:
+        return ["copy", input_path, output_path]
+    return utils.tool_cmd("audio_engine", [
+        "--ffmpeg", ffmpeg_path, "--input", input_path, "--output", output_path,
+        "--ops", json.dumps(ops), "--sample-rate", info["sample_rate"] or 44100,
+        "--channels", info["channels"] or 2,
+    ])
+
+def _explosions(effect_conf):
+    """(videos, instances) of a resolved explosion_spam; plans from before instances get one at 0."""
+    if "instances" in effect_conf:
+        return effect_conf["videos"], effect_conf["instances"]
+    video = effect_conf.get("video")
+    return ([video], [{"video": 0, "start": 0.0, "x": 0.0, "y": 0.0}]) if video else ([], [])
+
+def _clip_geometry(input_path, global_config):
+    """(height, pix_fmt) of the clip overlays are composited on; (0, None) when unknown."""
+    if not input_path:
+        return 0, None
+    info = probe.probe_media(input_path, global_config)
+    return info["height"], info["pix_fmt"]
+
+def _image_height(image_height, frame_height):
+    # images keep their size unless they are taller than the frame
+    return overlay_cache.even(frame_height) if image_height and image_height > frame_height else None
+
+def _prepared_image(image, input_path, global_config):
+    """Overlay image/GIF converted for the clip (see overlay_cache); as-is if the clip is unknown."""
+    height, pix_fmt = _clip_geometry(input_path, global_config)
+    if not height:
+        return image
+    info = assets.get_index(global_config, refresh=False).info(image) or {}
+    return overlay_cache.get_cache(global_config).prepared(
+        image, _image_height(info.get("height"), height), overlay_cache.overlay_pix_fmt(pix_fmt))
+
+def _scaled_overlays(videos, effect_conf, input_path, global_config):
+    """Overlay videos converted for the clip at `size` (fraction of its height, default 0.4); as-is if it is unknown."""
+    height, pix_fmt = _clip_geometry(input_path, global_config)
+    if not height:
+        return videos
+    cache = overlay_cache.get_cache(global_config)
+    target = overlay_cache.even(height * effect_conf.get("size", 0.4))
+    return [cache.prepared(v, target, overlay_cache.overlay_pix_fmt(pix_fmt)) for v in videos]
+
+def prepare_overlays(global_config, heights=overlay_cache.COMMON_HEIGHTS, pix_fmt="yuv420p"):
+    """
+    Convert every overlay asset (images, memes, overlay videos) for clips of the
+    given heights ahead of time, at the sizes the effect chain draws them at.
+    Returns the number of prepared copies.
+    """
+    index = assets.get_index(global_config)
+    cache = overlay_cache.get_cache(global_config)
+    fmt = overlay_cache.overlay_pix_fmt(pix_fmt)
+    sizes = {e.get("size", 0.4) for e in global_config.get("effect_chain", []) if e["name"] == "explosion_spam"} or {0.4}
+    count = 0
+    for height in heights:
+        for image in index.files("images") + index.files("memes"):
+            info = index.info(image) or {}
+            cache.prepared(image, _image_height(info.get("height"), height), fmt)
+            count += 1
+        for video in index.files("overlays_videos"):
+            for size in sorted(sizes):
+                cache.prepared(video, overlay_cache.even(height * size), fmt)
+                count += 1
+    return count
+
+def _chunked_reverse(effect_conf, duration):
+    """Reverse in chunks (see chunked_reverse) when the clip is longer than chunk_seconds; 0 disables."""
+    chunk = effect_conf.get("chunk_seconds", 10.0)
+    return bool(chunk) and duration > chunk
+
+def _stutter_filters(effect_conf, sample_rate):
+    """Stutter fragment for the points picked by resolve_effect ({} when there are none)."""
+    if not effect_conf["points"]:
+        return {}
+    length = effect_conf.get("sample_length", 0.2)
+    return ffmpeg_cmds.stutter_filters(effect_conf["points"], length, effect_conf["repeat_counts"], sample_rate)
+
+def _cut_pieces(effect_conf, duration):
+    """The (start, end) pieces of random cuts in the order they are played."""
+    times = [0.0] + sorted({t for t in effect_conf["cut_times"] if 0.0 < t < duration}) + [duration]
+    pieces = [(a, b) for a, b in zip(times, times[1:]) if b - a >= 0.05]
+    return _apply_order(pieces, effect_conf["piece_order"])
+
+def _reorder_filters(effect_conf, duration):
+    """
+    Random cuts as a single trim/concat graph (fused and streamed modes), or None
+    when the pieces are reordered: concat reads its inputs in turn, so split would
+    have to hold every decoded frame of the pieces that play later (up to the whole
+    clip). Reordered cuts run through the keyframe/segment path instead.
+    """
+    pieces = _cut_pieces(effect_conf, duration)
+    if len(pieces) < 2:
+        return {}
+    if pieces != sorted(pieces):
+        return None
+    # let the piece that ends the clip run to the real end
+    return ffmpeg_cmds.reorder_filters([(a, None if b >= duration else b) for a, b in pieces])
+
+def _snap_cut_points(targets, keyframes, tolerance, duration):
+    """
+    Move each target time onto the nearest keyframe when it is within tolerance.
+    keyframes=None means every time is a sync point (audio-only input).
+    Returns sorted unique points strictly inside (0, duration).
+    """
+    points = set()
+    for t in targets:
+        if keyframes:
+            i = bisect.bisect_left(keyframes, t)
+            nearest = min(keyframes[max(0, i - 1):i + 1], key=lambda k: abs(k - t))
+            if abs(nearest - t) <= tolerance:
+                t = nearest
+        t = round(t, 6)
+        if 0.0 < t < duration:
+            points.add(t)
+    return sorted(points)
+
+def _plan_cut_pieces(times, keyframes, min_len=0.05, eps=1e-3):
+    """
+    Split the cut list `times` (0, ..., duration) into pieces. Each piece is a list
+    of parts: ("copy", start, end) spans start and end on keyframes and can be
+    stream-copied; ("encode", start, end) is the partial GOP next to a cut that is
+    not on a keyframe and has to be re-encoded. keyframes=None: everything copies.
+    The end of the file (times[-1]) counts as a keyframe.
+    """
+    pieces = []
+    end = times[-1] if times else 0.0
+    for a, b in zip(times, times[1:]):
+        if b - a < min_len:
+            # skip extremely short pieces
+            continue
+        if keyframes is None:
+            pieces.append([("copy", a, b)])
+            continue
+        i = bisect.bisect_left(keyframes, a - eps)
+        ka = keyframes[i] if i < len(keyframes) else b
+        if ka >= b - eps:
+            # no keyframe inside the piece
+            pieces.append([("encode", a, b)])
+            continue
+        kb = b if b >= end - eps else keyframes[bisect.bisect_right(keyframes, b + eps) - 1]
+        parts = []
+        if ka > a + eps:
+            parts.append(("encode", a, ka))
+        if kb > ka + eps:
+            parts.append(("copy", ka, kb))
+        if b > kb + eps:
+            parts.append(("encode", kb, b))
+        pieces.append(parts)
+    return pieces
+
+def _build_random_cuts_cmd(ffmpeg_path, input_path, output_path, effect_conf, global_config):
     """
     Split file into N cuts and re-order randomly then concat.
-    This implementation uses ffprobe (preferred) to get duration instead of moviepy so
-    it works when moviepy is not installed.
+
+    Cut points within snap_tolerance seconds of a keyframe (from the cached keyframe
+    index) are moved onto it so pieces can be stream-copied and keep their planned
+    length. At a cut that does not land on a keyframe only the partial GOP next to it
+    is re-encoded. Returns a list of commands: one segmenting pass that produces all
+    stream-copied parts, one pass re-encoding the boundary fragments (if any) and the
+    final concat. Intermediate files go next to output_path.
     """
-    tmpdir = tempfile.mkdtemp(prefix="cuts_")
     try:
-        # find ffprobe
-        ffprobe = _find_ffprobe(ffmpeg_path)
-        # get duration
-        try:
-            duration = _get_duration_with_ffprobe(ffprobe, input_path)
-        except Exception as e:
-            # If ffprobe fails, raise informative error
-            raise RuntimeError(f"Unable to determine input duration (ffprobe error): {e}")
-        if duration <= 0:
-            raise RuntimeError("Input duration is zero or could not be determined.")
-
-        cuts = random.randint(effect_conf.get("min_cuts", 2), effect_conf.get("max_cuts", 6))
-        # create unique random cut points (exclude 0 and duration)
-        points = sorted({round(random.uniform(0.0, duration), 6) for _ in range(cuts - 1)})
-        times = [0.0] + points + [duration]
-        pieces = []
-        for i in range(len(times)-1):
-            start = max(0.0, times[i])
-            end = min(duration, times[i+1])
-            # ensure minimal length
-            if end - start < 0.05:
-                # skip extremely short pieces
-                continue
-            out_piece = os.path.join(tmpdir, f"piece_{i:03d}.mp4")
-            # Use -ss ... -to ... -i ... -c copy for faster cutting where possible.
-            cmd = [ffmpeg_path, "-y", "-loglevel", "warning", "-ss", str(start), "-to", str(end), "-i", input_path, "-c", "copy", out_piece]
-            subprocess.run(cmd, check=True)
-            pieces.append(out_piece)
-        if not pieces:
-            raise RuntimeError("No pieces were created for random cuts.")
-        random.shuffle(pieces)
-        list_file = os.path.join(tmpdir, "concat_list.txt")
-        with open(list_file, "w", encoding="utf-8") as f:
-            for p in pieces:
-                f.write(f"file '{p}'\n")
-        final_cmd = [ffmpeg_path, "-y", "-loglevel", "warning", "-f", "concat", "-safe", "0", "-i", list_file, "-c", "copy", output_path]
-        return final_cmd
-    finally:
-        # cleanup; if ffmpeg still reading files this will be ignored/raise but we ignore errors
-        shutil.rmtree(tmpdir, ignore_errors=True)
\ No newline at end of file
+        info = probe.probe_media(input_path, global_config)
+        keyframes = probe.keyframe_times(input_path, global_config) if info["has_video"] else None
+    except Exception as e:
+        # If ffprobe fails, raise informative error
+        raise RuntimeError(f"Unable to determine input duration (ffprobe error): {e}")
+    duration = info["duration"]
+    if duration <= 0:
+        raise RuntimeError("Input duration is zero or could not be determined.")
+    if info["has_video"] and not keyframes:
+        raise RuntimeError("Input has no keyframes; cannot cut it.")
+    tolerance = effect_conf.get("snap_tolerance", 0.5)
+    if info["has_video"] and (info["video_codec"] != "h264" or info["has_audio"] and info["audio_codec"] != "aac"):
+        # re-encoded fragments (h264/aac) could not be concatenated with copied parts
+        tolerance = float("inf")
+
+    times = [0.0] + _snap_cut_points(effect_conf["cut_times"], keyframes, tolerance, duration) + [duration]
+    pieces = _plan_cut_pieces(times, keyframes)
+    if not pieces:
+        raise RuntimeError("No pieces were created for random cuts.")
+    pieces = _apply_order(pieces, effect_conf["piece_order"])
+
+    parts_dir = os.path.splitext(output_path)[0] + "_cuts"
+    os.makedirs(parts_dir, exist_ok=True)
+    base = ffmpeg_cmds.base_ffmpeg_cmd(ffmpeg_path)
+    # one segmenting pass splits the input at every copy boundary
+    edges = sorted({t for parts in pieces for kind, a, b in parts if kind == "copy" for t in (a, b)} - {0.0, duration})
+    segment_times = ",".join(f"{max(0.0, t - 0.001):.6f}" for t in edges) or f"{duration + 1:.6f}"
+    seg_cmd = base + ["-i", input_path, "-map", "0:v:0?", "-map", "0:a:0?", "-c", "copy",
+                      "-f", "segment", "-segment_format", "mpegts", "-segment_times", segment_times,
+                      "-reset_timestamps", "1", os.path.join(parts_dir, "seg_%04d.ts")]
+    bounds = [0.0] + edges + [duration]
+    enc_cmd = list(base)
+    enc_outputs = []
+    frags = 0
+    files = []
+    for parts in pieces:
+        for kind, a, b in parts:
+            if kind == "copy":
+                for j in range(len(bounds) - 1):
+                    if bounds[j] >= a - 1e-3 and bounds[j + 1] <= b + 1e-3:
+                        files.append(os.path.join(parts_dir, f"seg_{j:04d}.ts"))
+            else:
+                k = frags
+                frags += 1
+                frag = os.path.join(parts_dir, f"frag_{k:04d}.ts")
+                enc_cmd += ["-ss", f"{a:.6f}", "-t", f"{b - a:.6f}", "-i", input_path]
+                enc_outputs += ["-map", f"{k}:v:0?", "-map", f"{k}:a:0?", "-c:v", "libx264", "-preset", "veryfast"]
+                if info["pix_fmt"]:
+                    enc_outputs += ["-pix_fmt", info["pix_fmt"]]
+                enc_outputs += ["-c:a", "aac", "-b:a", "192k", "-f", "mpegts", frag]
+                files.append(frag)
+    list_file = os.path.join(parts_dir, "concat_list.txt")
+    with open(list_file, "w", encoding="utf-8") as f:
+        for p in files:
+            f.write(f"file '{p}'\n")
+    final_cmd = base + ["-f", "concat", "-safe", "0", "-i", list_file, "-map", "0", "-c", "copy", output_path]
+    return [seg_cmd] + ([enc_cmd + enc_outputs] if enc_outputs else []) + [final_cmd]
@@ -8,94 +8,434 @@ from . import utils
 def base_ffmpeg_cmd(ffmpeg_path):
     return [ffmpeg_path, "-y", "-loglevel", "warning"]
 
+# ffmpeg options that take no value (all others used here are followed by one)
+FLAG_OPTIONS = frozenset(["-y", "-n", "-an", "-vn", "-sn", "-dn", "-shortest", "-nostats", "-nostdin",
+                          "-hide_banner", "-re", "-copyts"])
+
+def _output_positions(cmd):
+    """Indices of the output files of an ffmpeg command: arguments that are neither options nor option values."""
+    positions = []
+    i = 1
+    while i < len(cmd):
+        arg = cmd[i]
+        if arg.startswith("-") and len(arg) > 1:
+            i += 1 if arg in FLAG_OPTIONS else 2
+            continue
+        positions.append(i)
+        i += 1
+    return positions
+
+def with_threads(cmd, threads):
+    """
+    Return a copy of an ffmpeg command limited to `threads` threads for
+    filtering, decoding every input and encoding every output.
+    Python tool commands (utils.tool_cmd) get --threads instead.
+    """
+    if not threads:
+        return cmd
+    n = str(int(threads))
+    if cmd[1:2] == ["-m"]:
+        return cmd + ["--threads", n]
+    outputs = set(_output_positions(cmd))
+    limited = [cmd[0], "-filter_threads", n, "-filter_complex_threads", n]
+    for i, arg in enumerate(cmd[1:], 1):
+        if i in outputs or arg == "-i":
+            limited += ["-threads", n]
+        limited.append(arg)
+    return limited
+
+# Filter fragments
+# ----------------
+# Each fragment describes one effect as filter chains instead of a full command so
+# several effects can share a single decode/encode (see build_fused_cmd).
+# Keys (all optional):
+#   vf:     video filter chain
+#   af:     audio filter chain
+#   inputs: extra input arg lists, e.g. [["-i", path]]. vf/af may reference them as
+#           {0}, {1}, ... which are replaced with the real ffmpeg input index.
+#           {uid} is replaced with a prefix unique to the fragment, for internal labels.
+#   time_scale, time_add: how the fragment changes the clip duration
+#           (new = old * time_scale + time_add), used to plan later fused effects.
+# An empty dict is a valid no-op fragment.
+
+def reverse_filters():
+    return {"vf": "reverse", "af": "areverse"}
+
+def speed_filters(factor):
+    # Video: setpts=PTS/factor
+    # Audio: chain atempo factors
+    atempo_factors = utils.chain_atempo_factors(factor)
+    return {
+        "vf": f"setpts={1.0/float(factor)}*PTS",
+        "af": ",".join(f"atempo={f}" for f in atempo_factors),
+        "time_scale": 1.0 / float(factor),
+    }
+
+def invert_filters():
+    return {"vf": "negate"}
+
+def mirror_filters():
+    return {"vf": "hflip"}
+
+def earrape_filters(gain_db=20):
+    return {"af": f"volume={gain_db}dB"}
+
+def chorus_params(level=0.7):
+    """(in_gain, out_gain, delays in ms, decays) of the chorus echo; shared with audio_engine."""
+    return 0.8 + 0.2 * level, 0.9, [60, 90], [0.4 * level, 0.3 * level]
+
+def chorus_filters(level=0.7):
+    # approximate chorus with multiple aecho calls; aecho params: in_gain:out_gain:delays:decays
+    in_gain, out_gain, delays, decays = chorus_params(level)
+    return {"af": f"aecho={in_gain}:{out_gain}:{'|'.join(str(d) for d in delays)}:{'|'.join(str(d) for d in decays)}"}
+
+def vibrato_ratio(depth=0.5):
+    # small static pitch shift (approximation of a vibrato)
+    return 1.0 + (depth - 0.5) * 0.3
+
+def pitch_filters(ratio, sample_rate=44100):
+    # Play the audio ratio times faster (pitch and tempo together): asetrate, then back to the real rate
+    return {"af": f"asetrate={sample_rate}*{ratio},aresample={sample_rate}"}
+
+def vibrato_filters(depth=0.5, sample_rate=44100):
+    # Approx vibrato by varying sample rate slightly (static pitch shift, see vibrato_ratio)
+    return pitch_filters(vibrato_ratio(depth), sample_rate)
+
+def overlay_audio_filters(overlays, gains=None, offsets=None, input_args=None):
+    """
+    Mix overlay sounds into the soundtrack, each scaled by gains[i] (linear) and
+    starting offsets[i] seconds into the clip. The clip keeps its length.
+    input_args: options placed before each overlay's -i (e.g. sound_bank.input_args()).
+    """
+    chains = ["anull[{uid}m]"]
+    labels = "[{uid}m]"
+    for i in range(len(overlays)):
+        gain = gains[i] if gains else 1.0
+        delay = int(round((offsets[i] if offsets else 0.0) * 1000))
+        chains.append(f"[{{{i}}}:a]volume={gain:.6f},adelay={delay}:all=1[{{uid}}o{i}]")
+        labels += f"[{{uid}}o{i}]"
+    return {
+        "af": ";".join(chains) + f";{labels}amix=inputs={1 + len(overlays)}:duration=first:normalize=0",
+        "inputs": [(input_args or []) + ["-i", o] for o in overlays],
+    }
+
+def overlay_image_filters(image_path, position="10:10"):
+    return {"vf": f"[{{0}}:v]overlay={position}:enable='between(t,0,99999)'", "inputs": [["-i", image_path]]}
+
+def explosion_spam_filters(overlays, instances):
+    """
+    Composite instances of overlay videos: each instance is a dict with "video"
+    (index into overlays), "start" (seconds) and "x", "y" (0..1 of the free space).
+    Every overlay is decoded once and fanned out with split; setpts moves each copy
+    to its start time. Overlays are expected at their final size (see overlay_cache).
+    """
+    chains = ["null[{uid}m0]"]
+    copies = {}
+    for inst in instances:
+        copies.setdefault(inst["video"], []).append(inst)
+    for v in copies:
+        n = len(copies[v])
+        chains.append(f"[{{{v}}}:v]split={n}" + "".join(f"[{{uid}}s{v}_{j}]" for j in range(n)) if n > 1 else f"[{{{v}}}:v]null[{{uid}}s{v}_0]")
+    seen = {}
+    for k, inst in enumerate(instances):
+        v = inst["video"]
+        j = seen[v] = seen.get(v, -1) + 1
+        chains.append(f"[{{uid}}s{v}_{j}]setpts=PTS-STARTPTS+{inst['start']:.6f}/TB[{{uid}}p{k}]")
+    for k, inst in enumerate(instances):
+        out = f"[{{uid}}m{k + 1}]" if k < len(instances) - 1 else ""
+        chains.append(f"[{{uid}}m{k}][{{uid}}p{k}]overlay=x='(W-w)*{inst['x']:.4f}':y='(H-h)*{inst['y']:.4f}':eof_action=pass{out}")
+    return {"vf": ";".join(chains), "inputs": [["-i", o] for o in overlays]}
+
+def meme_injection_filters(image_path=None, sound_path=None, sound_gain=1.0, sound_args=None):
+    # image overlay and/or sound overlay in a single stage; sound_args go before the sound's -i
+    frag = {"inputs": []}
+    if image_path:
+        frag["vf"] = f"[{{{len(frag['inputs'])}}}:v]overlay=10:10:enable='between(t,0,99999)'"
+        frag["inputs"].append(["-i", image_path])
+    if sound_path:
+        sound = overlay_audio_filters([sound_path], [sound_gain], input_args=sound_args)
+        frag["af"] = sound["af"].replace("{0}", "{%d}" % len(frag["inputs"]))
+        frag["inputs"] += sound["inputs"]
+    return frag
+
+# Delivery codecs for final outputs, and the lossless intermediate used to link
+# streamed stages over pipes (rawvideo + float PCM in NUT).
+DELIVERY_VIDEO_ARGS = ["-c:v", "libx264", "-preset", "veryfast"]
+DELIVERY_AUDIO_ARGS = ["-c:a", "aac", "-b:a", "192k"]
+PIPE_VIDEO_ARGS = ["-c:v", "rawvideo"]
+PIPE_AUDIO_ARGS = ["-c:a", "pcm_f32le"]
+PIPE_FORMAT = "nut"
+# Progressive outputs: containers a consumer can read (and upload) while they grow.
+# Fragmented MP4 starts a fragment at every keyframe and at least once a second.
+PROGRESSIVE_FORMATS = {
+    "fmp4": ["-f", "mp4", "-movflags", "+frag_keyframe+empty_moov+default_base_moof", "-frag_duration", "1000000"],
+    "ts": ["-f", "mpegts"],
+}
+
+def _trim_concat(segments, stream, loop_size):
+    """
+    Graph body that cuts one stream into segments (start, end, loops) and concats
+    them in the given order; end=None runs to the end of the clip and loops > 0
+    repeats the segment that many extra times.
+    """
+    a = "" if stream == "v" else "a"
+    n = len(segments)
+    parts = [f"{a}split={n}" + "".join(f"[{{uid}}{stream}s{i}]" for i in range(n))]
+    for i, (start, end, loops) in enumerate(segments):
+        chain = f"[{{uid}}{stream}s{i}]{a}trim=start={start:.6f}"
+        if end is not None:
+            chain += f":end={end:.6f}"
+        chain += f",{a}setpts=PTS-STARTPTS"
+        if loops:
+            # size is an upper bound; loop/aloop loop whatever they got at EOF
+            chain += f",loop=loop={loops}:size={loop_size}:start=0" if stream == "v" else f",aloop=loop={loops}:size={loop_size}"
+        parts.append(chain + f"[{{uid}}{stream}t{i}]")
+    concat = "v=1:a=0" if stream == "v" else "v=0:a=1"
+    parts.append("".join(f"[{{uid}}{stream}t{i}]" for i in range(n)) + f"concat=n={n}:{concat}")
+    return ";".join(parts)
+
+def stutter_filters(points, length, repeats, sample_rate=44100, max_fps=120):
+    """
+    Stutter at every point: play `length` seconds from the point repeats[i] times,
+    then carry on from the point. points must be sorted and at least `length` apart.
+    """
+    segments = []
+    prev = 0.0
+    for p, r in zip(points, repeats):
+        segments.append((prev, p, 0))
+        segments.append((p, p + length, r - 1))
+        prev = p
+    segments.append((prev, None, 0))
+    return {
+        "vf": _trim_concat(segments, "v", int(length * max_fps) + 1),
+        "af": _trim_concat(segments, "a", int(length * sample_rate * 1.1) + 1),
+        "time_add": sum(length * r for r in repeats),
+    }
+
+def reorder_filters(pieces):
+    """Play the (start, end) pieces in the given order; end=None runs to the end."""
+    segments = [(start, end, 0) for start, end in pieces]
+    return {"vf": _trim_concat(segments, "v", 1), "af": _trim_concat(segments, "a", 1)}
+
+def sentence_mix_filters(snippets):
+    """Replace the clip with the (start, end) snippets played in order (they may repeat and overlap)."""
+    frag = reorder_filters(snippets)
+    frag.update(time_scale=0.0, time_add=sum(end - start for start, end in snippets))
+    return frag
+
+def build_fused_cmd(ffmpeg_path, input_path, output_path, fragments, intermediate=False, encode_video=False, encode_audio=False, input_args=None, audio_args=None):
+    """
+    Chain several filter fragments into one -filter_complex graph so input_path is
+    decoded once and output_path is encoded once, however many effects are applied.
+    Streams without any filter are stream-copied unless encode_video/encode_audio
+    is set (e.g. when the input is a raw intermediate).
+    intermediate: write the lossless pipe format (NUT) instead of delivery codecs.
+    input_args: extra options placed before the main -i.
+    audio_args: audio codec options to use instead of the delivery/pipe ones.
+    """
+    cmd = base_ffmpeg_cmd(ffmpeg_path)
+    cmd += (input_args or []) + ["-i", input_path]
+    next_input = 1
+    graph = []
+    vlabel, alabel = "0:v", "0:a"
+    for i, frag in enumerate(fragments):
+        indices = list(range(next_input, next_input + len(frag.get("inputs", []))))
+        for args in frag.get("inputs", []):
+            cmd += args
+        next_input += len(indices)
+        if frag.get("vf"):
+            graph.append(f"[{vlabel}]{frag['vf'].format(*indices, uid=f'f{i}')}[v{i}]")
+            vlabel = f"v{i}"
+        if frag.get("af"):
+            graph.append(f"[{alabel}]{frag['af'].format(*indices, uid=f'f{i}')}[a{i}]")
+            alabel = f"a{i}"
+    if graph:
+        cmd += ["-filter_complex", ";".join(graph)]
+    video_args = PIPE_VIDEO_ARGS if intermediate else DELIVERY_VIDEO_ARGS
+    audio_args = audio_args or (PIPE_AUDIO_ARGS if intermediate else DELIVERY_AUDIO_ARGS)
+    if vlabel == "0:v":
+        cmd += ["-map", "0:v?"] + (video_args if encode_video else ["-c:v", "copy"])
+    else:
+        cmd += ["-map", f"[{vlabel}]"] + video_args
+    if alabel == "0:a":
+        cmd += ["-map", "0:a?"] + (audio_args if encode_audio else ["-c:a", "copy"])
+    else:
+        cmd += ["-map", f"[{alabel}]"] + audio_args
+    if intermediate:
+        cmd += ["-f", PIPE_FORMAT]
+    cmd += [output_path]
+    return cmd
+
+def build_stream_cmds(ffmpeg_path, input_path, output_path, fragments):
+    """
+    One ffmpeg command per fragment, meant to run concurrently with each stdout
+    piped into the next stdin. Intermediate links carry rawvideo/PCM in NUT so no
+    generation loss happens between stages; only the last command encodes to the
+    delivery codecs and writes output_path.
+    """
+    cmds = []
+    src, input_args = input_path, None
+    raw_video = raw_audio = False
+    for i, frag in enumerate(fragments):
+        last = i == len(fragments) - 1
+        if last:
+            cmds.append(build_fused_cmd(ffmpeg_path, src, output_path, [frag], encode_video=raw_video, encode_audio=raw_audio, input_args=input_args))
+        else:
+            cmds.append(build_fused_cmd(ffmpeg_path, src, "pipe:1", [frag], intermediate=True, input_args=input_args))
+        raw_video = raw_video or bool(frag.get("vf"))
+        raw_audio = raw_audio or bool(frag.get("af"))
+        # rawvideo frames are large; give the pipe demuxer some headroom
+        src, input_args = "pipe:0", ["-thread_queue_size", "512"]
+    return cmds
+
+def fused_graph(cmd):
+    """Return the -filter_complex graph of a command (for dry-run output), or None."""
+    if "-filter_complex" in cmd:
+        return cmd[cmd.index("-filter_complex") + 1]
+    return None
+
 def build_reverse_cmd(ffmpeg_path, input_path, output_path):
     # Reverse video and audio (may be slower on large files)
+    f = reverse_filters()
+    cmd = base_ffmpeg_cmd(ffmpeg_path)
+    cmd += ["-i", input_path, "-vf", f["vf"], "-af", f["af"], "-c:v", "libx264", "-preset", "veryfast", "-c:a", "aac", "-b:a", "192k", output_path]
+    return cmd
+
+def build_reverse_chunk_cmd(ffmpeg_path, input_path, output_path, start, length=None):
+    # Reverse one chunk of the input (see chunked_reverse); PCM audio keeps chunk joins gapless
+    f = reverse_filters()
+    cmd = base_ffmpeg_cmd(ffmpeg_path)
+    cmd += ["-ss", f"{start:.6f}"] + (["-t", f"{length:.6f}"] if length else []) + ["-i", input_path]
+    cmd += ["-map", "0:v:0?", "-map", "0:a:0?", "-vf", f["vf"], "-af", f["af"]]
+    cmd += DELIVERY_VIDEO_ARGS + ["-c:a", "pcm_s16le", "-f", "matroska", output_path]
+    return cmd
+
+def build_chunk_cmd(ffmpeg_path, input_path, output_path, fragments, start, length=None):
+    # Render one chunk of the input through filter fragments (see chunked_render); PCM audio keeps chunk joins gapless
+    seek = ["-ss", f"{start:.6f}"] + (["-t", f"{length:.6f}"] if length else [])
+    return build_fused_cmd(ffmpeg_path, input_path, output_path, fragments, encode_video=True, encode_audio=True,
+                           input_args=seek, audio_args=["-c:a", "pcm_s16le"])
+
+def build_concat_cmd(ffmpeg_path, list_file, output_path):
+    # Join files listed in a concat demuxer list: copy video, encode audio once
+    cmd = base_ffmpeg_cmd(ffmpeg_path)
+    cmd += ["-f", "concat", "-safe", "0", "-i", list_file, "-map", "0:v?", "-map", "0:a?", "-c:v", "copy"] + DELIVERY_AUDIO_ARGS + [output_path]
+    return cmd
+
+def progressive_target(output_path):
+    # "-" is stdout
+    return "pipe:1" if output_path == "-" else output_path
+
+def with_progressive_output(cmd, fmt, output_path):
+    """Return a copy of an ffmpeg command (output path last) that writes fmt (see PROGRESSIVE_FORMATS) to output_path instead."""
+    return cmd[:-1] + PROGRESSIVE_FORMATS[fmt] + [progressive_target(output_path)]
+
+def build_remux_cmd(ffmpeg_path, input_path, output_path, fmt):
+    # Rewrite a finished file as a progressive output without re-encoding
     cmd = base_ffmpeg_cmd(ffmpeg_path)
-    cmd += ["-i", input_path, "-vf", "reverse", "-af", "areverse", "-c:v", "libx264", "-preset", "veryfast", "-c:a", "aac", "-b:a", "192k", output_path]
+    cmd += ["-i", input_path, "-map", "0", "-c", "copy"] + PROGRESSIVE_FORMATS[fmt] + [progressive_target(output_path)]
     return cmd
 
 def build_speed_cmd(ffmpeg_path, input_path, output_path, factor):
-    # Video: setpts=PTS/factor
-    # Audio: chain atempo factors
+    f = speed_filters(factor)
     cmd = base_ffmpeg_cmd(ffmpeg_path)
-    vf = f"setpts={1.0/float(factor)}*PTS"
-    atempo_factors = utils.chain_atempo_factors(factor)
-    atempo_str = ",".join(f"atempo={f}" for f in atempo_factors)
-    cmd += ["-i", input_path, "-vf", vf, "-af", atempo_str, "-c:v", "libx264", "-preset", "veryfast", "-c:a", "aac", "-b:a", "192k", output_path]
+    cmd += ["-i", input_path, "-vf", f["vf"], "-af", f["af"], "-c:v", "libx264", "-preset", "veryfast", "-c:a", "aac", "-b:a", "192k", output_path]
     return cmd
 
 def build_invert_cmd(ffmpeg_path, input_path, output_path):
     cmd = base_ffmpeg_cmd(ffmpeg_path)
-    cmd += ["-i", input_path, "-vf", "negate", "-c:v", "libx264", "-preset", "veryfast", "-c:a", "copy", output_path]
+    cmd += ["-i", input_path, "-vf", invert_filters()["vf"], "-c:v", "libx264", "-preset", "veryfast", "-c:a", "copy", output_path]
     return cmd
 
 def build_mirror_cmd(ffmpeg_path, input_path, output_path):
     cmd = base_ffmpeg_cmd(ffmpeg_path)
     # Horizontal mirror (hflip) and overlay copy to have both sides (simple)
-    cmd += ["-i", input_path, "-vf", "hflip", "-c:v", "libx264", "-preset", "veryfast", "-c:a", "copy", output_path]
+    cmd += ["-i", input_path, "-vf", mirror_filters()["vf"], "-c:v", "libx264", "-preset", "veryfast", "-c:a", "copy", output_path]
     return cmd
 
 def build_earrape_cmd(ffmpeg_path, input_path, output_path, gain_db=20):
     cmd = base_ffmpeg_cmd(ffmpeg_path)
-    cmd += ["-i", input_path, "-af", f"volume={gain_db}dB", "-c:v", "copy", "-c:a", "aac", "-b:a", "320k", output_path]
+    cmd += ["-i", input_path, "-af", earrape_filters(gain_db)["af"], "-c:v", "copy", "-c:a", "aac", "-b:a", "320k", output_path]
     return cmd
 
 def build_chorus_cmd(ffmpeg_path, input_path, output_path, level=0.7):
-    # approximate chorus with multiple aecho calls; aecho params: in_gain:out_gain:delays:decays
-    in_gain = 0.8 + 0.2 * level
-    out_gain = 0.9
-    delays = "60|90"
-    decays = f"{0.4*level}|{0.3*level}"
     cmd = base_ffmpeg_cmd(ffmpeg_path)
-    cmd += ["-i", input_path, "-af", f"aecho={in_gain}:{out_gain}:{delays}:{decays}", "-c:v", "copy", "-c:a", "aac", "-b:a", "192k", output_path]
+    cmd += ["-i", input_path, "-af", chorus_filters(level)["af"], "-c:v", "copy", "-c:a", "aac", "-b:a", "192k", output_path]
+    return cmd
+
+def build_vibrato_cmd(ffmpeg_path, input_path, output_path, depth=0.5, sample_rate=44100):
+    cmd = base_ffmpeg_cmd(ffmpeg_path)
+    cmd += ["-i", input_path, "-af", vibrato_filters(depth, sample_rate)["af"], "-c:v", "copy", "-c:a", "aac", "-b:a", "192k", output_path]
     return cmd
 
-def build_vibrato_cmd(ffmpeg_path, input_path, output_path, depth=0.5):
-    # Approx vibrato by varying sample rate slightly and then adjusting tempo back.
-    # This is approximate: asetrate=sample_rate*(1+delta), atempo for correction
-    # We'll apply a static pitch shift here (approximation)
-    pitch_ratio = 1.0 + (depth - 0.5) * 0.3  # small pitch shift
+def build_pitch_cmd(ffmpeg_path, input_path, output_path, ratio, sample_rate):
     cmd = base_ffmpeg_cmd(ffmpeg_path)
-    cmd += ["-i", input_path, "-af", f"asetrate=44100*{pitch_ratio},aresample=44100", "-c:v", "copy", "-c:a", "aac", "-b:a", "192k", output_path]
+    cmd += ["-i", input_path, "-af", pitch_filters(ratio, sample_rate)["af"], "-c:v", "copy", "-c:a", "aac", "-b:a", "192k", output_path]
     return cmd
 
-def build_overlay_audio_cmd(ffmpeg_path, input_path, output_path, overlays, volumes=None):
+def build_overlay_audio_cmd(ffmpeg_path, input_path, output_path, overlays, volumes=None, offsets=None, input_args=None):
     """
     overlays: list of file paths to audio to overlay (mix)
-    volumes: optional list of volumes for each overlay relative (0..1)
+    volumes: optional list of linear gains for each overlay (default 1.0)
+    offsets: optional list of start times in seconds (default 0.0)
+    input_args: options placed before each overlay's -i
     """
-    cmd = base_ffmpeg_cmd(ffmpeg_path)
-    cmd += ["-i", input_path]
-    for o in overlays:
-        cmd += ["-i", o]
-    # build amix filter: inputs = 1 + len(overlays)
-    ninputs = 1 + len(overlays)
-    if volumes is None:
-        volumes = [1.0] * len(overlays)
-    # For simplicity, use amerge + pan or amix; amix normalizes
-    amix = f"amix=inputs={ninputs}:normalize=0"
-    cmd += ["-filter_complex", amix, "-c:v", "copy", "-c:a", "aac", "-b:a", "192k", output_path]
-    return cmd
+    return build_fused_cmd(ffmpeg_path, input_path, output_path, [overlay_audio_filters(overlays, volumes, offsets, input_args)])
 
 def build_overlay_image_cmd(ffmpeg_path, input_path, output_path, image_path, position="10:10"):
     cmd = base_ffmpeg_cmd(ffmpeg_path)
     cmd += ["-i", input_path, "-i", image_path, "-filter_complex", f"[0:v][1:v] overlay={position}:enable='between(t,0,99999)'", "-c:a", "copy", "-c:v", "libx264", "-preset", "veryfast", output_path]
     return cmd
 
-def build_explosion_spam_cmd(ffmpeg_path, input_path, output_path, overlay_video, repeats=5):
-    # Simple repeated overlay at random positions/times (scaffold)
-    # Create filter_complex that overlays the same clip at different start times.
+def build_explosion_spam_cmd(ffmpeg_path, input_path, output_path, overlays, instances):
+    # Scatter overlay instances at their times and positions in a single graph (see explosion_spam_filters)
+    return build_fused_cmd(ffmpeg_path, input_path, output_path, [explosion_spam_filters(overlays, instances)])
+
+def build_overlay_prepare_cmd(ffmpeg_path, input_path, output_path, height=None, pix_fmt="yuva420p"):
+    # Lossless copy of an overlay at its display height and pixel format, alpha kept (see overlay_cache)
+    vf = (f"scale=-2:{int(height)}," if height else "") + f"format={pix_fmt}"
+    cmd = base_ffmpeg_cmd(ffmpeg_path)
+    cmd += ["-i", input_path, "-map", "0:v:0", "-an", "-vf", vf, "-c:v", "ffv1", "-f", "matroska", output_path]
+    return cmd
+
+def build_proxy_cmd(ffmpeg_path, input_path, output_path, height=240, fps=12):
+    # Small, fast-to-decode copy for previews; one keyframe per second keeps cuts cheap
+    cmd = base_ffmpeg_cmd(ffmpeg_path)
+    cmd += ["-i", input_path, "-map", "0:v:0?", "-map", "0:a:0?",
+            "-vf", f"scale=-2:'min({int(height)},ih)',fps={fps}",
+            "-c:v", "libx264", "-preset", "ultrafast", "-crf", "30", "-g", str(max(1, int(round(fps)))),
+            "-pix_fmt", "yuv420p", "-c:a", "aac", "-b:a", "96k", "-f", "mp4", output_path]
+    return cmd
+
+def build_raw_decode_cmd(ffmpeg_path, input_path, pix_fmt="yuv420p"):
+    # Decode the first video stream to raw frames on stdout
+    cmd = base_ffmpeg_cmd(ffmpeg_path)
+    cmd += ["-i", input_path, "-map", "0:v:0", "-f", "rawvideo", "-pix_fmt", pix_fmt, "pipe:1"]
+    return cmd
+
+def build_raw_encode_cmd(ffmpeg_path, audio_source, output_path, width, height, fps, pix_fmt="yuv420p"):
+    # Encode raw frames from stdin and mux the audio of audio_source unchanged
+    cmd = base_ffmpeg_cmd(ffmpeg_path)
+    cmd += ["-f", "rawvideo", "-pix_fmt", pix_fmt, "-s", f"{width}x{height}", "-framerate", f"{fps:.6f}",
+            "-thread_queue_size", "512", "-i", "pipe:0",
+            "-i", audio_source, "-map", "0:v", "-map", "1:a?"]
+    if width % 2 or height % 2:
+        # yuv420p needs even dimensions: pad odd sizes by one pixel
+        cmd += ["-vf", "pad=ceil(iw/2)*2:ceil(ih/2)*2"]
+    cmd += ["-c:v", "libx264", "-preset", "veryfast", "-pix_fmt", "yuv420p", "-c:a", "copy", output_path]
+    return cmd
+
+def build_pcm_decode_cmd(ffmpeg_path, input_path, sample_rate, channels):
+    # Decode the first audio stream to interleaved float PCM on stdout
     cmd = base_ffmpeg_cmd(ffmpeg_path)
-    cmd += ["-i", input_path, "-stream_loop", str(repeats-1), "-i", overlay_video]
-    # naive overlay: overlay video on top-left always (scaffold)
-    cmd += ["-filter_complex", "[0:v][1:v] overlay=10:10:enable='gte(t,0)'", "-c:v", "libx264", "-preset", "veryfast", "-c:a", "copy", output_path]
+    cmd += ["-i", input_path, "-map", "0:a:0", "-f", "f32le", "-ar", str(int(sample_rate)), "-ac", str(int(channels)), "pipe:1"]
     return cmd
 
-def build_frame_shuffle_cmd(ffmpeg_path, input_path, output_path, seed=None, sample_rate=10):
-    # Simple placeholder: extract frames, shuffle a subset, re-encode.
-    # We'll rely on ffmpeg's fps filter to reduce frames, then concat - this is a scaffold.
+def build_pcm_mux_cmd(ffmpeg_path, video_source, output_path, sample_rate, channels):
+    # Encode float PCM from stdin as the soundtrack and copy the video of video_source unchanged
     cmd = base_ffmpeg_cmd(ffmpeg_path)
-    cmd += ["-i", input_path, "-vf", f"fps={sample_rate}", "-c:v", "libx264", "-preset", "veryfast", "-c:a", "copy", output_path]
+    cmd += ["-f", "f32le", "-ar", str(int(sample_rate)), "-ac", str(int(channels)), "-thread_queue_size", "512", "-i", "pipe:0",
+            "-i", video_source, "-map", "1:v?", "-map", "0:a", "-c:v", "copy"] + DELIVERY_AUDIO_ARGS + [output_path]
     return cmd
 
 def build_random_cuts_cmd(ffmpeg_path, input_path, output_path, min_cuts=2, max_cuts=6):
@@ -0,0 +1,123 @@
+"""
+Frame shuffle engine.
+
+Decodes the video to rawvideo over a pipe, shuffles blocks of frames inside a fixed
+window and pipes the result to an encoder that muxes the untouched audio back in.
+Frames are held in a preallocated NumPy buffer (or a memory-mapped file) of exactly
+`window` frames, so memory use does not depend on the clip length.
+
+Run as a tool: python -m ytp_generator.frame_shuffle --input in.mp4 --output out.mp4 ...
+(effects.build_effect_command builds this command line).
+"""
+import argparse
+import os
+import subprocess
+import sys
+import tempfile
+
+import numpy as np
+
+from . import ffmpeg_cmds
+
+def frame_bytes(width, height, pix_fmt):
+    if pix_fmt == "yuv420p":
+        return width * height * 3 // 2
+    return width * height * 3
+
+def _read_frame(stream, row):
+    """Fill one buffer row from the pipe; return False at end of stream."""
+    view = memoryview(row)
+    got = 0
+    while got < len(view):
+        n = stream.readinto(view[got:])
+        if not n:
+            return False
+        got += n
+    return True
+
+def shuffle_order(count, block, rng):
+    """Frame order for one window: blocks of `block` frames in random order."""
+    starts = np.arange(0, count, block)
+    rng.shuffle(starts)
+    return np.concatenate([np.arange(s, min(s + block, count)) for s in starts])
+
+def shuffle_frames(src, dst, store, block, rng):
+    """
+    Copy frames from src to dst, shuffling block order inside each window.
+    store: array of shape (window, frame_bytes) used as the only frame storage.
+    Returns the number of frames written.
+    """
+    window = store.shape[0]
+    written = 0
+    while True:
+        count = 0
+        while count < window and _read_frame(src, store[count]):
+            count += 1
+        if count == 0:
+            break
+        for i in shuffle_order(count, block, rng):
+            dst.write(store[i].data)
+        written += count
+        if count < window:
+            break
+    return written
+
+def run(ffmpeg_path, input_path, output_path, width, height, fps, window=50, block=1,
+        seed=None, store="ram", threads=None):
+    pix_fmt = "yuv420p" if width % 2 == 0 and height % 2 == 0 else "rgb24"
+    size = frame_bytes(width, height, pix_fmt)
+    rng = np.random.default_rng(seed)
+    tmp = None
+    if store == "mmap":
+        fd, tmp = tempfile.mkstemp(prefix="ytp_shuffle_", suffix=".raw", dir=os.path.dirname(os.path.abspath(output_path)))
+        os.close(fd)
+        frames = np.memmap(tmp, dtype=np.uint8, mode="w+", shape=(window, size))
+    else:
+        frames = np.empty((window, size), dtype=np.uint8)
+    dec_cmd = ffmpeg_cmds.with_threads(ffmpeg_cmds.build_raw_decode_cmd(ffmpeg_path, input_path, pix_fmt), threads)
+    enc_cmd = ffmpeg_cmds.with_threads(
+        ffmpeg_cmds.build_raw_encode_cmd(ffmpeg_path, input_path, output_path, width, height, fps, pix_fmt), threads)
+    dec = subprocess.Popen(dec_cmd, stdin=subprocess.DEVNULL, stdout=subprocess.PIPE)
+    enc = subprocess.Popen(enc_cmd, stdin=subprocess.PIPE)
+    try:
+        shuffle_frames(dec.stdout, enc.stdin, frames, max(1, block), rng)
+        enc.stdin.close()
+    except BrokenPipeError:
+        # the encoder died; its exit code is reported below
+        pass
+    finally:
+        dec.stdout.close()
+        dec.wait()
+        enc.wait()
+        del frames
+        if tmp:
+            os.remove(tmp)
+    if dec.returncode != 0:
+        raise subprocess.CalledProcessError(dec.returncode, dec_cmd)
+    if enc.returncode != 0:
+        raise subprocess.CalledProcessError(enc.returncode, enc_cmd)
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Shuffle video frames inside a bounded window")
+    parser.add_argument("--ffmpeg", default="ffmpeg")
+    parser.add_argument("--input", required=True)
+    parser.add_argument("--output", required=True)
+    parser.add_argument("--width", type=int, required=True)
+    parser.add_argument("--height", type=int, required=True)
+    parser.add_argument("--fps", type=float, required=True)
+    parser.add_argument("--window", type=int, default=50, help="Frames held in memory and shuffled together")
+    parser.add_argument("--block", type=int, default=1, help="Frames moved together (1 = single frames)")
+    parser.add_argument("--seed", type=int)
+    parser.add_argument("--store", choices=("ram", "mmap"), default="ram")
+    parser.add_argument("--threads", type=int)
+    args = parser.parse_args(argv)
+    try:
+        run(args.ffmpeg, args.input, args.output, args.width, args.height, args.fps,
+            window=args.window, block=args.block, seed=args.seed, store=args.store, threads=args.threads)
+    except subprocess.CalledProcessError as e:
+        print(f"frame_shuffle: {e}", file=sys.stderr)
+        return 1
+    return 0
+
+if __name__ == "__main__":
+    sys.exit(main())
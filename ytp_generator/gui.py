@@ -6,10 +6,9 @@ It allows selecting input/output, ffmpeg path, assets dir, toggling effects and
 import tkinter as tk
 from tkinter import ttk, filedialog, messagebox
 import json
-import threading
 import os
 
-from . import config as cfg, processor, assets
+from . import config as cfg, processor, assets, runner
 
 class YTPGui:
     def __init__(self):
@@ -17,6 +16,8 @@ class YTPGui:
         self.root.title("YTP Deluxe Generator - GUI")
         self.root.geometry("800x600")
         self._build_ui()
+        self.runner = None
+        self.job = None
         self.config = cfg.default_config()
         self._load_config_into_ui(self.config)
 
@@ -48,6 +49,10 @@ class YTPGui:
         ttk.Entry(top, textvariable=self.assets_var, width=60).grid(row=3, column=1, padx=4)
         ttk.Button(top, text="Browse", command=self._browse_assets).grid(row=3, column=2, padx=4)
 
+        ttk.Label(top, text="Execution mode:").grid(row=4, column=0, sticky="w")
+        self.mode_var = tk.StringVar()
+        ttk.Combobox(top, textvariable=self.mode_var, values=processor.EXECUTION_MODES, state="readonly", width=12).grid(row=4, column=1, padx=4, sticky="w")
+
         # Middle: effects list with toggle & probability
         mid = ttk.LabelFrame(frm, text="Effects")
         mid.pack(fill="both", expand=True, pady=(0,8))
@@ -68,9 +73,13 @@ class YTPGui:
         self.run_btn.pack(side="left", padx=4)
         self.dry_btn = ttk.Button(btn_frame, text="Dry Run", command=self._on_dry_run)
         self.dry_btn.pack(side="left", padx=4)
+        self.cancel_btn = ttk.Button(btn_frame, text="Cancel", command=self._on_cancel, state="disabled")
+        self.cancel_btn.pack(side="left", padx=4)
         ttk.Button(btn_frame, text="Load Config...", command=self._on_load_config).pack(side="left", padx=4)
         ttk.Button(btn_frame, text="Save Config...", command=self._on_save_config).pack(side="left", padx=4)
 
+        self.status_var = tk.StringVar()
+        ttk.Label(bottom, textvariable=self.status_var).pack(fill="x")
         self.log = tk.Text(bottom, height=12)
         self.log.pack(fill="both", expand=True)
 
@@ -99,6 +108,7 @@ class YTPGui:
     def _load_config_into_ui(self, config):
         self.ffmpeg_var.set(config.get("ffmpeg_path", "ffmpeg"))
         self.assets_var.set(config.get("assets_dir", "assets"))
+        self.mode_var.set(config.get("execution_mode", "stages"))
         # Clear current effect rows
         for child in self.effects_frame.winfo_children():
             child.destroy()
@@ -131,6 +141,7 @@ class YTPGui:
         c = cfg.default_config()
         c["ffmpeg_path"] = self.ffmpeg_var.get() or c["ffmpeg_path"]
         c["assets_dir"] = self.assets_var.get() or c["assets_dir"]
+        c["execution_mode"] = self.mode_var.get() or c["execution_mode"]
         # refill effect chain from UI rows
         new_chain = []
         for row in self.effect_rows:
@@ -171,22 +182,42 @@ class YTPGui:
         self.log.see("end")
 
     def _run_processing_thread(self, cfg_data, input_path, output_path, dry_run=False):
-        # Disable run buttons
+        # Jobs run on the shared asyncio runner; callbacks hop back to the Tk thread
         self.run_btn.config(state="disabled")
         self.dry_btn.config(state="disabled")
+        self.cancel_btn.config(state="normal")
+        if self.runner is None:
+            self.runner = runner.JobRunner()
         def progress(stage, total, msg):
-            self._log(f"[{stage}/{total}] {msg}")
-        def target():
-            try:
-                processor.process_video(input_path, output_path, cfg_data, dry_run=dry_run, progress_callback=progress)
-                self._log("Processing finished.")
-            except Exception as e:
-                self._log(f"Error: {e}")
-            finally:
-                self.run_btn.config(state="normal")
-                self.dry_btn.config(state="normal")
-        t = threading.Thread(target=target, daemon=True)
-        t.start()
+            self.root.after(0, self._log, f"[{stage}/{total}] {msg}")
+        def ffmpeg_progress(stage, total, event):
+            if event["out_time"] is not None:
+                speed = f" at {event['speed']:.2f}x" if event["speed"] else ""
+                text = f"Stage {stage}/{total}: {event['out_time']:.1f}s, frame {event['frame'] or 0}{speed}"
+                self.root.after(0, self.status_var.set, text)
+        def finished(future):
+            if future.cancelled():
+                msg = "Processing cancelled."
+            elif future.exception():
+                msg = f"Error: {future.exception()}"
+            else:
+                msg = "Processing finished."
+            self.root.after(0, self._on_finished, msg)
+        self.job = self.runner.submit(input_path, output_path, cfg_data, dry_run=dry_run,
+                                      progress_callback=progress, on_progress=ffmpeg_progress)
+        self.job.add_done_callback(finished)
+
+    def _on_finished(self, msg):
+        self._log(msg)
+        self.status_var.set("")
+        self.job = None
+        self.run_btn.config(state="normal")
+        self.dry_btn.config(state="normal")
+        self.cancel_btn.config(state="disabled")
+
+    def _on_cancel(self):
+        if self.job is not None:
+            self.job.cancel()
 
     def _on_run(self):
         input_path = self.input_var.get()
@@ -207,4 +238,6 @@ class YTPGui:
         self._run_processing_thread(cfg_data, input_path, output_path, dry_run=True)
 
     def run(self):
-        self.root.mainloop()
\ No newline at end of file
+        self.root.mainloop()
+        if self.runner is not None:
+            self.runner.close()
\ No newline at end of file
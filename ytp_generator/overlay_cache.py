@@ -0,0 +1,94 @@
+"""
+Cache of overlay assets converted ahead of time for compositing.
+
+Overlay graphs composite sources that already have the size they are drawn at and
+the pixel layout of the clip (with alpha), so no scale or format conversion runs on
+every frame of every job. A prepared copy is lossless FFV1 in cache_dir/overlays,
+named after the source path, its size and mtime, the target height and the pixel
+format. Images, GIFs and videos are all stored this way. When the source changes,
+its copies made from the older version are removed.
+
+effects.prepare_overlays() fills the cache for the COMMON_HEIGHTS output sizes.
+"""
+import glob
+import hashlib
+import os
+import subprocess
+import threading
+
+from . import ffmpeg_cmds
+
+OVERLAY_DIR = "overlays"
+# Output heights overlays are prepared for ahead of time
+COMMON_HEIGHTS = (240, 360, 480, 720, 1080)
+
+# Clip pixel format -> overlay pixel format with the same chroma layout plus alpha
+ALPHA_FORMATS = {
+    "yuv420p": "yuva420p", "yuvj420p": "yuva420p",
+    "yuv422p": "yuva422p", "yuvj422p": "yuva422p",
+    "yuv444p": "yuva444p", "yuvj444p": "yuva444p",
+}
+
+def _digest(text):
+    return hashlib.sha1(text.encode("utf-8")).hexdigest()[:16]
+
+def even(value):
+    return max(2, int(round(value / 2.0)) * 2)
+
+def overlay_pix_fmt(clip_pix_fmt):
+    return ALPHA_FORMATS.get(clip_pix_fmt, "yuva420p")
+
+class OverlayCache:
+    def __init__(self, cache_dir, ffmpeg_path="ffmpeg"):
+        self.dir = os.path.join(os.path.abspath(cache_dir), OVERLAY_DIR)
+        self.ffmpeg_path = ffmpeg_path
+        os.makedirs(self.dir, exist_ok=True)
+
+    def _prefix(self, source):
+        return os.path.join(self.dir, _digest(os.path.abspath(source)) + "_")
+
+    def path_for(self, source, height=None, pix_fmt="yuva420p"):
+        st = os.stat(source)
+        return f"{self._prefix(source)}{_digest(f'{st.st_size}|{st.st_mtime_ns}')}_{int(height) if height else 'src'}_{pix_fmt}.mkv"
+
+    def prepared(self, source, height=None, pix_fmt="yuva420p"):
+        """
+        Path of source converted to pix_fmt and scaled to `height` pixels (width
+        keeps the aspect ratio; None keeps the size), converting it first if needed.
+        """
+        path = self.path_for(source, height, pix_fmt)
+        if os.path.isfile(path):
+            return path
+        version = path[:len(self._prefix(source)) + 16]
+        for old in glob.glob(self._prefix(source) + "*.mkv"):
+            # a concurrent job may be removing the same stale copies
+            if not old.startswith(version):
+                try:
+                    os.remove(old)
+                except FileNotFoundError:
+                    pass
+        part = f"{path}.{os.getpid()}.{threading.get_ident()}.part.mkv"
+        try:
+            subprocess.run(ffmpeg_cmds.build_overlay_prepare_cmd(self.ffmpeg_path, source, part, height, pix_fmt),
+                           stdin=subprocess.DEVNULL, check=True)
+            os.replace(part, path)
+        finally:
+            if os.path.exists(part):
+                os.remove(part)
+        return path
+
+    def entries(self):
+        return sorted(glob.glob(os.path.join(self.dir, "*.mkv")))
+
+    def total_bytes(self):
+        return sum(os.path.getsize(p) for p in self.entries())
+
+    def clear(self):
+        entries = self.entries()
+        freed = self.total_bytes()
+        for p in entries:
+            os.remove(p)
+        return len(entries), freed
+
+def get_cache(config):
+    return OverlayCache(config.get("cache_dir", ".ytp_cache"), config.get("ffmpeg_path", "ffmpeg"))
@@ -0,0 +1,72 @@
+"""
+Preview renders: cached low-resolution proxies of the sources and saved plans.
+
+A preview renders the chain on a downscaled, low-fps proxy and saves the resolved
+plan (seed plus every random choice, see processor.plan_chain) next to the output.
+Rendering that plan on the original source gives the full-quality version of what
+the preview showed.
+Proxies live in cache_dir/proxies, keyed by source path, size, mtime and the proxy
+settings; a new proxy replaces older ones of the same source. processor renders
+missing proxies with proxy_cmd/install_proxy.
+"""
+import glob
+import hashlib
+import json
+import os
+import uuid
+
+from . import ffmpeg_cmds
+
+PROXY_DIR = "proxies"
+PLAN_VERSION = 1
+
+def _digest(text):
+    return hashlib.sha1(text.encode("utf-8")).hexdigest()[:16]
+
+def proxy_path(input_path, config):
+    """Cache path of the proxy for input_path with the current preview settings."""
+    input_path = os.path.abspath(input_path)
+    st = os.stat(input_path)
+    settings = f"{st.st_size}|{st.st_mtime_ns}|{config.get('preview_height', 240)}|{config.get('preview_fps', 12)}"
+    name = f"{_digest(input_path)}_{_digest(settings)}.mp4"
+    return os.path.join(config.get("cache_dir", ".ytp_cache"), PROXY_DIR, name)
+
+def proxy_cmd(input_path, config):
+    """
+    Return (proxy_path, part_path, cmd): cmd renders the proxy to part_path, a name
+    unique to this call so concurrent previews of one source do not share it, and is
+    None when the proxy is already cached. Call install_proxy after running it.
+    """
+    path = proxy_path(input_path, config)
+    if os.path.isfile(path):
+        return path, None, None
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    part = f"{path}.{os.getpid()}.{uuid.uuid4().hex[:8]}.part"
+    cmd = ffmpeg_cmds.build_proxy_cmd(config.get("ffmpeg_path", "ffmpeg"), input_path, part,
+                                      config.get("preview_height", 240), config.get("preview_fps", 12))
+    return path, part, cmd
+
+def install_proxy(input_path, path, part):
+    """Move a freshly rendered proxy into place, dropping older proxies of the same source."""
+    for old in glob.glob(os.path.join(os.path.dirname(path), _digest(os.path.abspath(input_path)) + "_*.mp4")):
+        # a concurrent preview may have installed this one already; it is replaced atomically below
+        if old != path:
+            try:
+                os.remove(old)
+            except FileNotFoundError:
+                pass
+    os.replace(part, path)
+
+def plan_path_for(output_path):
+    return os.path.splitext(output_path)[0] + ".plan.json"
+
+def save_plan(plan, path):
+    with open(path, "w", encoding="utf-8") as f:
+        json.dump(dict(plan, version=PLAN_VERSION), f, indent=2)
+
+def load_plan(path):
+    with open(path, "r", encoding="utf-8") as f:
+        plan = json.load(f)
+    if plan.get("version") != PLAN_VERSION or not isinstance(plan.get("effects"), list):
+        raise ValueError(f"{path} is not a render plan")
+    return plan
@@ -0,0 +1,296 @@
+"""
+Media probing with a persistent cache.
+
+ffprobe results are stored in an SQLite database under config["cache_dir"], keyed by
+absolute path, file size and mtime, so sources and assets are only probed again
+when they change. Files inside registered scratch dirs (stage intermediates, see
+add_scratch_dir) are cached in memory only.
+"""
+import json
+import os
+import sqlite3
+import subprocess
+import threading
+from collections import OrderedDict
+from shutil import which
+
+PROBE_DB = "probe.sqlite"
+
+def find_ffprobe(ffmpeg_path):
+    """Try to locate ffprobe. Prefer same directory as ffmpeg_path, then system PATH 'ffprobe'."""
+    # If ffmpeg_path is full path, check same dir for ffprobe
+    try:
+        ffmpeg_dir = os.path.dirname(os.path.abspath(ffmpeg_path))
+        candidate = os.path.join(ffmpeg_dir, "ffprobe")
+        candidate_exe = candidate + (".exe" if os.name == "nt" else "")
+        if os.path.isfile(candidate_exe):
+            return candidate_exe
+        # try 'ffprobe' on PATH
+        wp = which("ffprobe")
+        if wp:
+            return wp
+    except Exception:
+        pass
+    # fallback to 'ffprobe' (may fail later if not installed)
+    return "ffprobe"
+
+def _parse_rate(rate):
+    try:
+        num, _, den = str(rate).partition("/")
+        return float(num) / float(den or 1)
+    except (ValueError, ZeroDivisionError):
+        return 0.0
+
+def scan_keyframes(ffprobe_path, input_path, start_time=0.0):
+    """
+    Return the sorted presentation times (seconds, relative to start_time) of the
+    video keyframes, read from packet flags (demux only, no decode).
+    """
+    cmd = [ffprobe_path, "-v", "error", "-select_streams", "v:0", "-show_entries", "packet=pts_time,flags", "-of", "csv=p=0", input_path]
+    proc = subprocess.run(cmd, stdout=subprocess.PIPE, stderr=subprocess.PIPE, text=True, check=True)
+    times = []
+    for line in proc.stdout.splitlines():
+        pts, _, flags = line.partition(",")
+        if "K" in flags:
+            try:
+                times.append(round(float(pts) - start_time, 6))
+            except ValueError:
+                continue
+    return sorted(times)
+
+def run_ffprobe(ffprobe_path, input_path):
+    """
+    Probe input_path and return a flat metadata dict:
+    duration, start_time, has_video, width, height, fps, video_codec, pix_fmt,
+    has_audio, sample_rate, channels, audio_codec. Keyframes are scanned separately
+    (see keyframe_times), only for the effects that need them.
+    Raises subprocess.CalledProcessError / ValueError when the file is not media.
+    """
+    cmd = [ffprobe_path, "-v", "error", "-show_format", "-show_streams", "-of", "json", input_path]
+    proc = subprocess.run(cmd, stdout=subprocess.PIPE, stderr=subprocess.PIPE, text=True, check=True)
+    data = json.loads(proc.stdout or "{}")
+    streams = data.get("streams", [])
+    if not streams:
+        raise ValueError(f"No media streams found in {input_path!r}")
+    video = next((s for s in streams if s.get("codec_type") == "video"), None)
+    audio = next((s for s in streams if s.get("codec_type") == "audio"), None)
+    fmt = data.get("format", {})
+    try:
+        duration = float(fmt.get("duration", 0.0))
+    except (TypeError, ValueError):
+        duration = 0.0
+    try:
+        start_time = float(fmt.get("start_time", 0.0))
+    except (TypeError, ValueError):
+        start_time = 0.0
+    info = {
+        "duration": duration,
+        "start_time": start_time,
+        "has_video": video is not None,
+        "width": 0, "height": 0, "fps": 0.0, "video_codec": None, "pix_fmt": None,
+        "has_audio": audio is not None,
+        "sample_rate": 0, "channels": 0, "audio_codec": None,
+    }
+    if video is not None:
+        info.update({
+            "width": int(video.get("width", 0)),
+            "height": int(video.get("height", 0)),
+            "fps": _parse_rate(video.get("avg_frame_rate")) or _parse_rate(video.get("r_frame_rate")),
+            "video_codec": video.get("codec_name"),
+            "pix_fmt": video.get("pix_fmt"),
+        })
+    if audio is not None:
+        info.update({
+            "sample_rate": int(audio.get("sample_rate", 0) or 0),
+            "channels": int(audio.get("channels", 0) or 0),
+            "audio_codec": audio.get("codec_name"),
+        })
+    return info
+
+class ProbeCache:
+    """
+    SQLite-backed map of (path, size, mtime) -> probe info. Safe to share between threads.
+    Keyframe times and speech segment indexes (see segments) are kept in their own
+    tables so plain metadata lookups stay small.
+    """
+
+    def __init__(self, db_path):
+        os.makedirs(os.path.dirname(os.path.abspath(db_path)), exist_ok=True)
+        self.db_path = db_path
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(db_path, timeout=30, check_same_thread=False)
+        with self._conn:
+            self._conn.execute(
+                "CREATE TABLE IF NOT EXISTS probe ("
+                "path TEXT PRIMARY KEY, size INTEGER, mtime_ns INTEGER, info TEXT)"
+            )
+            self._conn.execute(
+                "CREATE TABLE IF NOT EXISTS keyframes ("
+                "path TEXT PRIMARY KEY, size INTEGER, mtime_ns INTEGER, times TEXT)"
+            )
+            self._conn.execute(
+                "CREATE TABLE IF NOT EXISTS segments ("
+                "path TEXT PRIMARY KEY, size INTEGER, mtime_ns INTEGER, segments TEXT)"
+            )
+
+    def _get(self, table, column, path, size, mtime_ns):
+        with self._lock:
+            row = self._conn.execute(f"SELECT size, mtime_ns, {column} FROM {table} WHERE path = ?", (path,)).fetchone()
+        if row and row[0] == size and row[1] == mtime_ns:
+            return json.loads(row[2])
+        return None
+
+    def _put(self, table, path, size, mtime_ns, value):
+        with self._lock, self._conn:
+            self._conn.execute(f"INSERT OR REPLACE INTO {table} VALUES (?, ?, ?, ?)", (path, size, mtime_ns, json.dumps(value)))
+
+    def get(self, path, size, mtime_ns):
+        return self._get("probe", "info", path, size, mtime_ns)
+
+    def put(self, path, size, mtime_ns, info):
+        self._put("probe", path, size, mtime_ns, info)
+
+    def get_keyframes(self, path, size, mtime_ns):
+        return self._get("keyframes", "times", path, size, mtime_ns)
+
+    def put_keyframes(self, path, size, mtime_ns, times):
+        self._put("keyframes", path, size, mtime_ns, times)
+
+    def get_segments(self, path, size, mtime_ns):
+        return self._get("segments", "segments", path, size, mtime_ns)
+
+    def put_segments(self, path, size, mtime_ns, index):
+        self._put("segments", path, size, mtime_ns, index)
+
+    def prune_missing(self):
+        """Drop entries whose file no longer exists. Returns the number removed."""
+        with self._lock:
+            paths = [r[0] for r in self._conn.execute("SELECT path FROM probe")]
+        gone = [(p,) for p in paths if not os.path.exists(p)]
+        with self._lock, self._conn:
+            self._conn.executemany("DELETE FROM probe WHERE path = ?", gone)
+            self._conn.executemany("DELETE FROM keyframes WHERE path = ?", gone)
+            self._conn.executemany("DELETE FROM segments WHERE path = ?", gone)
+        return len(gone)
+
+class LRU:
+    """Thread-safe in-memory map that forgets the least recently used entries above maxsize."""
+
+    def __init__(self, maxsize):
+        self.maxsize = maxsize
+        self._data = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, key):
+        with self._lock:
+            if key not in self._data:
+                return None
+            self._data.move_to_end(key)
+            return self._data[key]
+
+    def put(self, key, value):
+        with self._lock:
+            self._data[key] = value
+            self._data.move_to_end(key)
+            while len(self._data) > self.maxsize:
+                self._data.popitem(last=False)
+
+    def discard_where(self, predicate):
+        with self._lock:
+            for key in [k for k in self._data if predicate(k)]:
+                del self._data[key]
+
+# Probe results kept in memory (also for scratch files, which are not persisted)
+MEMORY_ENTRIES = 2048
+
+_caches = {}
+_memory = LRU(MEMORY_ENTRIES)
+_keyframe_memory = LRU(MEMORY_ENTRIES)
+_scratch_dirs = set()
+_caches_lock = threading.Lock()
+
+def get_cache(config):
+    """Return the shared ProbeCache for config["cache_dir"]."""
+    db_path = os.path.abspath(os.path.join(config.get("cache_dir", ".ytp_cache"), PROBE_DB))
+    with _caches_lock:
+        if db_path not in _caches:
+            _caches[db_path] = ProbeCache(db_path)
+        return _caches[db_path]
+
+def add_scratch_dir(path):
+    """Register a directory of short-lived files that must not be persisted."""
+    _scratch_dirs.add(os.path.abspath(path))
+
+def remove_scratch_dir(path):
+    path = os.path.abspath(path)
+    _scratch_dirs.discard(path)
+    for memory in (_memory, _keyframe_memory):
+        memory.discard_where(lambda k: k[0].startswith(path + os.sep))
+
+def _is_transient(path):
+    for d in list(_scratch_dirs):
+        try:
+            if os.path.commonpath([d, path]) == d:
+                return True
+        except ValueError:
+            # different drives on Windows
+            continue
+    return False
+
+def file_key(path):
+    """(absolute path, size, mtime_ns): the key of everything cached about a file."""
+    path = os.path.abspath(path)
+    st = os.stat(path)
+    return path, st.st_size, st.st_mtime_ns
+
+def persistent_cache(path, config):
+    """The ProbeCache to store data about path in, or None for files in scratch dirs."""
+    return None if _is_transient(os.path.abspath(path)) else get_cache(config)
+
+def probe_media(path, config):
+    """
+    Return cached metadata for path (see run_ffprobe), probing it on a cache miss.
+    Raises RuntimeError if ffprobe cannot read the file.
+    """
+    key = file_key(path)
+    info = _memory.get(key)
+    if info is not None:
+        return info
+    cache = persistent_cache(key[0], config)
+    info = cache.get(*key) if cache else None
+    if info is None:
+        ffprobe = find_ffprobe(config.get("ffmpeg_path", "ffmpeg"))
+        try:
+            info = run_ffprobe(ffprobe, key[0])
+        except (subprocess.CalledProcessError, ValueError, OSError) as e:
+            raise RuntimeError(f"ffprobe failed for {key[0]}: {e}")
+        if cache:
+            cache.put(*key, info)
+    _memory.put(key, info)
+    return info
+
+def keyframe_times(path, config):
+    """
+    Return the keyframe index of path (see scan_keyframes; [] without video). The
+    packet scan reads the whole file, so it only runs the first time a file's
+    keyframes are asked for and is cached like the probe data.
+    """
+    key = file_key(path)
+    times = _keyframe_memory.get(key)
+    if times is not None:
+        return times
+    cache = persistent_cache(key[0], config)
+    times = cache.get_keyframes(*key) if cache else None
+    if times is None:
+        info = probe_media(path, config)
+        times = []
+        if info["has_video"]:
+            ffprobe = find_ffprobe(config.get("ffmpeg_path", "ffmpeg"))
+            try:
+                times = scan_keyframes(ffprobe, key[0], info["start_time"])
+            except (subprocess.CalledProcessError, OSError) as e:
+                raise RuntimeError(f"ffprobe failed for {key[0]}: {e}")
+        if cache:
+            cache.put_keyframes(*key, times)
+    _keyframe_memory.put(key, times)
+    return times
@@ -1,13 +1,15 @@
 """
 Processing pipeline moved out of the top-level script so the GUI can reuse it.
 """
+import asyncio
+import functools
+import importlib.util
 import os
-import tempfile
 import shutil
-import subprocess
 import random
+import subprocess
 
-from . import assets, effects, config as cfg, utils
+from . import assets, effects, ffmpeg_cmds, preview as previews, probe, runner, stage_cache, tempspace, config as cfg, utils
 
 def ensure_ffmpeg(ffmpeg_path):
     # Accept either a bare executable name (on PATH) or a full path
@@ -15,63 +17,447 @@ def ensure_ffmpeg(ffmpeg_path):
         return ffmpeg_path
     raise FileNotFoundError(f"ffmpeg executable not found at '{ffmpeg_path}' and not on PATH.")
 
-def process_video(input_path, output_path, config, dry_run=False, progress_callback=None):
+EXECUTION_MODES = ("stages", "fused", "streamed", "parallel")
+
+def roll_chain(chain, progress_callback=None, rng=random):
+    """
+    Apply enabled flags and probability rolls to the effect chain.
+    Returns the list of effect configs that will actually run, in order.
+    """
+    total = sum(1 for e in chain if e.get("enabled", True))
+    rolled = []
+    for effect_conf in chain:
+        name = effect_conf["name"]
+        enabled = effect_conf.get("enabled", True)
+        if not enabled:
+            if progress_callback:
+                progress_callback(0, total, f"Skipping {name} (disabled)")
+            continue
+        prob = effect_conf.get("probability", 1.0)
+        roll = rng.random()
+        if roll > prob:
+            if progress_callback:
+                progress_callback(0, total, f"Skipping {name} (prob {prob:.2f} roll {roll:.2f})")
+            continue
+        rolled.append(effect_conf)
+    return rolled
+
+def plan_chain(chain, config, input_path, seed=None, progress_callback=None, exact=False):
+    """
+    Roll the chain and resolve every random choice of the effects that will run
+    (see effects.resolve_effect). Returns a plan dict:
+    {"seed": seed, "source": input_path, "effects": [resolved effect configs]}
+    The same seed, chain and source give the same plan; process_video(plan=...)
+    renders a plan again without any new random choices.
+    exact: pin random cut times (no keyframe snapping) so renders of the plan at
+    different qualities match.
+    """
+    if seed is None:
+        seed = random.getrandbits(32)
+    rng = random.Random(seed)
+    rolled = roll_chain(chain, progress_callback, rng)
+    # only probe the source if an effect needs the clip length
+    needs_duration = any(e["name"] in effects.NEEDS_DURATION for e in rolled)
+    duration = probe.probe_media(input_path, config)["duration"] if needs_duration else None
+    # word segments of the clip, moved along by each effect (segment index built once per source)
+    words = effects.source_words(input_path, config) if any(effects.uses_words(e) for e in rolled) else None
+    resolved = []
+    for effect_conf in rolled:
+        conf = effects.resolve_effect(effect_conf, config, input_path, duration, rng, exact, words)
+        if words is not None:
+            words = effects.resolved_words(conf, words, duration)
+        if duration is not None:
+            duration = effects.resolved_duration(conf, duration)
+        resolved.append(conf)
+    return {"seed": seed, "source": os.path.abspath(input_path), "effects": resolved}
+
+def fuse_chain(rolled, config, kind="fused", input_path=None):
+    """
+    Group consecutive fusible effects so each group runs as a single ffmpeg graph
+    (kind="fused") or as a pipeline of concurrent ffmpeg processes (kind="streamed").
+    kind="parallel" fuses like "fused" but puts runs of per-frame effects
+    (effects.PER_FRAME_EFFECTS, with at least one video filter) in their own
+    ("parallel", ...) units, rendered on chunks of the clip at the same time.
+    Returns a list of units: (kind, [names], [fragments]) or ("single", effect_conf).
+    No-op effects are dropped from their group; unfusable effects become single units.
+    input_path (the job source) is used for media info such as the sample rate.
+    """
+    units = []
+    names, fragments = [], []
+    group = kind
+
+    def flush():
+        if not fragments:
+            return
+        if kind != "parallel":
+            units.append((kind, names, fragments))
+        elif group == "parallel" and any(f.get("vf") for f in fragments):
+            units.append(("parallel", names, fragments))
+        elif units and units[-1][0] == "fused":
+            # audio-only per-frame runs stay in the fused graph next to them
+            units[-1] = ("fused", units[-1][1] + names, units[-1][2] + fragments)
+        else:
+            units.append(("fused", names, fragments))
+
+    duration = probe.probe_media(input_path, config)["duration"] if input_path else None
+    for effect_conf in rolled:
+        frag = effects.build_effect_filters(effect_conf, config, input_path, duration)
+        # unfusable effects are assumed to keep the duration
+        if frag and duration is not None:
+            duration = duration * frag.get("time_scale", 1.0) + frag.get("time_add", 0.0)
+        if frag is None:
+            flush()
+            names, fragments = [], []
+            units.append(("single", effect_conf))
+            continue
+        if not frag:
+            continue
+        if kind == "parallel":
+            wanted = "parallel" if effect_conf["name"] in effects.PER_FRAME_EFFECTS else "fused"
+            if wanted != group:
+                flush()
+                names, fragments, group = [], [], wanted
+        names.append(effect_conf["name"])
+        fragments.append(frag)
+    flush()
+    return units
+
+def group_audio_chain(rolled):
+    """
+    Stages-mode units: each run of consecutive audio-only effects becomes one
+    ("audio", [names], [effect_confs]) unit rendered by the audio engine in a single
+    pass (overlay sounds come from the sound bank); every other effect is a
+    ("single", effect_conf) unit.
+    """
+    units = []
+    run = []
+    for effect_conf in rolled + [None]:
+        if effect_conf is not None and effects.is_audio_only(effect_conf):
+            run.append(effect_conf)
+            continue
+        if run:
+            units.append(("audio", [e["name"] for e in run], run))
+        run = []
+        if effect_conf is not None:
+            units.append(("single", effect_conf))
+    return units
+
+def build_units(rolled, config, mode, source=None):
+    """
+    Units (see fuse_chain / group_audio_chain) that render the resolved effects
+    `rolled` in the given execution mode; source is used for media info.
+    """
+    if mode in ("fused", "streamed", "parallel"):
+        return fuse_chain(rolled, config, kind=mode, input_path=source)
+    if config.get("audio_engine", True) and importlib.util.find_spec("numpy"):
+        return group_audio_chain(rolled)
+    return [("single", effect_conf) for effect_conf in rolled]
+
+def _unit_label(unit):
+    return "+".join(unit[1]) if unit[0] != "single" else unit[1]["name"]
+
+async def _in_thread(fn, *args, **kwargs):
+    # blocking helpers (probing, hashing, copying) must not stall other jobs on the loop
+    return await asyncio.get_running_loop().run_in_executor(None, functools.partial(fn, *args, **kwargs))
+
+async def _run_stage_cmd(cmd, stage, total, dry_run, progress_callback, threads=None, on_event=None, stats=None):
+    # Multi-step effects return a list of commands that run in order
+    if cmd and isinstance(cmd[0], list):
+        for step in cmd:
+            await _run_stage_cmd(step, stage, total, dry_run, progress_callback, threads, on_event, stats)
+        return
+    # Some effect builders may return a ["copy", in, out] pseudo-command => do simple copy
+    if isinstance(cmd, list) and len(cmd) == 3 and cmd[0] == "copy":
+        if dry_run:
+            if progress_callback:
+                progress_callback(stage, total, f"DRY RUN: copy {cmd[1]} -> {cmd[2]}")
+            return
+        await runner.run_cmd(cmd, stats=stats)
+        return
+    cmd = ffmpeg_cmds.with_threads(cmd, threads)
+    if dry_run:
+        # report full command as string
+        if progress_callback:
+            progress_callback(stage, total, "DRY RUN: " + " ".join(cmd if isinstance(cmd, list) else [str(cmd)]))
+    else:
+        await runner.run_cmd(cmd, on_event, env=utils.tool_env(), stats=stats)
+
+async def _run_pipeline(cmds, stage, total, dry_run, progress_callback, threads=None, on_event=None, stats=None):
+    """Run commands concurrently, piping each stdout into the next stdin."""
+    cmds = [ffmpeg_cmds.with_threads(cmd, threads) for cmd in cmds]
+    if dry_run:
+        if progress_callback:
+            progress_callback(stage, total, "DRY RUN: " + " | ".join(" ".join(c) for c in cmds))
+        return
+    await runner.run_pipeline(cmds, on_event, env=utils.tool_env(), stats=stats)
+
+def _progressive_steps(cmd, ffmpeg_path, out_path, progressive):
+    """
+    Steps of a stage command that writes out_path, changed to write the progressive
+    output progressive=(format, path) instead. Python tools and copies write or need
+    a finished file, so their result is remuxed afterwards.
+    """
+    fmt, dest = progressive
+    steps = cmd if isinstance(cmd[0], list) else [cmd]
+    last = steps[-1]
+    if len(last) == 3 and last[0] == "copy":
+        return steps[:-1] + [ffmpeg_cmds.build_remux_cmd(ffmpeg_path, last[1], dest, fmt)]
+    if last[1:2] == ["-m"] or last[-1] != out_path:
+        return steps + [ffmpeg_cmds.build_remux_cmd(ffmpeg_path, out_path, dest, fmt)]
+    return steps[:-1] + [ffmpeg_cmds.with_progressive_output(last, fmt, dest)]
+
+async def _render_unit(unit, current, out_path, ffmpeg_path, config, stage, total, dry_run=False,
+                       progress_callback=None, on_event=None, stats=None, progressive=None):
+    """
+    Render one unit (see build_units) with current as input and out_path as output.
+    progressive: (format, path) to write the unit's result as a progressive output
+    (see ffmpeg_cmds.PROGRESSIVE_FORMATS) instead of out_path.
+    """
+    threads = config.get("threads")
+    if unit[0] == "fused":
+        _, names, fragments = unit
+        if progress_callback:
+            progress_callback(stage, total, f"Running fused {'+'.join(names)} -> {os.path.basename(out_path)}")
+        cmd = ffmpeg_cmds.build_fused_cmd(ffmpeg_path, current, out_path, fragments)
+        if dry_run and progress_callback:
+            progress_callback(stage, total, "DRY RUN: fused graph: " + (ffmpeg_cmds.fused_graph(cmd) or "<none>"))
+        if progressive:
+            cmd = _progressive_steps(cmd, ffmpeg_path, out_path, progressive)
+        await _run_stage_cmd(cmd, stage, total, dry_run, progress_callback, threads, on_event, stats)
+    elif unit[0] == "streamed":
+        _, names, fragments = unit
+        if progress_callback:
+            progress_callback(stage, total, f"Streaming {' | '.join(names)} -> {os.path.basename(out_path)}")
+        cmds = ffmpeg_cmds.build_stream_cmds(ffmpeg_path, current, out_path, fragments)
+        if progressive:
+            cmds[-1] = ffmpeg_cmds.with_progressive_output(cmds[-1], *progressive)
+        await _run_pipeline(cmds, stage, total, dry_run, progress_callback, threads, on_event, stats)
+    else:
+        if unit[0] == "audio":
+            label, builder, effect_arg = " + ".join(unit[1]), effects.build_audio_engine_command, unit[2]
+            if progress_callback:
+                progress_callback(stage, total, f"Running audio engine {label} -> {os.path.basename(out_path)}")
+        elif unit[0] == "parallel":
+            label, builder, effect_arg = "+".join(unit[1]), effects.build_parallel_command, unit[2]
+            if progress_callback:
+                progress_callback(stage, total, f"Rendering {label} in parallel chunks -> {os.path.basename(out_path)}")
+        else:
+            label, builder, effect_arg = unit[1]["name"], effects.build_effect_command, unit[1]
+            if progress_callback:
+                progress_callback(stage, total, f"Running {label} -> {os.path.basename(out_path)}")
+        try:
+            cmd = await _in_thread(builder, ffmpeg_path, current, out_path, effect_arg, config)
+        except (OSError, RuntimeError):
+            if not dry_run or os.path.exists(current):
+                raise
+            # builders that need media info cannot look at stages a dry run never rendered
+            cmd = None
+            if progress_callback:
+                progress_callback(stage, total, f"DRY RUN: {label} needs {os.path.basename(current)} to be rendered first")
+        if cmd and progressive:
+            cmd = _progressive_steps(cmd, ffmpeg_path, out_path, progressive)
+        if cmd:
+            await _run_stage_cmd(cmd, stage, total, dry_run, progress_callback, threads, on_event, stats)
+
+async def _render_spilling(space, unit, current, out_path, ffmpeg_path, config, stage, total, dry_run=False,
+                           progress_callback=None, on_event=None, stats=None, progressive=None):
+    """
+    _render_unit with out_path from space; returns where the unit was rendered. RAM
+    budgets are estimates, so a unit that fails writing to RAM is rendered again on disk.
+    """
+    try:
+        await _render_unit(unit, current, out_path, ffmpeg_path, config, stage, total, dry_run,
+                           progress_callback, on_event, stats, progressive)
+        return out_path
+    except (subprocess.CalledProcessError, OSError):
+        disk_path = None if dry_run or progressive else space.spill(out_path)
+        if not disk_path:
+            raise
+    if progress_callback:
+        progress_callback(stage, total, f"Stage {stage} failed in RAM temp space, rendering it again on disk")
+    await _render_unit(unit, current, disk_path, ffmpeg_path, config, stage, total, dry_run,
+                       progress_callback, on_event, stats, progressive)
+    return disk_path
+
+async def _get_proxy(input_path, config, dry_run, progress_callback, on_event):
+    path, part, cmd = previews.proxy_cmd(input_path, config)
+    if cmd is None:
+        return path
+    if dry_run:
+        if progress_callback:
+            progress_callback(0, 0, "DRY RUN: " + " ".join(cmd))
+        return path
+    if progress_callback:
+        progress_callback(0, 0, f"Rendering preview proxy of {os.path.basename(input_path)}")
+    try:
+        await runner.run_cmd(cmd, on_event)
+        await _in_thread(previews.install_proxy, input_path, path, part)
+    finally:
+        if os.path.exists(part):
+            os.remove(part)
+    return path
+
+def process_video(input_path, output_path, config, dry_run=False, progress_callback=None, mode=None,
+                  seed=None, plan=None, preview=False, on_progress=None, profile=None, progressive=None):
+    """
+    Run the effect chain defined in config on input_path and write to output_path.
+    Blocking wrapper around process_video_async (which documents the arguments);
+    returns the plan that was rendered.
+    """
+    return asyncio.run(process_video_async(input_path, output_path, config, dry_run, progress_callback, mode,
+                                           seed, plan, preview, on_progress, profile, progressive))
+
+async def process_video_async(input_path, output_path, config, dry_run=False, progress_callback=None, mode=None,
+                              seed=None, plan=None, preview=False, on_progress=None, profile=None, progressive=None):
     """
     Run the effect chain defined in config on input_path and write to output_path.
 
     progress_callback: optional callable(stage_index, total_stages, message) for UI updates.
+    on_progress: optional callable(stage_index, total_stages, event) for ffmpeg progress,
+    event being a dict with frame, fps, speed, out_time (seconds) and done (see runner).
+    mode: "stages" runs one ffmpeg process per effect (runs of audio-only effects
+    share one audio engine pass unless config["audio_engine"] is false); "fused" merges consecutive
+    fusible effects into a single filtergraph (one decode, one encode); "streamed"
+    runs them as concurrent processes linked by pipes instead of temp files;
+    "parallel" is "fused" with runs of per-frame effects rendered on keyframe-aligned
+    chunks by a pool of ffmpeg processes (config "parallel_workers", "parallel_min_chunk").
+    Defaults to config["execution_mode"] or "stages".
+    config["threads"] (optional) caps the threads of every ffmpeg call, e.g. when
+    several jobs share a machine (see batch.py).
+    seed: seed for all random choices (default: config["seed"] or a random one).
+    plan: a plan from plan_chain / a saved preview to render instead of rolling the chain.
+    preview: render on a cached low-resolution proxy of input_path (config
+    "preview_height", "preview_fps") and save the plan next to output_path.
+    profile: optional profiling.Profile that gets a record per stage (wall and CPU
+    time, peak RSS, bytes read/written, ffmpeg speed).
+    Cancelling the task stops the running commands and removes the temp files;
+    output_path is only written once every stage succeeded.
+    progressive: "fmp4" or "ts" (see ffmpeg_cmds.PROGRESSIVE_FORMATS) writes the last
+    stage straight to output_path ("-": stdout) as it renders, so consumers can read the
+    output while the job runs; output_path then grows during the last stage and holds
+    a partial file if the job fails. An output_path of "-" implies "fmp4".
+    Returns the plan that was rendered.
     """
     ffmpeg_path = ensure_ffmpeg(config.get("ffmpeg_path", "ffmpeg"))
-    tmpdir = tempfile.mkdtemp(prefix="ytp_tmp_")
+    mode = mode or config.get("execution_mode", "stages")
+    if mode not in EXECUTION_MODES:
+        raise ValueError(f"Unknown execution mode {mode!r}; expected one of {', '.join(EXECUTION_MODES)}")
+    if output_path == "-":
+        progressive = progressive or "fmp4"
+    if progressive and progressive not in ffmpeg_cmds.PROGRESSIVE_FORMATS:
+        raise ValueError(f"Unknown progressive format {progressive!r}; expected one of {', '.join(ffmpeg_cmds.PROGRESSIVE_FORMATS)}")
+    if preview and output_path == "-":
+        raise ValueError("Previews need an output file for their plan")
+    space = tempspace.TempSpace(config)
+    # the last stage renders next to the output and is renamed into place, or streams to it
+    final_path = None if progressive else tempspace.TempSpace.final_path(output_path)
+    streamed_out = False
+    stage = total = 0
+
+    def on_event(event):
+        if on_progress:
+            on_progress(stage, total, event)
+
     try:
-        current = input_path
-        stage = 0
         assets.ensure_asset_dirs(config.get("assets_dir", "assets"))
-        chain = config.get("effect_chain", cfg.default_config()["effect_chain"])
-        total = sum(1 for e in chain if e.get("enabled", True))
-        for effect_conf in chain:
-            name = effect_conf["name"]
-            enabled = effect_conf.get("enabled", True)
-            if not enabled:
+        if plan is None:
+            chain = config.get("effect_chain", cfg.default_config()["effect_chain"])
+            seed = seed if seed is not None else config.get("seed")
+            # previews pin cut times so the full render of their plan matches
+            plan = await _in_thread(plan_chain, chain, config, input_path, seed, progress_callback, exact=preview)
+        if progress_callback:
+            progress_callback(0, 0, f"Seed {plan['seed']}")
+        rolled = plan["effects"]
+        current = input_path
+        if preview:
+            current = await _get_proxy(input_path, config, dry_run, progress_callback, on_event)
+            plan_file = previews.plan_path_for(output_path)
+            if dry_run:
+                if progress_callback:
+                    progress_callback(0, 0, f"DRY RUN: plan would be saved to {plan_file}")
+            else:
+                previews.save_plan(plan, plan_file)
                 if progress_callback:
-                    progress_callback(stage, total, f"Skipping {name} (disabled)")
-                continue
-            prob = effect_conf.get("probability", 1.0)
-            roll = random.random()
-            if roll > prob:
+                    progress_callback(0, 0, f"Saved plan: {plan_file}")
+        # media info (e.g. overlay sizes) comes from what the chain actually renders: the proxy in previews
+        source = current if os.path.isfile(current) else input_path
+        units = await _in_thread(build_units, rolled, config, mode, source)
+        total = len(units)
+        # stage outputs are cached by content; resume after the last cached stage
+        cache = stage_cache.get_cache(config) if units and config.get("stage_cache", False) else None
+        keys = []
+
+        def stage_path(i):
+            if i == total and final_path and not dry_run:
+                return final_path
+            estimate = os.path.getsize(current) if os.path.isfile(current) else 0
+            return space.path(f"stage_{i:02d}.mp4", estimate)
+
+        if cache and os.path.isfile(current):
+            key = await _in_thread(cache.digest, current)
+            for unit in units:
+                key = await _in_thread(cache.key, key, unit, ffmpeg_path)
+                keys.append(key)
+        for i in range(len(keys), 0, -1):
+            out_path = stage_path(i)
+            # the output must not share its data with the cache entry
+            if await _in_thread(cache.fetch, keys[i - 1], out_path, link=i < total):
+                stage, current = i, out_path
                 if progress_callback:
-                    progress_callback(stage, total, f"Skipping {name} (prob {prob:.2f} roll {roll:.2f})")
-                continue
+                    progress_callback(stage, total, f"Reusing cached stage{'s 1-' if i > 1 else ' '}{i}")
+                if profile:
+                    for j, unit in enumerate(units[:i], 1):
+                        profile.end_stage(profile.start_stage(j, _unit_label(unit), cached=True))
+                break
+        for unit in units[stage:]:
             stage += 1
-            out_path = os.path.join(tmpdir, f"stage_{stage:02d}.mp4")
-            if progress_callback:
-                progress_callback(stage, total, f"Running {name} -> {os.path.basename(out_path)}")
-            cmd = effects.build_effect_command(ffmpeg_path, current, out_path, effect_conf, config)
-            # Some effect builders may return a ["copy", in, out] pseudo-command => do simple copy
-            if isinstance(cmd, list) and len(cmd) == 3 and cmd[0] == "copy":
-                # ensure directories
-                shutil.copyfile(cmd[1], cmd[2])
-            else:
-                if dry_run:
-                    # report full command as string
-                    if progress_callback:
-                        progress_callback(stage, total, "DRY RUN: " + " ".join(cmd if isinstance(cmd, list) else [str(cmd)]))
-                else:
-                    # Execute command list
-                    subprocess.run(cmd, check=True)
+            out_path = stage_path(stage)
+            record = profile.start_stage(stage, _unit_label(unit)) if profile else None
+            stats = record["commands"] if record else None
+            last = (progressive, output_path) if progressive and stage == total else None
+            out_path = await _render_spilling(space, unit, current, out_path, ffmpeg_path, config, stage, total,
+                                              dry_run, progress_callback, on_event, stats, progressive=last)
+            streamed_out = bool(last)
+            if not dry_run:
+                # the stage's input and leftovers are no longer needed; the input file and proxy stay
+                space.discard_sidecars(out_path)
+                space.release(current)
             current = out_path
-        # Final copy to requested output
+            if record:
+                profile.end_stage(record, None if dry_run else output_path if streamed_out else out_path)
+            # a progressive last stage has no stage file to keep; stages in RAM are copied into cache_dir
+            if keys and not dry_run and not streamed_out:
+                await _in_thread(cache.put, keys[stage - 1], out_path, label=_unit_label(unit), link=stage < total)
         if dry_run:
             if progress_callback:
                 progress_callback(stage, total, f"DRY RUN: final output would be: {output_path}")
+        elif streamed_out:
+            if progress_callback:
+                progress_callback(stage, total, f"Streamed output: {output_path}")
+        elif progressive:
+            # every stage came from the cache, or nothing to render: remux what there is
+            if progress_callback:
+                progress_callback(stage, total, f"Writing {progressive} output: {output_path}")
+            await runner.run_cmd(ffmpeg_cmds.build_remux_cmd(ffmpeg_path, current, output_path, progressive), on_event)
+        elif current == final_path:
+            await _in_thread(tempspace.place, current, output_path)
+            if progress_callback:
+                progress_callback(stage, total, f"Saved output: {output_path}")
         else:
-            shutil.copyfile(current, output_path)
+            # nothing to render: the output is a copy of the input (or proxy)
+            await _in_thread(shutil.copyfile, current, output_path)
             if progress_callback:
                 progress_callback(stage, total, f"Saved output: {output_path}")
     finally:
-        # keep tmpdir when dry_run so user can inspect; otherwise remove
+        # a dry run writes nothing into the temp dirs; a failed last stage leaves its partial file next to the output
         if dry_run:
             if progress_callback:
-                progress_callback(stage, total, f"Temporary files kept at: {tmpdir}")
-        else:
-            shutil.rmtree(tmpdir, ignore_errors=True)
\ No newline at end of file
+                progress_callback(stage, total, f"DRY RUN: intermediates would go to: {', '.join(space.dirs())}")
+        elif final_path:
+            space.discard_sidecars(final_path)
+            if os.path.exists(final_path):
+                os.remove(final_path)
+        space.cleanup()
+        if profile:
+            profile.finish()
+    return plan
@@ -0,0 +1,98 @@
+"""
+Per-stage performance records for process_video.
+
+A Profile collects one record per stage: wall time, CPU time, peak RSS and bytes
+read/written of the stage's child processes (summed, peak RSS is the maximum), the
+encode speed ffmpeg reported last, and the size of the stage output. It can be
+exported as a JSON report or as a Chrome trace-event file (chrome://tracing,
+https://ui.perfetto.dev).
+"""
+import json
+import os
+import time
+
+# Resource fields summed over the commands of a stage
+_SUMMED = ("cpu_user", "cpu_system", "read_bytes", "write_bytes")
+
+class Profile:
+    def __init__(self, label=""):
+        self.label = label
+        self.started = time.time()
+        self.finished = None
+        self.stages = []
+
+    def start_stage(self, stage, label, cached=False):
+        """Open the record of a stage; fill its "commands" list (see runner.run_cmd stats)."""
+        record = {"stage": stage, "label": label, "cached": cached, "start": time.time(), "commands": [],
+                  "_perf": time.perf_counter()}
+        self.stages.append(record)
+        return record
+
+    def end_stage(self, record, output_path=None):
+        record["wall"] = time.perf_counter() - record.pop("_perf")
+        commands = record["commands"]
+        for key in _SUMMED:
+            values = [c[key] for c in commands if key in c]
+            record[key] = sum(values) if values else None
+        rss = [c["max_rss"] for c in commands if "max_rss" in c]
+        record["max_rss"] = max(rss) if rss else None
+        speeds = [c["speed"] for c in commands if c.get("speed")]
+        record["speed"] = speeds[-1] if speeds else None
+        if output_path and os.path.isfile(output_path):
+            record["output_bytes"] = os.path.getsize(output_path)
+
+    def finish(self):
+        self.finished = time.time()
+
+    def report(self):
+        """Structured report: {"label", "started", "wall", "stages": [...], "totals": {...}}."""
+        end = self.finished or time.time()
+        totals = {"wall": end - self.started}
+        for key in _SUMMED:
+            values = [s[key] for s in self.stages if s.get(key) is not None]
+            totals[key] = sum(values) if values else None
+        rss = [s["max_rss"] for s in self.stages if s.get("max_rss")]
+        totals["max_rss"] = max(rss) if rss else None
+        return {"label": self.label, "started": self.started, "wall": totals["wall"], "stages": self.stages, "totals": totals}
+
+    def write_json(self, path):
+        with open(path, "w", encoding="utf-8") as f:
+            json.dump(self.report(), f, indent=2)
+
+    def trace_events(self):
+        """Chrome trace events: stages on one track, their commands on the tracks below."""
+        pid = os.getpid()
+        events = [{"name": "process_name", "ph": "M", "pid": pid, "args": {"name": self.label or "ytp job"}},
+                  {"name": "thread_name", "ph": "M", "pid": pid, "tid": 1, "args": {"name": "stages"}}]
+        for s in self.stages:
+            args = {k: s.get(k) for k in ("cached", "cpu_user", "cpu_system", "max_rss", "read_bytes", "write_bytes", "speed", "output_bytes")}
+            events.append({"name": f"{s['stage']}: {s['label']}", "cat": "stage", "ph": "X", "pid": pid, "tid": 1,
+                           "ts": s["start"] * 1e6, "dur": s.get("wall", 0.0) * 1e6, "args": args})
+            # commands of a pipeline overlap, so give each one its own track
+            for i, c in enumerate(s["commands"]):
+                events.append({"name": c["cmd"], "cat": "command", "ph": "X", "pid": pid, "tid": 2 + i,
+                               "ts": c["start"] * 1e6, "dur": c.get("wall", 0.0) * 1e6,
+                               "args": {k: v for k, v in c.items() if k not in ("cmd", "start", "wall")}})
+        return events
+
+    def write_trace(self, path):
+        with open(path, "w", encoding="utf-8") as f:
+            json.dump({"traceEvents": self.trace_events(), "displayTimeUnit": "ms"}, f)
+
+def _mb(value):
+    return f"{value / 1048576:8.1f}" if value is not None else "       -"
+
+def _sec(value):
+    return f"{value:7.2f}" if value is not None else "      -"
+
+def format_report(report):
+    lines = ["stage  wall s   cpu s  rss MB  read MB write MB  speed  effect"]
+    for s in report["stages"]:
+        cpu = (s["cpu_user"] or 0.0) + (s["cpu_system"] or 0.0) if s.get("cpu_user") is not None else None
+        speed = f"{s['speed']:5.2f}x" if s.get("speed") else "     -"
+        label = s["label"] + (" (cached)" if s["cached"] else "")
+        lines.append(f"{s['stage']:5d} {_sec(s.get('wall'))} {_sec(cpu)} {_mb(s.get('max_rss'))[2:]} {_mb(s.get('read_bytes'))} {_mb(s.get('write_bytes'))} {speed}  {label}")
+    t = report["totals"]
+    cpu = (t["cpu_user"] or 0.0) + (t["cpu_system"] or 0.0) if t["cpu_user"] is not None else None
+    lines.append(f"total {_sec(t['wall'])} {_sec(cpu)} {_mb(t['max_rss'])[2:]} {_mb(t['read_bytes'])} {_mb(t['write_bytes'])}")
+    return "\n".join(lines)
@@ -0,0 +1,275 @@
+"""
+Asyncio execution engine.
+
+Commands are awaited from asyncio; each child is followed by a thread of its own that
+reads its progress and reaps it with wait4, so CPU time, peak RSS and I/O can be
+reported per command. ffmpeg gets `-progress pipe:1` and its key=value reports
+(frame, fps, speed, out_time) become progress events. Cancelling the task that awaits
+a command stops the command and any children it spawned, so a job can be cancelled
+cleanly and several jobs can share one event loop.
+
+processor.process_video_async runs a whole job on top of run_cmd/run_pipeline;
+JobRunner runs jobs on a background event loop for synchronous callers such as
+the GUI.
+"""
+import asyncio
+import os
+import shutil
+import signal
+import subprocess
+import sys
+import threading
+import time
+
+# Seconds a cancelled process gets to exit after SIGTERM before it is killed
+TERMINATE_TIMEOUT = 5.0
+
+def _is_tool(cmd):
+    return cmd[1:2] == ["-m"]
+
+def with_progress(cmd):
+    """Ask ffmpeg for machine-readable progress on stdout. Other commands are returned as is."""
+    if _is_tool(cmd) or "pipe:1" in cmd:
+        return cmd
+    return [cmd[0], "-progress", "pipe:1", "-nostats"] + cmd[1:]
+
+def _seconds(value):
+    # out_time is HH:MM:SS.microseconds
+    try:
+        h, m, s = value.split(":")
+        return int(h) * 3600 + int(m) * 60 + float(s)
+    except ValueError:
+        return None
+
+class ProgressParser:
+    """Collect ffmpeg -progress lines; feed() returns an event dict at the end of each block."""
+
+    def __init__(self):
+        self._block = {}
+
+    def feed(self, line):
+        key, sep, value = line.strip().partition("=")
+        if not sep:
+            return None
+        self._block[key] = value.strip()
+        if key != "progress":
+            return None
+        block, self._block = self._block, {}
+        event = {"done": value.strip() == "end"}
+        for name, conv in (("frame", int), ("fps", float)):
+            try:
+                event[name] = conv(block[name])
+            except (KeyError, ValueError):
+                event[name] = None
+        speed = block.get("speed", "").rstrip("x")
+        try:
+            event["speed"] = float(speed)
+        except ValueError:
+            event["speed"] = None
+        event["out_time"] = _seconds(block["out_time"]) if "out_time" in block else None
+        return event
+
+def _spawn_kwargs():
+    # own process group, so python tools (frame_shuffle, chunked_reverse) and their
+    # ffmpeg children can be stopped together
+    if os.name == "nt":
+        return {"creationflags": subprocess.CREATE_NEW_PROCESS_GROUP}
+    return {"start_new_session": True}
+
+def _signal(proc, kill=False):
+    if proc.returncode is not None:
+        return
+    try:
+        if os.name == "nt":
+            proc.kill() if kill else proc.terminate()
+        else:
+            os.killpg(proc.pid, signal.SIGKILL if kill else signal.SIGTERM)
+    except (ProcessLookupError, PermissionError):
+        pass
+
+def _exit_code(status):
+    if os.WIFSIGNALED(status):
+        return -os.WTERMSIG(status)
+    return os.WEXITSTATUS(status)
+
+def _proc_io(pid):
+    """Bytes read/written by a process (all I/O, pipes included) from /proc; {} elsewhere."""
+    try:
+        with open(f"/proc/{pid}/io", "r") as f:
+            fields = dict(line.split(":", 1) for line in f)
+        return {"read_bytes": int(fields["rchar"]), "write_bytes": int(fields["wchar"])}
+    except (OSError, KeyError, ValueError):
+        return {}
+
+def _wait_child(proc, stats):
+    """
+    Block until proc exits and add its resource usage to stats where the OS reports
+    it: cpu_user, cpu_system (seconds), max_rss (bytes), read_bytes, write_bytes.
+    The figures include children the process waited for (e.g. the ffmpeg calls of
+    a python tool).
+    """
+    if not hasattr(os, "wait4"):
+        proc.wait()
+        return
+    if hasattr(os, "waitid"):
+        # wait without reaping, so the I/O counters of the exited child can still be read
+        os.waitid(os.P_PID, proc.pid, os.WEXITED | os.WNOWAIT)
+        stats.update(_proc_io(proc.pid))
+    _, status, usage = os.wait4(proc.pid, 0)
+    proc.returncode = _exit_code(status)
+    # ru_maxrss is in KiB on Linux and in bytes on macOS
+    scale = 1 if sys.platform == "darwin" else 1024
+    stats.update(cpu_user=usage.ru_utime, cpu_system=usage.ru_stime, max_rss=usage.ru_maxrss * scale)
+
+def _watch(proc, reader, on_event, stats):
+    """
+    Follow proc from a thread of its own: forward ffmpeg progress read from reader
+    (if any), then wait for the exit. Returns a future that completes with the exit.
+    A dedicated thread per child means a busy executor can never leave a pipe unread.
+    """
+    loop = asyncio.get_running_loop()
+    done = loop.create_future()
+    start = time.perf_counter()
+
+    def finish(exc):
+        if done.done():
+            return
+        if exc is None:
+            done.set_result(proc.returncode)
+        else:
+            done.set_exception(exc)
+
+    def body():
+        exc = None
+        try:
+            if reader is not None:
+                parser = ProgressParser()
+                for line in reader:
+                    event = parser.feed(line.decode("utf-8", "replace"))
+                    if event is None:
+                        continue
+                    if event["speed"] is not None:
+                        stats["speed"] = event["speed"]
+                    if on_event:
+                        loop.call_soon_threadsafe(on_event, event)
+                reader.close()
+            _wait_child(proc, stats)
+            stats["wall"] = time.perf_counter() - start
+            stats["returncode"] = proc.returncode
+        except BaseException as e:
+            exc = e
+        loop.call_soon_threadsafe(finish, exc)
+
+    threading.Thread(target=body, name=f"ytp-wait-{proc.pid}", daemon=True).start()
+    return done
+
+def _new_stats(cmd, stats):
+    record = {"cmd": cmd[2] if _is_tool(cmd) else os.path.basename(cmd[0]), "start": time.time()}
+    if stats is not None:
+        stats.append(record)
+    return record
+
+async def _stop(procs, waits):
+    for proc in procs:
+        _signal(proc)
+    try:
+        await asyncio.wait_for(asyncio.shield(asyncio.gather(*waits)), TERMINATE_TIMEOUT)
+    except asyncio.TimeoutError:
+        for proc in procs:
+            _signal(proc, kill=True)
+        await asyncio.gather(*waits, return_exceptions=True)
+
+async def run_cmd(cmd, on_event=None, env=None, stats=None):
+    """
+    Run one command. on_event: optional callable(event) for ffmpeg progress, where
+    event has frame, fps, speed, out_time (seconds; any may be None) and done.
+    stats: optional list that gets a dict per command with cmd, start (epoch), wall,
+    cpu_user, cpu_system, max_rss, read_bytes, write_bytes and the last reported
+    ffmpeg speed (keys the OS cannot provide are missing).
+    Cancelling the awaiting task terminates the command.
+    Raises subprocess.CalledProcessError when it fails.
+    """
+    if isinstance(cmd, list) and len(cmd) == 3 and cmd[0] == "copy":
+        record = _new_stats(cmd, stats)
+        start = time.perf_counter()
+        await asyncio.get_running_loop().run_in_executor(None, shutil.copyfile, cmd[1], cmd[2])
+        record["wall"] = time.perf_counter() - start
+        return
+    cmd = with_progress(cmd)
+    reporting = "-progress" in cmd
+    record = _new_stats(cmd, stats)
+    proc = subprocess.Popen(cmd, stdin=subprocess.DEVNULL, stdout=subprocess.PIPE if reporting else None, env=env, **_spawn_kwargs())
+    done = _watch(proc, proc.stdout if reporting else None, on_event, record)
+    try:
+        await asyncio.shield(done)
+    except asyncio.CancelledError:
+        await _stop([proc], [done])
+        raise
+    if proc.returncode != 0:
+        raise subprocess.CalledProcessError(proc.returncode, cmd)
+
+async def run_pipeline(cmds, on_event=None, env=None, stats=None):
+    """
+    Run commands concurrently with each stdout piped into the next stdin (see
+    processor streamed mode). Progress is reported for the last command only;
+    stats as for run_cmd, one entry per command.
+    """
+    cmds = list(cmds[:-1]) + [with_progress(cmds[-1])]
+    reporting = "-progress" in cmds[-1]
+    procs, waits = [], []
+    try:
+        stdin = subprocess.DEVNULL
+        for i, cmd in enumerate(cmds):
+            last = i == len(cmds) - 1
+            record = _new_stats(cmd, stats)
+            stdout = subprocess.PIPE if last and reporting else (None if last else subprocess.PIPE)
+            proc = subprocess.Popen(cmd, stdin=stdin, stdout=stdout, env=env, **_spawn_kwargs())
+            if i > 0:
+                # only the children may hold the pipe ends, so EOF/EPIPE propagate
+                stdin.close()
+            procs.append(proc)
+            waits.append(_watch(proc, proc.stdout if last and reporting else None, on_event, record))
+            stdin = proc.stdout
+        await asyncio.shield(asyncio.gather(*waits, return_exceptions=True))
+    except BaseException:
+        # cancelled, or a later command could not be started
+        if procs:
+            await _stop(procs, waits)
+        raise
+    for cmd, proc in zip(cmds, procs):
+        if proc.returncode != 0:
+            raise subprocess.CalledProcessError(proc.returncode, cmd)
+
+class JobRunner:
+    """
+    Run process_video jobs concurrently on an event loop in a background thread.
+
+        runner = JobRunner()
+        future = runner.submit(input_path, output_path, config, progress_callback=..., on_progress=...)
+        future.cancel()   # stops the job's processes and removes its temp files
+        future.result()   # the rendered plan, or the job's exception
+
+    Callbacks are called from the runner thread.
+    """
+
+    def __init__(self):
+        self._loop = asyncio.new_event_loop()
+        self._thread = threading.Thread(target=self._loop.run_forever, name="ytp-runner", daemon=True)
+        self._thread.start()
+
+    def submit(self, input_path, output_path, config, **kwargs):
+        """Start a job (kwargs as for processor.process_video); returns a concurrent.futures.Future."""
+        from . import processor
+        coro = processor.process_video_async(input_path, output_path, config, **kwargs)
+        return asyncio.run_coroutine_threadsafe(coro, self._loop)
+
+    def close(self):
+        """Cancel running jobs and stop the loop."""
+        async def _cancel_all():
+            tasks = [t for t in asyncio.all_tasks() if t is not asyncio.current_task()]
+            for t in tasks:
+                t.cancel()
+            await asyncio.gather(*tasks, return_exceptions=True)
+        asyncio.run_coroutine_threadsafe(_cancel_all(), self._loop).result()
+        self._loop.call_soon_threadsafe(self._loop.stop)
+        self._thread.join()
@@ -0,0 +1,147 @@
+"""
+Speech segment index for sentence mixing and word-aligned cuts.
+
+The soundtrack is decoded once to 16 kHz mono float PCM over a pipe and reduced to
+the energy (dB) of 10 ms frames, block by block. Frames clearly above the noise
+floor are voiced; voiced runs separated by at least MIN_SILENCE are words, and words
+separated by less than PHRASE_SILENCE belong to the same phrase. Inside a voiced run, dips below
+the middle between the voicing threshold and the loud level (at least DIP_DB above
+the threshold) split words that run into each other, at the quietest frame of the dip. Everything after decoding is vectorised NumPy.
+
+The index is stored in probe.sqlite next to the probe data (keyed by path, size and
+mtime), so effects can pick hundreds of snippets per render without decoding the
+source again:
+  {"version": 1, "duration": seconds, "words": [[start, end, phrase number], ..]}
+"""
+import subprocess
+
+from . import ffmpeg_cmds, probe
+
+INDEX_VERSION = 1
+SAMPLE_RATE = 16000
+FRAME_SECONDS = 0.01
+# Silence (seconds) that separates words / phrases
+MIN_SILENCE = 0.06
+PHRASE_SILENCE = 0.3
+# Shortest word kept (seconds)
+MIN_WORD = 0.08
+# Smallest distance (dB) between the voicing threshold and the level a dip must fall under
+DIP_DB = 6.0
+# Frames below this level are always silent
+FLOOR_DB = -60.0
+# Frames per read from the decoder
+BLOCK_FRAMES = 1000
+# Indexes kept in memory
+MEMORY_ENTRIES = 64
+
+_memory = probe.LRU(MEMORY_ENTRIES)
+
+def frame_energy(stream, hop):
+    """Energy in dB of each hop-sample frame of a mono float32 PCM stream (trailing partial frame dropped)."""
+    import numpy as np
+    size = hop * BLOCK_FRAMES * 4
+    chunks = []
+    rest = b""
+    while True:
+        data = stream.read(size)
+        if not data:
+            break
+        data = rest + data
+        usable = len(data) // (hop * 4) * hop * 4
+        rest = data[usable:]
+        if usable:
+            frames = np.frombuffer(data[:usable], dtype=np.float32).reshape(-1, hop)
+            chunks.append(10.0 * np.log10(np.mean(frames.astype(np.float64) ** 2, axis=1) + 1e-12))
+    return np.concatenate(chunks) if chunks else np.zeros(0)
+
+def _runs(mask):
+    """(starts, ends) frame indices of the True runs of a boolean array."""
+    import numpy as np
+    edges = np.diff(np.concatenate([[0], mask.astype(np.int8), [0]]))
+    return np.flatnonzero(edges == 1), np.flatnonzero(edges == -1)
+
+def _fill_gaps(mask, max_gap):
+    """Set False runs shorter than max_gap frames between True runs to True."""
+    import numpy as np
+    starts, ends = _runs(mask)
+    short = starts[1:] - ends[:-1] < max_gap
+    delta = np.zeros(len(mask) + 1, dtype=np.int64)
+    np.add.at(delta, ends[:-1][short], 1)
+    np.add.at(delta, starts[1:][short], -1)
+    return mask | (np.cumsum(delta[:-1]) > 0)
+
+def _argmin_ranges(values, starts, ends):
+    """Index of the smallest value in each [start, end) range (ranges non-empty)."""
+    import numpy as np
+    lengths = ends - starts
+    first = np.cumsum(lengths) - lengths
+    group = np.repeat(np.arange(len(starts)), lengths)
+    idx = np.repeat(starts, lengths) + np.arange(lengths.sum()) - np.repeat(first, lengths)
+    order = np.lexsort((values[idx], group))
+    return idx[order[first]]
+
+def analyze(energy, frame_seconds=FRAME_SECONDS):
+    """Build the index (without version/duration) from per-frame energies in dB."""
+    import numpy as np
+    if not len(energy):
+        return {"words": []}
+    floor, peak = np.percentile(energy, 10), np.percentile(energy, 95)
+    threshold = max(FLOOR_DB, floor + max(6.0, 0.25 * (peak - floor)))
+    voiced = _fill_gaps(energy > threshold, int(round(MIN_SILENCE / frame_seconds)))
+    starts, ends = _runs(voiced)
+    # split runs at dips: gaps between the louder parts that stay inside a voiced run
+    loud_starts, loud_ends = _runs(energy > threshold + max(DIP_DB, 0.5 * (peak - threshold)))
+    gap_a, gap_b = loud_ends[:-1], loud_starts[1:]
+    inside = voiced[gap_a] & (np.searchsorted(ends, gap_a, side="right") == np.searchsorted(ends, gap_b - 1, side="right"))
+    cuts = _argmin_ranges(energy, gap_a[inside], gap_b[inside])
+    bounds = np.sort(np.concatenate([starts, cuts]))
+    word_ends = np.sort(np.concatenate([ends, cuts]))
+    keep = word_ends - bounds >= int(round(MIN_WORD / frame_seconds))
+    # phrases: voiced runs merged across pauses shorter than PHRASE_SILENCE
+    _, phrase_ends = _runs(_fill_gaps(voiced, int(round(PHRASE_SILENCE / frame_seconds))))
+    phrase = np.searchsorted(phrase_ends, bounds[keep], side="right")
+    words = np.round(np.stack([bounds[keep], word_ends[keep]], axis=1) * frame_seconds, 3)
+    return {"words": [[a, b, int(p)] for (a, b), p in zip(words.tolist(), phrase)]}
+
+def build_index(ffmpeg_path, input_path):
+    """Decode the first audio stream of input_path and return its segment index."""
+    cmd = ffmpeg_cmds.build_pcm_decode_cmd(ffmpeg_path, input_path, SAMPLE_RATE, 1)
+    proc = subprocess.Popen(cmd, stdin=subprocess.DEVNULL, stdout=subprocess.PIPE)
+    try:
+        energy = frame_energy(proc.stdout, int(SAMPLE_RATE * FRAME_SECONDS))
+    finally:
+        proc.stdout.close()
+        proc.wait()
+    if proc.returncode != 0:
+        raise subprocess.CalledProcessError(proc.returncode, cmd)
+    index = analyze(energy)
+    index.update(version=INDEX_VERSION, duration=round(len(energy) * FRAME_SECONDS, 3))
+    return index
+
+def segment_index(path, config):
+    """
+    Cached segment index of path, building it on a cache miss. Returns None when the
+    file has no audio. Files in scratch dirs (see probe.add_scratch_dir) are cached in
+    memory only. Needs numpy; raises RuntimeError when the audio cannot be decoded.
+    """
+    if not probe.probe_media(path, config)["has_audio"]:
+        return None
+    key = probe.file_key(path)
+    hit = _memory.get(key)
+    if hit:
+        return hit
+    cache = probe.persistent_cache(key[0], config)
+    index = cache.get_segments(*key) if cache else None
+    if not index or index.get("version") != INDEX_VERSION:
+        try:
+            index = build_index(config.get("ffmpeg_path", "ffmpeg"), key[0])
+        except (subprocess.CalledProcessError, OSError) as e:
+            raise RuntimeError(f"Audio analysis failed for {key[0]}: {e}")
+        if cache:
+            cache.put_segments(*key, index)
+    _memory.put(key, index)
+    return index
+
+def boundaries(words):
+    """Cut points between consecutive words: the middle of the pause between them."""
+    return [round((a[1] + b[0]) / 2.0, 6) for a, b in zip(words, words[1:])]
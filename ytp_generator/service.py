@@ -0,0 +1,370 @@
+"""
+Render service: a long-running process that renders jobs as they arrive.
+
+Jobs come from a watch folder (every new media file is rendered with the service
+config once it stops growing), from a queue folder of JSON job files ({"input",
+optional "output" and "config", as in batch manifests; a processed file is renamed
+to .done or .failed) and from POST /jobs on the status endpoint. One process keeps
+the config, the asset index and the probe/keyframe caches in memory, so jobs skip
+the interpreter start-up, ffmpeg lookup and asset scans of separate CLI runs.
+
+At most `workers` jobs render at once (each with a thread budget, see
+batch.plan_workers). The status endpoint speaks plain HTTP on a local TCP port or a
+Unix socket:
+  GET  /status      queue depth, running jobs, counters
+  GET  /jobs        every job with its state and last progress message
+  GET  /jobs/<id>   one job
+  POST /jobs        queue a job: {"input": .., "output": .., "config": {..}}
+POST bodies must be sent as Content-Type: application/json (so browsers cannot send
+them as simple cross-origin requests) and are only accepted when the service has an
+out_dir; their output must lie in it. The config of POSTed and queue-folder jobs is
+applied over the service config and may not name executables or directories (keys
+ending in _path or _dir).
+
+SIGINT/SIGTERM drain the service: intake stops, running jobs finish and queued jobs
+are left for the next start (their inputs have no output yet / their job files are
+still in the queue folder). A second signal cancels the running jobs.
+"""
+import asyncio
+import itertools
+import json
+import os
+import signal
+import time
+
+from . import assets, batch, processor
+
+# Finished jobs kept for the status endpoint: at most HISTORY, none older than HISTORY_SECONDS
+HISTORY = 1000
+HISTORY_SECONDS = 24 * 3600
+# Config keys that POSTed and queue-folder jobs may not set: executables and directories
+UNSAFE_KEY_SUFFIXES = ("_path", "_dir")
+
+class Job:
+    def __init__(self, job_id, input_path, output_path, config=None, source=None):
+        self.id = job_id
+        self.input = input_path
+        self.output = output_path
+        self.config = config
+        # job file of queue-folder jobs
+        self.source = source
+        self.state = "queued"
+        self.message = ""
+        self.stage = self.total = 0
+        self.seed = None
+        self.error = None
+        self.submitted = time.time()
+        self.started = self.finished = None
+
+    def to_dict(self):
+        return {
+            "id": self.id, "input": self.input, "output": self.output, "state": self.state,
+            "stage": self.stage, "total": self.total, "message": self.message, "seed": self.seed,
+            "error": self.error, "submitted": self.submitted, "started": self.started, "finished": self.finished,
+        }
+
+def parse_address(address):
+    """"unix:/path" -> ("unix", path); "host:port" or "port" -> ("tcp", (host, port))."""
+    if address.startswith("unix:"):
+        return "unix", address[5:]
+    host, _, port = address.rpartition(":")
+    return "tcp", (host or "127.0.0.1", int(port))
+
+class RenderService:
+    def __init__(self, config, watch_dir=None, queue_dir=None, out_dir=None, workers=None, threads=None,
+                 status_address=None, poll_seconds=2.0, suffix="_ytp", log=print):
+        self.config = config
+        self.watch_dir = os.path.abspath(watch_dir) if watch_dir else None
+        self.queue_dir = os.path.abspath(queue_dir) if queue_dir else None
+        self.out_dir = os.path.abspath(out_dir) if out_dir else None
+        self.workers, self.threads = batch.plan_workers(workers, threads)
+        self.status_address = status_address
+        self.poll_seconds = poll_seconds
+        self.suffix = suffix
+        self.log = log
+        self.jobs = {}
+        self.counts = {"done": 0, "failed": 0, "cancelled": 0}
+        self.started = time.time()
+        self.draining = False
+        self._ids = itertools.count(1)
+        self._queue = None
+        self._seen = {}
+        self._known = set()
+        self._running = set()
+
+    # intake
+
+    def output_for(self, input_path):
+        stem = os.path.splitext(os.path.basename(input_path))[0]
+        return os.path.join(self.out_dir or os.path.dirname(input_path), stem + self.suffix + ".mp4")
+
+    def submit(self, input_path, output_path=None, config=None, source=None):
+        """Queue a job; returns it. Raises RuntimeError while draining."""
+        if self.draining:
+            raise RuntimeError("service is draining")
+        job = Job(next(self._ids), os.path.abspath(input_path), os.path.abspath(output_path or self.output_for(input_path)),
+                  config, source)
+        self.jobs[job.id] = job
+        self._queue.put_nowait(job)
+        self.log(f"[job {job.id}] queued {job.input}")
+        return job
+
+    def _is_ours(self, name):
+        """Files the service itself writes: outputs and the hidden partial files of running jobs."""
+        stem = os.path.splitext(name)[0]
+        return name.startswith(".") or ".part" in name or stem.endswith(self.suffix)
+
+    def _stable_files(self, folder, extensions):
+        """Files of folder whose size and mtime did not change since the last poll."""
+        ready = []
+        for name in sorted(os.listdir(folder)):
+            path = os.path.join(folder, name)
+            if os.path.splitext(name)[1].lower() not in extensions or path in self._known or not os.path.isfile(path):
+                continue
+            # outputs land in the watch folder when there is no out_dir; never render them again
+            if folder == self.watch_dir and self._is_ours(name):
+                continue
+            st = os.stat(path)
+            sig = (st.st_size, st.st_mtime_ns)
+            if self._seen.get(path) == sig:
+                ready.append(path)
+            self._seen[path] = sig
+        return ready
+
+    def _scan(self):
+        """New jobs of the watch and queue folders as (input, output, config, job file) tuples."""
+        found = []
+        # forget files that were removed (or renamed to .done/.failed) so the sets stay small
+        self._known = {p for p in self._known if os.path.exists(p)}
+        self._seen = {p: sig for p, sig in self._seen.items() if p not in self._known and os.path.exists(p)}
+        if self.watch_dir:
+            for path in self._stable_files(self.watch_dir, assets.MEDIA_EXTENSIONS):
+                self._known.add(path)
+                # rendered before (e.g. by an earlier run of the service)
+                if not os.path.exists(self.output_for(path)):
+                    found.append((path, None, None, None))
+        if self.queue_dir:
+            for path in self._stable_files(self.queue_dir, {".json"}):
+                self._known.add(path)
+                try:
+                    with open(path, "r", encoding="utf-8") as f:
+                        entry = json.load(f)
+                    if not isinstance(entry, dict):
+                        raise ValueError("a job file holds one JSON object")
+                    base = os.path.dirname(path)
+                    found.append((os.path.join(base, entry["input"]),
+                                  os.path.join(base, entry["output"]) if entry.get("output") else None,
+                                  self._job_config(entry.get("config")), path))
+                except (OSError, ValueError, KeyError, TypeError) as e:
+                    self.log(f"Bad job file {path}: {e}")
+                    self._mark(path, ".failed")
+        return found
+
+    def _mark(self, path, suffix):
+        """Rename a processed job file; a file that was moved away or a read-only folder is only logged."""
+        try:
+            os.replace(path, path + suffix)
+        except OSError as e:
+            self.log(f"Cannot rename job file {path}: {e}")
+
+    async def _watch(self):
+        while not self.draining:
+            try:
+                # directory scans run off the loop; jobs are queued on it
+                for input_path, output_path, config, source in await processor._in_thread(self._scan):
+                    if not self.draining:
+                        self.submit(input_path, output_path, config, source)
+            except OSError as e:
+                self.log(f"Watch error: {e}")
+            await asyncio.sleep(self.poll_seconds)
+
+    # workers
+
+    async def _render(self, job):
+        job.state, job.started = "running", time.time()
+        self.log(f"[job {job.id}] rendering {job.input} -> {job.output}")
+        config = dict(job.config or self.config, threads=self.threads)
+
+        def progress(stage, total, msg):
+            job.stage, job.total, job.message = stage, total, msg
+
+        try:
+            if os.path.dirname(job.output):
+                os.makedirs(os.path.dirname(job.output), exist_ok=True)
+            plan = await processor.process_video_async(job.input, job.output, config, progress_callback=progress)
+            job.seed = plan["seed"]
+            job.state = "done"
+        except asyncio.CancelledError:
+            job.state = "cancelled"
+            raise
+        except Exception as e:
+            job.state, job.error = "failed", f"{type(e).__name__}: {e}"
+        finally:
+            job.finished = time.time()
+            self.counts[job.state] = self.counts.get(job.state, 0) + 1
+            self.log(f"[job {job.id}] {job.state}" + (f": {job.error}" if job.error else ""))
+            if job.source and job.state in ("done", "failed"):
+                self._mark(job.source, ".done" if job.state == "done" else ".failed")
+            self._forget()
+
+    def _forget(self):
+        finished = sorted((j for j in self.jobs.values() if j.finished), key=lambda j: j.finished)
+        cutoff = time.time() - HISTORY_SECONDS
+        for n, job in enumerate(finished):
+            if n < len(finished) - HISTORY or job.finished < cutoff:
+                del self.jobs[job.id]
+
+    async def _worker(self):
+        while not self.draining:
+            job = await self._queue.get()
+            if self.draining:
+                break
+            task = asyncio.current_task()
+            self._running.add(task)
+            try:
+                await self._render(job)
+            finally:
+                self._running.discard(task)
+
+    # status endpoint
+
+    def status(self):
+        return {
+            "queue_depth": sum(1 for j in self.jobs.values() if j.state == "queued"),
+            "running": [j.to_dict() for j in self.jobs.values() if j.state == "running"],
+            "workers": self.workers,
+            "threads": self.threads,
+            "draining": self.draining,
+            "uptime": time.time() - self.started,
+            "counts": dict(self.counts),
+        }
+
+    def _job_config(self, config):
+        """Config of a submitted job: its settings over the service config. Raises ValueError for unsafe ones."""
+        if config is None:
+            return None
+        if not isinstance(config, dict):
+            raise ValueError("config must be an object")
+        unsafe = sorted(k for k in config if k.endswith(UNSAFE_KEY_SUFFIXES))
+        if unsafe:
+            raise ValueError(f"config may not set {', '.join(unsafe)}")
+        # executables and directories come from the service config
+        return dict(self.config, **config)
+
+    def _http_job(self, entry):
+        """(input, output, config) of a POST /jobs body; raises ValueError for jobs the endpoint must not run."""
+        if not isinstance(entry, dict):
+            raise ValueError("the body must be a JSON object")
+        if not self.out_dir:
+            # outputs would otherwise land next to any readable file named as input
+            raise ValueError("the service takes POSTed jobs only when it runs with an out_dir")
+        output = os.path.abspath(entry.get("output") or self.output_for(entry["input"]))
+        if os.path.commonpath([self.out_dir, output]) != self.out_dir:
+            raise ValueError("output must be inside the service's out_dir")
+        return entry["input"], output, self._job_config(entry.get("config"))
+
+    def _respond(self, method, path, body, content_type=""):
+        if method == "GET" and path == "/status":
+            return 200, self.status()
+        if method == "GET" and path == "/jobs":
+            return 200, [j.to_dict() for j in self.jobs.values()]
+        if method == "GET" and path.startswith("/jobs/"):
+            job = self.jobs.get(int(path[6:])) if path[6:].isdigit() else None
+            return (200, job.to_dict()) if job else (404, {"error": "no such job"})
+        if method == "POST" and path == "/jobs":
+            if content_type.split(";")[0].strip().lower() != "application/json":
+                return 415, {"error": "Content-Type must be application/json"}
+            try:
+                entry = json.loads(body or b"{}")
+                job = self.submit(*self._http_job(entry))
+            except (ValueError, KeyError, TypeError) as e:
+                return 400, {"error": f"bad job: {e}"}
+            except RuntimeError as e:
+                return 503, {"error": str(e)}
+            return 202, job.to_dict()
+        return 404, {"error": "not found"}
+
+    async def _handle(self, reader, writer):
+        try:
+            request = await reader.readline()
+            method, path, _ = request.decode("latin-1").split(" ", 2)
+            length, content_type = 0, ""
+            while True:
+                line = await reader.readline()
+                if line in (b"\r\n", b"\n", b""):
+                    break
+                name, _, value = line.decode("latin-1").partition(":")
+                if name.strip().lower() == "content-length":
+                    length = int(value.strip())
+                elif name.strip().lower() == "content-type":
+                    content_type = value.strip()
+            body = await reader.readexactly(length) if length else b""
+            code, data = self._respond(method, path.split("?")[0], body, content_type)
+        except (ValueError, asyncio.IncompleteReadError):
+            code, data = 400, {"error": "bad request"}
+        payload = json.dumps(data, indent=2).encode("utf-8")
+        reason = {200: "OK", 202: "Accepted", 400: "Bad Request", 404: "Not Found", 415: "Unsupported Media Type",
+                  503: "Service Unavailable"}[code]
+        writer.write(f"HTTP/1.0 {code} {reason}\r\nContent-Type: application/json\r\n"
+                     f"Content-Length: {len(payload)}\r\nConnection: close\r\n\r\n".encode("latin-1") + payload)
+        try:
+            await writer.drain()
+        finally:
+            writer.close()
+
+    async def _start_status(self):
+        kind, where = parse_address(self.status_address)
+        if kind == "unix":
+            if os.path.exists(where):
+                os.remove(where)
+            return await asyncio.start_unix_server(self._handle, path=where)
+        return await asyncio.start_server(self._handle, host=where[0], port=where[1])
+
+    # lifecycle
+
+    def drain(self):
+        """Stop taking jobs; running jobs finish, queued ones are left for the next start."""
+        if self.draining:
+            # second request: stop the running jobs too
+            for task in list(self._running):
+                task.cancel()
+            return
+        self.draining = True
+        self.log(f"Draining: waiting for {len(self._running)} running job(s); signal again to cancel them")
+        # wake idle workers so they can exit
+        for _ in range(self.workers):
+            self._queue.put_nowait(None)
+
+    async def run(self):
+        processor.ensure_ffmpeg(self.config.get("ffmpeg_path", "ffmpeg"))
+        assets.ensure_asset_dirs(self.config.get("assets_dir", "assets"))
+        # warm the asset index once; jobs only rescan folders that changed
+        await processor._in_thread(assets.get_index, self.config)
+        self._queue = asyncio.Queue()
+        loop = asyncio.get_running_loop()
+        for sig in (signal.SIGINT, signal.SIGTERM):
+            try:
+                loop.add_signal_handler(sig, self.drain)
+            except (NotImplementedError, RuntimeError):
+                # Windows: Ctrl+C arrives as KeyboardInterrupt instead
+                pass
+        server = await self._start_status() if self.status_address else None
+        if server:
+            self.log(f"Status: {self.status_address}")
+        watcher = asyncio.create_task(self._watch())
+        workers = [asyncio.create_task(self._worker()) for _ in range(self.workers)]
+        self.log(f"Serving with {self.workers} workers x {self.threads} threads"
+                 + (f", watching {self.watch_dir}" if self.watch_dir else "")
+                 + (f", queue {self.queue_dir}" if self.queue_dir else ""))
+        try:
+            await asyncio.gather(*workers, return_exceptions=True)
+        finally:
+            watcher.cancel()
+            if server:
+                server.close()
+                await server.wait_closed()
+                if parse_address(self.status_address)[0] == "unix":
+                    os.remove(parse_address(self.status_address)[1])
+        left = sum(1 for j in self.jobs.values() if j.state == "queued")
+        self.log(f"Stopped: {self.counts['done']} done, {self.counts['failed']} failed, "
+                 f"{self.counts['cancelled']} cancelled, {left} left queued")
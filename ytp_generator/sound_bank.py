@@ -0,0 +1,111 @@
+"""
+Sound bank: overlay and meme sounds pre-decoded to memory-mapped PCM.
+
+Each sound is decoded once into cache_dir/sound_bank as raw interleaved float32 at
+SAMPLE_RATE / CHANNELS, peak-normalised to PEAK, so every job mixes the same layout
+without decoding MP3/WAV files again. Entries are keyed by source path, size and
+mtime (like preview proxies); a changed source gets a new entry and its old one is
+dropped. Concurrent jobs map the same files and share them through the page cache.
+
+audio_engine maps entries with open_pcm(); ffmpeg reads them with input_args().
+"""
+import glob
+import hashlib
+import os
+import subprocess
+import threading
+
+from . import assets, ffmpeg_cmds
+
+BANK_DIR = "sound_bank"
+SAMPLE_RATE = 44100
+CHANNELS = 2
+# Peak level every sound is scaled to
+PEAK = 0.9
+
+def _digest(text):
+    return hashlib.sha1(text.encode("utf-8")).hexdigest()[:16]
+
+def input_args():
+    """ffmpeg options to put before -i <bank entry>."""
+    return ["-f", "f32le", "-ar", str(SAMPLE_RATE), "-ac", str(CHANNELS)]
+
+def open_pcm(path):
+    """Read-only memory map of a bank entry as a (frames, CHANNELS) float32 array."""
+    import numpy as np
+    if os.path.getsize(path) == 0:
+        return np.zeros((0, CHANNELS), dtype=np.float32)
+    return np.memmap(path, dtype=np.float32, mode="r").reshape(-1, CHANNELS)
+
+def _normalize(path):
+    import numpy as np
+    if os.path.getsize(path) < 4:
+        return
+    data = np.memmap(path, dtype=np.float32, mode="r+")
+    peak = float(np.abs(data).max())
+    if peak > 0.0:
+        data *= np.float32(PEAK / peak)
+        data.flush()
+    del data
+
+class SoundBank:
+    def __init__(self, cache_dir, ffmpeg_path="ffmpeg"):
+        self.dir = os.path.join(os.path.abspath(cache_dir), BANK_DIR)
+        self.ffmpeg_path = ffmpeg_path
+        os.makedirs(self.dir, exist_ok=True)
+
+    def path_for(self, source):
+        """Bank entry path of source (whether or not it exists yet)."""
+        source = os.path.abspath(source)
+        st = os.stat(source)
+        settings = f"{st.st_size}|{st.st_mtime_ns}|{SAMPLE_RATE}|{CHANNELS}|{PEAK}"
+        return os.path.join(self.dir, f"{_digest(source)}_{_digest(settings)}.f32")
+
+    def ensure(self, source):
+        """Return the bank entry of source, decoding it first if needed."""
+        path = self.path_for(source)
+        if os.path.isfile(path):
+            return path
+        part = f"{path}.{os.getpid()}.{threading.get_ident()}.part"
+        cmd = ffmpeg_cmds.build_pcm_decode_cmd(self.ffmpeg_path, source, SAMPLE_RATE, CHANNELS)
+        cmd[-1] = part
+        try:
+            subprocess.run(cmd, stdin=subprocess.DEVNULL, check=True)
+            _normalize(part)
+            # drop entries of older versions of the same source
+            for old in glob.glob(os.path.join(self.dir, os.path.basename(path).split("_")[0] + "_*.f32")):
+                # a concurrent job may have installed this one already; it is replaced atomically below
+                if old != path:
+                    try:
+                        os.remove(old)
+                    except FileNotFoundError:
+                        pass
+            os.replace(part, path)
+        finally:
+            if os.path.exists(part):
+                os.remove(part)
+        return path
+
+    def prepare(self, config):
+        """Decode every usable sound of the sounds/ and memes_sounds/ folders; returns the count."""
+        index = assets.get_index(config)
+        files = index.files("sounds") + index.files("memes_sounds")
+        for f in files:
+            self.ensure(f)
+        return len(files)
+
+    def entries(self):
+        return sorted(glob.glob(os.path.join(self.dir, "*.f32")))
+
+    def total_bytes(self):
+        return sum(os.path.getsize(p) for p in self.entries())
+
+    def clear(self):
+        entries = self.entries()
+        freed = self.total_bytes()
+        for p in entries:
+            os.remove(p)
+        return len(entries), freed
+
+def get_bank(config):
+    return SoundBank(config.get("cache_dir", ".ytp_cache"), config.get("ffmpeg_path", "ffmpeg"))
@@ -0,0 +1,239 @@
+"""
+Content-addressed cache of stage outputs.
+
+Every stage output is stored under a key hashing everything that produced it: the
+key of the stage before it (for the first stage, the content hash of the source),
+the stage's resolved effect configs or filter fragments (random choices included),
+the content of the asset files they reference, and the ffmpeg version. Rerunning a
+plan with a change late in the chain reuses the outputs of the unchanged stages.
+
+Files live in cache_dir/stages, the index in cache_dir/stages.sqlite. Once the total
+size exceeds config["stage_cache_mb"] the least recently used entries are evicted.
+"""
+import hashlib
+import json
+import os
+import shutil
+import sqlite3
+import subprocess
+import threading
+import time
+import uuid
+
+STAGE_DB = "stages.sqlite"
+STAGE_DIR = "stages"
+# bump when the builders change what they render for the same parameters
+KEY_VERSION = 1
+
+def file_digest(path, chunk_size=1 << 20):
+    h = hashlib.sha256()
+    with open(path, "rb") as f:
+        for block in iter(lambda: f.read(chunk_size), b""):
+            h.update(block)
+    return h.hexdigest()
+
+_versions = {}
+
+def ffmpeg_version(ffmpeg_path):
+    """First line of `ffmpeg -version` (memoised), or "" if it cannot be run."""
+    if ffmpeg_path not in _versions:
+        try:
+            out = subprocess.run([ffmpeg_path, "-version"], stdout=subprocess.PIPE, stderr=subprocess.DEVNULL, text=True).stdout
+        except OSError:
+            out = ""
+        _versions[ffmpeg_path] = out.splitlines()[0] if out else ""
+    return _versions[ffmpeg_path]
+
+def _referenced_files(value):
+    """Absolute paths of existing files anywhere inside a config/fragment structure."""
+    if isinstance(value, dict):
+        return [p for v in value.values() for p in _referenced_files(v)]
+    if isinstance(value, (list, tuple)):
+        return [p for v in value for p in _referenced_files(v)]
+    if isinstance(value, str) and os.path.isabs(value) and os.path.isfile(value):
+        return [value]
+    return []
+
+def _link_or_copy(src, dst):
+    try:
+        os.link(src, dst)
+    except OSError:
+        shutil.copyfile(src, dst)
+
+class StageCache:
+    """SQLite index of cached stage files. Safe to share between threads and processes."""
+
+    def __init__(self, cache_dir, max_bytes=None):
+        self.dir = os.path.join(os.path.abspath(cache_dir), STAGE_DIR)
+        os.makedirs(self.dir, exist_ok=True)
+        self.max_bytes = max_bytes
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(os.path.join(os.path.abspath(cache_dir), STAGE_DB), timeout=30, check_same_thread=False)
+        with self._conn:
+            self._conn.execute(
+                "CREATE TABLE IF NOT EXISTS stages ("
+                "key TEXT PRIMARY KEY, file TEXT, size INTEGER, label TEXT, created REAL, last_used REAL)"
+            )
+            self._conn.execute(
+                "CREATE TABLE IF NOT EXISTS digests ("
+                "path TEXT PRIMARY KEY, size INTEGER, mtime_ns INTEGER, digest TEXT)"
+            )
+
+    def digest(self, path):
+        """Content hash of path, cached by (path, size, mtime)."""
+        path = os.path.abspath(path)
+        st = os.stat(path)
+        with self._lock:
+            row = self._conn.execute("SELECT size, mtime_ns, digest FROM digests WHERE path = ?", (path,)).fetchone()
+        if row and row[0] == st.st_size and row[1] == st.st_mtime_ns:
+            return row[2]
+        digest = file_digest(path)
+        with self._lock, self._conn:
+            self._conn.execute("INSERT OR REPLACE INTO digests VALUES (?, ?, ?, ?)", (path, st.st_size, st.st_mtime_ns, digest))
+        return digest
+
+    def key(self, prev_key, unit, ffmpeg_path):
+        """Key of a stage that applies unit (see processor.fuse_chain) to the output of prev_key."""
+        desc = {
+            "version": KEY_VERSION,
+            "prev": prev_key,
+            "unit": unit,
+            "files": {p: self.digest(p) for p in sorted(set(_referenced_files(unit)))},
+            "ffmpeg": ffmpeg_version(ffmpeg_path),
+        }
+        return hashlib.sha256(json.dumps(desc, sort_keys=True, default=str).encode("utf-8")).hexdigest()
+
+    def get(self, key):
+        """Return the cached file for key (marking it used) or None."""
+        with self._lock:
+            row = self._conn.execute("SELECT file FROM stages WHERE key = ?", (key,)).fetchone()
+        if not row:
+            return None
+        path = os.path.join(self.dir, row[0])
+        with self._lock, self._conn:
+            if not os.path.isfile(path):
+                self._conn.execute("DELETE FROM stages WHERE key = ?", (key,))
+                return None
+            self._conn.execute("UPDATE stages SET last_used = ? WHERE key = ?", (time.time(), key))
+        return path
+
+    def fetch(self, key, output_path, link=True):
+        """Link (or copy) the cached file for key to output_path. Returns False on a miss."""
+        path = self.get(key)
+        if not path:
+            return False
+        if link:
+            _link_or_copy(path, output_path)
+        else:
+            shutil.copyfile(path, output_path)
+        return True
+
+    def put(self, key, path, label="", link=True):
+        """
+        Store a copy of the stage output path under key, then evict down to the size limit.
+        link=False copies even where a hard link would do (for files that are renamed
+        into place as final outputs and must not share their data with the cache).
+        """
+        name = key + os.path.splitext(path)[1]
+        tmp = os.path.join(self.dir, f".{name}.{os.getpid()}.{uuid.uuid4().hex[:8]}.part")
+        if link:
+            _link_or_copy(path, tmp)
+        else:
+            shutil.copyfile(path, tmp)
+        os.replace(tmp, os.path.join(self.dir, name))
+        now = time.time()
+        with self._lock, self._conn:
+            self._conn.execute("INSERT OR REPLACE INTO stages VALUES (?, ?, ?, ?, ?, ?)",
+                               (key, name, os.path.getsize(path), label, now, now))
+        if self.max_bytes is not None:
+            self.evict(self.max_bytes)
+
+    def entries(self):
+        """All entries as dicts, most recently used first."""
+        with self._lock:
+            rows = self._conn.execute("SELECT key, file, size, label, created, last_used FROM stages ORDER BY last_used DESC").fetchall()
+        return [dict(zip(("key", "file", "size", "label", "created", "last_used"), r)) for r in rows]
+
+    def total_bytes(self):
+        with self._lock:
+            return self._conn.execute("SELECT COALESCE(SUM(size), 0) FROM stages").fetchone()[0]
+
+    def evict(self, max_bytes):
+        """Remove least recently used entries until the total is <= max_bytes. Returns (count, bytes) removed."""
+        total = self.total_bytes()
+        removed = freed = 0
+        for entry in reversed(self.entries()):
+            if total <= max_bytes:
+                break
+            self._remove(entry)
+            total -= entry["size"]
+            removed += 1
+            freed += entry["size"]
+        return removed, freed
+
+    def prune(self, max_bytes=None):
+        """
+        Drop entries whose file is gone and files without an entry, then evict down
+        to max_bytes (default: the configured limit). Returns (count, bytes) removed.
+        """
+        known = set()
+        removed = freed = 0
+        for entry in self.entries():
+            if os.path.isfile(os.path.join(self.dir, entry["file"])):
+                known.add(entry["file"])
+            else:
+                self._remove(entry)
+                removed += 1
+        for name in os.listdir(self.dir):
+            path = os.path.join(self.dir, name)
+            if name in known or not os.path.isfile(path):
+                continue
+            if name.endswith(".part") and time.time() - os.path.getmtime(path) < 3600:
+                # probably still being written by another job
+                continue
+            freed += os.path.getsize(path)
+            os.remove(path)
+            removed += 1
+        limit = self.max_bytes if max_bytes is None else max_bytes
+        if limit is not None:
+            count, size = self.evict(limit)
+            removed += count
+            freed += size
+        return removed, freed
+
+    def clear(self):
+        return self.prune(0)
+
+    def _remove(self, entry):
+        with self._lock, self._conn:
+            self._conn.execute("DELETE FROM stages WHERE key = ?", (entry["key"],))
+        try:
+            os.remove(os.path.join(self.dir, entry["file"]))
+        except FileNotFoundError:
+            pass
+
+_caches = {}
+_caches_lock = threading.Lock()
+
+def get_cache(config):
+    """Return the shared StageCache for config["cache_dir"] with the config["stage_cache_mb"] limit."""
+    cache_dir = os.path.abspath(config.get("cache_dir", ".ytp_cache"))
+    limit = config.get("stage_cache_mb", 2048)
+    with _caches_lock:
+        if cache_dir not in _caches:
+            _caches[cache_dir] = StageCache(cache_dir)
+        cache = _caches[cache_dir]
+    cache.max_bytes = int(limit * 1024 * 1024) if limit is not None else None
+    return cache
+
+def format_entries(cache, limit=20):
+    entries = cache.entries()
+    total = sum(e["size"] for e in entries)
+    cap = f"{cache.max_bytes / 1048576:.0f} MB" if cache.max_bytes is not None else "unlimited"
+    lines = [f"{len(entries)} cached stages, {total / 1048576:.1f} MB of {cap} in {cache.dir}"]
+    for e in entries[:limit]:
+        used = time.strftime("%Y-%m-%d %H:%M", time.localtime(e["last_used"]))
+        lines.append(f"  {e['key'][:12]}  {e['size'] / 1048576:8.1f} MB  last used {used}  {e['label']}")
+    if len(entries) > limit:
+        lines.append(f"  ... {len(entries) - limit} more")
+    return "\n".join(lines)
@@ -0,0 +1,114 @@
+"""
+Temp space for the intermediates of one job.
+
+Intermediates go to a job directory on a RAM-backed filesystem (config
+"ram_temp_dir", "auto": /dev/shm where it exists) while the job's files there stay
+within "ram_temp_mb" (default 1024). Past that budget new files spill to a job
+directory under "temp_dir" (default: the system temp dir). The budget is checked
+against an estimate of each file's size; a stage whose output in RAM fails (the
+RAM filesystem ran full) is rendered again on disk (see spill). Files are released as
+soon as the next stage has read them, and the final stage is written next to the
+output and renamed into place (see final_path), so the output is never copied.
+"""
+import glob
+import os
+import shutil
+import tempfile
+import uuid
+
+from . import probe
+
+def ram_dir(config):
+    """RAM-backed base directory from config["ram_temp_dir"], or None."""
+    path = config.get("ram_temp_dir", "auto")
+    if path == "auto":
+        path = "/dev/shm"
+    if path and os.path.isdir(path) and os.access(path, os.W_OK):
+        return path
+    return None
+
+def _size(path):
+    total = 0
+    for root, _, files in os.walk(path):
+        for name in files:
+            try:
+                total += os.path.getsize(os.path.join(root, name))
+            except OSError:
+                # removed meanwhile
+                continue
+    return total
+
+class TempSpace:
+    def __init__(self, config, prefix="ytp_tmp_"):
+        self.prefix = prefix
+        self.budget = int(config.get("ram_temp_mb", 1024) * 1024 * 1024)
+        base = ram_dir(config)
+        self.ram = tempfile.mkdtemp(prefix=prefix, dir=base) if base and self.budget > 0 else None
+        self.disk_base = config.get("temp_dir") or None
+        self.disk = None
+        # set once a file did not fit in RAM: later files go to disk
+        self.full = False
+        for d in self.dirs():
+            probe.add_scratch_dir(d)
+
+    def dirs(self):
+        return [d for d in (self.ram, self.disk) if d]
+
+    def _disk(self):
+        if self.disk is None:
+            self.disk = tempfile.mkdtemp(prefix=self.prefix, dir=self.disk_base)
+            probe.add_scratch_dir(self.disk)
+        return self.disk
+
+    def path(self, name, estimate=0):
+        """Path for a new intermediate of about estimate bytes: in RAM if it fits the budget, else on disk."""
+        if self.ram and not self.full and _size(self.ram) + estimate <= self.budget:
+            return os.path.join(self.ram, name)
+        return os.path.join(self._disk(), name)
+
+    def spill(self, path):
+        """
+        Disk path for an intermediate in RAM whose stage failed, or None when path is not
+        in RAM. Its partial file and sidecars are removed and later files go to disk.
+        """
+        if not self.ram or os.path.dirname(os.path.abspath(path)) != self.ram:
+            return None
+        if os.path.exists(path):
+            os.remove(path)
+        self.discard_sidecars(path)
+        self.full = True
+        return os.path.join(self._disk(), os.path.basename(path))
+
+    @staticmethod
+    def final_path(output_path):
+        """Where to render the last stage: a hidden file next to output_path (same filesystem), unique per call."""
+        head, tail = os.path.split(os.path.abspath(output_path))
+        stem, ext = os.path.splitext(tail)
+        # jobs of one process (service, threads) may render the same output name
+        return os.path.join(head, f".{stem}.{os.getpid()}.{uuid.uuid4().hex[:8]}.part{ext or '.mp4'}")
+
+    def discard_sidecars(self, path):
+        """Remove what builders left next to a finished stage (e.g. <stage>_cuts/, <stage>_meme.mp4)."""
+        for side in glob.glob(glob.escape(os.path.splitext(path)[0]) + "_*"):
+            if os.path.isdir(side):
+                shutil.rmtree(side, ignore_errors=True)
+            elif os.path.exists(side):
+                os.remove(side)
+
+    def release(self, path):
+        """Delete an intermediate once nothing reads it any more (files outside the job dirs are left alone)."""
+        if any(os.path.dirname(os.path.abspath(path)) == d for d in self.dirs()) and os.path.exists(path):
+            os.remove(path)
+            self.discard_sidecars(path)
+
+    def cleanup(self):
+        for d in self.dirs():
+            shutil.rmtree(d, ignore_errors=True)
+            probe.remove_scratch_dir(d)
+
+def place(src, dst):
+    """Move src to dst: a rename on the same filesystem, copy and delete across filesystems."""
+    try:
+        os.replace(src, dst)
+    except OSError:
+        shutil.move(src, dst)
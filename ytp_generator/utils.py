@@ -3,6 +3,7 @@ Utility helpers
 """
 import random
 import os
+import sys
 import math
 import shutil
 
@@ -37,4 +38,18 @@ def chain_atempo_factors(target):
     factors.append(t)
     # Clean tiny rounding issues
     factors = [round(f, 5) for f in factors if f > 0]
-    return factors
\ No newline at end of file
+    return factors
+
+def tool_cmd(module, args):
+    """
+    Command line that runs one of the package's python tools (a module with a
+    main()) as a child process, e.g. tool_cmd("frame_shuffle", [...]).
+    Run it with env=tool_env() so the package is importable from any cwd.
+    """
+    return [sys.executable, "-m", f"ytp_generator.{module}"] + [str(a) for a in args]
+
+def tool_env():
+    env = dict(os.environ)
+    root = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+    env["PYTHONPATH"] = root + (os.pathsep + env["PYTHONPATH"] if env.get("PYTHONPATH") else "")
+    return env
@@ -0,0 +1,159 @@
+"""
+Multi-variant rendering: many random versions of one source that share work.
+
+All K plans are rolled up front (seeds seed, seed+1, ...) and their stage lists
+(see processor.build_units) are merged into a prefix tree. Variants whose first n
+stages are identical share those n stages: every node of the tree is rendered
+once, from its parent's output, and the branches below a node render concurrently
+(bounded by `jobs`). A stage file is deleted as soon as all of its children are
+done (stage files live in a tempspace.TempSpace). Writes the K outputs and a manifest with each variant's seed and plan.
+"""
+import asyncio
+import json
+import os
+import random
+import shutil
+
+from . import assets, batch, config as cfg, processor, tempspace
+
+MANIFEST_VERSION = 1
+
+class Node:
+    def __init__(self, unit=None, parent=None):
+        self.unit = unit
+        self.parent = parent
+        self.children = {}
+        # indices of the variants whose chain ends here
+        self.variants = []
+        self.path = None
+
+    def walk(self):
+        yield self
+        for child in self.children.values():
+            yield from child.walk()
+
+def _unit_key(unit):
+    return json.dumps(unit, sort_keys=True, default=str)
+
+def build_tree(unit_lists):
+    """Prefix tree of the unit lists; the root (unit None) stands for the source."""
+    root = Node()
+    for i, units in enumerate(unit_lists):
+        node = root
+        for unit in units:
+            key = _unit_key(unit)
+            if key not in node.children:
+                node.children[key] = Node(unit, node)
+            node = node.children[key]
+        node.variants.append(i)
+    return root
+
+def output_paths(output_path, count):
+    """out.mp4 -> out_01.mp4, out_02.mp4, ..."""
+    stem, ext = os.path.splitext(output_path)
+    width = max(2, len(str(count)))
+    return [f"{stem}_{i + 1:0{width}d}{ext or '.mp4'}" for i in range(count)]
+
+def manifest_path_for(output_path):
+    return os.path.splitext(output_path)[0] + ".variants.json"
+
+def plan_variants(input_path, config, count, seed=None, progress_callback=None):
+    """Roll count plans (see processor.plan_chain) with consecutive seeds from seed."""
+    chain = config.get("effect_chain", cfg.default_config()["effect_chain"])
+    seed = seed if seed is not None else config.get("seed")
+    if seed is None:
+        seed = random.getrandbits(32)
+    return [processor.plan_chain(chain, config, input_path, (seed + i) & 0xFFFFFFFF, progress_callback)
+            for i in range(count)]
+
+async def render_variants_async(input_path, output_path, config, count, seed=None, mode=None, jobs=None,
+                                dry_run=False, progress_callback=None):
+    """
+    Render count variants of input_path to output_paths(output_path, count) and write
+    the manifest (manifest_path_for(output_path)). jobs: stages rendered at the same
+    time (default: derived from the CPU count, see batch.plan_workers); each ffmpeg
+    call gets the matching thread budget unless config["threads"] is set.
+    progress_callback: optional callable(done_stages, total_stages, message).
+    Returns the manifest dict.
+    """
+    ffmpeg_path = processor.ensure_ffmpeg(config.get("ffmpeg_path", "ffmpeg"))
+    mode = mode or config.get("execution_mode", "stages")
+    if mode not in processor.EXECUTION_MODES:
+        raise ValueError(f"Unknown execution mode {mode!r}; expected one of {', '.join(processor.EXECUTION_MODES)}")
+    jobs, threads = batch.plan_workers(jobs, config.get("threads"))
+    config = dict(config, threads=threads)
+    outputs = output_paths(output_path, count)
+    assets.ensure_asset_dirs(config.get("assets_dir", "assets"))
+    plans = await processor._in_thread(plan_variants, input_path, config, count, seed, progress_callback)
+    unit_lists = [await processor._in_thread(processor.build_units, p["effects"], config, mode, input_path) for p in plans]
+    root = build_tree(unit_lists)
+    nodes = list(root.walk())[1:]
+    total = len(nodes)
+    done = 0
+    if progress_callback:
+        progress_callback(0, total, f"{count} variants: {sum(len(u) for u in unit_lists)} stages, {total} after sharing prefixes")
+    if os.path.dirname(output_path) and not dry_run:
+        os.makedirs(os.path.dirname(output_path), exist_ok=True)
+    space = tempspace.TempSpace(config, prefix="ytp_var_")
+    limit = asyncio.Semaphore(jobs)
+    root.path = input_path
+
+    async def finish(node):
+        for n, i in enumerate(node.variants, 1):
+            if dry_run:
+                if progress_callback:
+                    progress_callback(done, total, f"DRY RUN: variant {i + 1} would be saved to {outputs[i]}")
+                continue
+            # a leaf's file is moved into its last output; the source and shared stages are copied
+            last = n == len(node.variants) and not node.children and node.parent is not None
+            await processor._in_thread(tempspace.place if last else shutil.copyfile, node.path, outputs[i])
+            if progress_callback:
+                progress_callback(done, total, f"Saved variant {i + 1}: {outputs[i]}")
+
+    async def render(node, index):
+        nonlocal done
+        parent = node.parent.path
+        node.path = space.path(f"node_{index:04d}.mp4", os.path.getsize(parent) if os.path.isfile(parent) else 0)
+        async with limit:
+            node.path = await processor._render_spilling(space, node.unit, parent, node.path, ffmpeg_path, config,
+                                                         done + 1, total, dry_run, progress_callback)
+        done += 1
+        if not dry_run:
+            space.discard_sidecars(node.path)
+        await finish(node)
+        await descend(node)
+        if not dry_run:
+            space.release(node.path)
+
+    async def descend(node):
+        # asyncio.gather cancels nothing on failure; wait for the siblings, then re-raise
+        results = await asyncio.gather(*(render(child, numbers[child]) for child in node.children.values()),
+                                       return_exceptions=True)
+        for r in results:
+            if isinstance(r, BaseException):
+                raise r
+
+    numbers = {node: i for i, node in enumerate(nodes, 1)}
+    try:
+        await finish(root)
+        await descend(root)
+    finally:
+        space.cleanup()
+    manifest = {
+        "version": MANIFEST_VERSION,
+        "source": os.path.abspath(input_path),
+        "mode": mode,
+        "stages": sum(len(u) for u in unit_lists),
+        "rendered_stages": total,
+        "variants": [{"output": os.path.abspath(out), "seed": plan["seed"], "plan": plan} for out, plan in zip(outputs, plans)],
+    }
+    if not dry_run:
+        with open(manifest_path_for(output_path), "w", encoding="utf-8") as f:
+            json.dump(manifest, f, indent=2)
+    return manifest
+
+def render_variants(input_path, output_path, config, count, seed=None, mode=None, jobs=None, dry_run=False,
+                    progress_callback=None):
+    """Blocking wrapper around render_variants_async (which documents the arguments)."""
+    return asyncio.run(render_variants_async(input_path, output_path, config, count, seed, mode, jobs, dry_run,
+                                             progress_callback))